@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Create the answer-photo renditions for quests that predate them
+
+Walks every quest folder and renders the upright model, thumbnail and
+display copies (plus the folder's .renditions/manifest.json) for each
+answer photo that has none yet, or whose photo changed since. Re-running
+only renders what is missing, so it can be interrupted and resumed.
+
+Usage: python backfill_renditions.py [quests_dir] [workers]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from answer_index import is_image_file
+from renditions import RenditionStore
+
+
+def main():
+    quests_dir = sys.argv[1] if len(sys.argv) > 1 else 'quests'
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 4
+
+    if not os.path.isdir(quests_dir):
+        print(f"❌ Quests directory not found: {quests_dir}")
+        return 1
+
+    store = RenditionStore()
+    start = time.perf_counter()
+    photos = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for folder in sorted(os.listdir(quests_dir)):
+            folder_path = os.path.join(quests_dir, folder)
+            if not os.path.isdir(folder_path):
+                continue
+            image_paths = [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path)) if is_image_file(f)]
+            if not image_paths:
+                continue
+            entries = store.ensure_many(image_paths, pool.map)
+            photos += len(image_paths)
+            failed += sum(1 for entry in entries.values() if entry is None)
+            print(f"🖼️  {folder}: {len(image_paths)} photo(s)")
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Renditions ready for {photos - failed} of {photos} photos in {elapsed:.1f}s")
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
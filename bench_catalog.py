@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark /api/quests with and without the catalog cache
+
+Generates 1,000 quest folders (each quest JSON carrying a legacy
+leaderboard and ratings array, like older quests do) in a temp directory
+and measures requests per second through the Flask test client for:
+
+- rebuild: every request re-parses every quest file and re-serializes the
+  catalog, which is what the endpoint did before the cache
+- cached: the serialized catalog is served from memory
+- 304: the client sends the ETag back in If-None-Match
+
+Usage: python bench_catalog.py [quests] [seconds]
+Set STORAGE_BACKEND=sqlite to benchmark the SQLite backend instead.
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+
+def generate_quests(quests_dir, quest_count, seed=0):
+    """Write quest_count quest folders with embedded legacy leaderboards"""
+    rng = random.Random(seed)
+    for i in range(quest_count):
+        folder = os.path.join(quests_dir, f"Quest_{i:05d}")
+        os.makedirs(folder)
+        quest = {
+            'id': 1_700_000_000_000 + i,
+            'name': f"Quest {i}",
+            'description': 'Synthetic benchmark quest',
+            'difficulty': rng.choice(['Easy', 'Medium', 'Hard']),
+            'ageGroup': 'All Ages',
+            'distance': 'Walk',
+            'rating': round(rng.uniform(1, 5), 1),
+            'enabled': True,
+            'checkpoints': [
+                {'id': c + 1, 'name': f"Waypoint {c + 1}", 'clue': 'Look around', 'lat': 45.0, 'lng': -122.0,
+                 'funFact': '', 'answerImage': [f"quest{i}_waypoint{c + 1}.jpg"]}
+                for c in range(rng.randint(3, 8))
+            ],
+            'leaderboard': {
+                'entries': [
+                    {'team_name': f"team-{n}", 'waypoints_completed': rng.randint(0, 5),
+                     'completion_time': rng.randint(60_000, 7_200_000), 'quest_date': '2025-01-01',
+                     'timestamp': '2025-01-01T12:00:00'}
+                    for n in range(rng.randint(0, 100))
+                ],
+                'stats': {},
+                'ratings': [{'rating': rng.randint(1, 5), 'timestamp': '2025-01-01T12:00:00'}
+                            for _ in range(rng.randint(0, 40))],
+            },
+        }
+        with open(os.path.join(folder, f"Quest_{i:05d}.json"), 'w', encoding='utf-8') as f:
+            json.dump(quest, f, indent=2)
+
+
+def requests_per_second(request_fn, seconds):
+    """Run request_fn repeatedly for about `seconds` and return the rate"""
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        request_fn()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    quest_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+
+    workdir = tempfile.mkdtemp(prefix='cityquest-catalog-')
+    cwd = os.getcwd()
+    try:
+        print(f"📦 Generating {quest_count:,} quests...")
+        generate_quests(os.path.join(workdir, 'quests'), quest_count)
+        # QUESTS_DIR is relative to the working directory
+        os.chdir(workdir)
+        import clip_server
+
+        if clip_server.storage.name == 'sqlite':
+            from storage import migrate_folders_to_sqlite
+            migrate_folders_to_sqlite('quests', clip_server.SQLITE_PATH)
+        clip_server.storage.prepare()
+        client = clip_server.app.test_client()
+        first = client.get('/api/quests')
+        assert first.status_code == 200 and len(first.get_json()) == quest_count
+        etag = first.headers['ETag']
+        print(f"   catalog is {len(first.data) / 1024:.0f} KB, ETag {etag}")
+
+        def rebuild():
+            clip_server.quest_catalog.invalidate()
+            if hasattr(clip_server.storage, 'registry'):
+                clip_server.storage.registry.build()
+            assert client.get('/api/quests').status_code == 200
+
+        def cached():
+            assert client.get('/api/quests').status_code == 200
+
+        def not_modified():
+            assert client.get('/api/quests', headers={'If-None-Match': etag}).status_code == 304
+
+        results = {}
+        for name, fn in (('rebuild', rebuild), ('cached', cached), ('304', not_modified)):
+            results[name] = requests_per_second(fn, seconds)
+            print(f"⏱️  {name:<8} {results[name]:>10,.1f} req/s")
+
+        print(f"\n🚀 cached is {results['cached'] / results['rebuild']:.0f}x and 304 is "
+              f"{results['304'] / results['rebuild']:.0f}x the rebuild-every-request rate")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
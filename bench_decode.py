@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark full vs. reduced-resolution (JPEG draft) decoding of answer photos
+
+Decodes every JPEG under quests/ both ways and reports per-image decode time
+and the peak resident memory each mode adds. Each mode runs in its own
+subprocess so their peak RSS measurements don't contaminate each other.
+
+Usage: python bench_decode.py [quests_dir] [repeats]
+"""
+
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+
+def find_jpegs(quests_dir):
+    """Return every JPEG answer photo under the quests directory"""
+    paths = []
+    for pattern in ('*.jpg', '*.jpeg', '*.JPG', '*.JPEG'):
+        paths.extend(glob.glob(os.path.join(quests_dir, '*', pattern)))
+    return sorted(set(paths))
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (Linux reports KB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode, quests_dir, repeats):
+    """Decode every photo in one mode and print a JSON result line"""
+    from image_decode import CLIP_INPUT_SIZE, decode_image
+
+    min_side = CLIP_INPUT_SIZE if mode == 'draft' else 0
+    photos = []
+    for path in find_jpegs(quests_dir):
+        with open(path, 'rb') as f:
+            photos.append((os.path.basename(path), f.read()))
+
+    baseline_rss = peak_rss_mb()
+    timings = {}
+    sizes = {}
+    for name, data in photos:
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            image = decode_image(data, min_side=min_side)
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best * 1000
+        sizes[name] = image.size
+
+    print(json.dumps({
+        'mode': mode,
+        'timings_ms': timings,
+        'sizes': sizes,
+        'peak_rss_delta_mb': peak_rss_mb() - baseline_rss,
+    }))
+
+
+def main():
+    quests_dir = sys.argv[1] if len(sys.argv) > 1 else 'quests'
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    photos = find_jpegs(quests_dir)
+    if not photos:
+        print(f"❌ No JPEG photos found under {quests_dir}")
+        sys.exit(1)
+
+    print(f"📸 Benchmarking decode of {len(photos)} photos from {quests_dir} (best of {repeats})")
+
+    results = {}
+    for mode in ('full', 'draft'):
+        output = subprocess.check_output([sys.executable, __file__, '--mode', mode, quests_dir, str(repeats)])
+        results[mode] = json.loads(output.decode().strip().splitlines()[-1])
+
+    full, draft = results['full'], results['draft']
+    print(f"\n{'photo':<60} {'full ms':>9} {'draft ms':>9} {'speedup':>8}  decoded size")
+    for name in sorted(full['timings_ms']):
+        full_ms = full['timings_ms'][name]
+        draft_ms = draft['timings_ms'][name]
+        full_size = 'x'.join(map(str, full['sizes'][name]))
+        draft_size = 'x'.join(map(str, draft['sizes'][name]))
+        print(f"{name[:60]:<60} {full_ms:>9.1f} {draft_ms:>9.1f} {full_ms / draft_ms:>7.1f}x  {full_size} -> {draft_size}")
+
+    total_full = sum(full['timings_ms'].values())
+    total_draft = sum(draft['timings_ms'].values())
+    print(f"\n⏱️  Mean decode time: {total_full / len(photos):.1f} ms -> {total_draft / len(photos):.1f} ms "
+          f"({total_full / total_draft:.1f}x faster, {(total_full - total_draft) / len(photos):.1f} ms saved per request)")
+    print(f"🧠 Peak RSS added by decoding: {full['peak_rss_delta_mb']:.1f} MB -> {draft['peak_rss_delta_mb']:.1f} MB "
+          f"({full['peak_rss_delta_mb'] - draft['peak_rss_delta_mb']:.1f} MB saved)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == '--mode':
+        run_mode(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark the /identify vector index at 1k, 100k and 1M answer embeddings
+
+Fills a VectorIndex with synthetic CLIP-sized embeddings that cluster like
+real answer photos (several noisy shots of each checkpoint, checkpoints of
+one neighbourhood sharing a common direction), then queries it with fresh
+shots of random checkpoints and measures:
+
+- build: vectors added per second, in batches
+- exact: latency of the exact top-10 search (one matrix-vector product)
+- ivf: time to train the IVF lists, their search latency, recall@10
+  against the exact results and how often both agree on the best match
+  (the checkpoint /identify reports first)
+- update: amortized cost of adding and removing a single vector in the
+  full index
+
+Usage: python bench_identify.py [sizes] [dim] [queries]
+e.g.   python bench_identify.py 1000,100000,1000000 512 50
+The 1M run needs about 2.5 GB of memory at dim 512. Set AREA_SIZE to 0
+for embeddings with no shared structure at all, the worst case for IVF;
+there recall@10 drops to 0.5-0.7 at nprobe 16, and IDENTIFY_NPROBE has to
+go up to 64 or so to get it back.
+"""
+
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from vector_index import VectorIndex, normalize_rows  # noqa: E402
+
+SHOTS_PER_CHECKPOINT = 8
+AREA_SIZE = 1000  # answer photos per neighbourhood
+NOISE = 0.03  # per dimension: at dim 512, shots of one checkpoint are ~0.7 cosine apart
+BATCH_SIZE = 50_000
+K = 10
+UPDATES = 100
+
+
+def shots(rng, centers, checkpoints):
+    """Noisy unit embeddings of the given checkpoints"""
+    noise = rng.standard_normal((len(checkpoints), centers.shape[1]), dtype=np.float32) * NOISE
+    return normalize_rows(centers[checkpoints] + noise)
+
+
+def latency_ms(fn, queries):
+    """Median milliseconds of fn(query) over the queries"""
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def bench(size, dim, query_count, seed=0):
+    rng = np.random.default_rng(seed)
+    checkpoint_count = max(1, size // SHOTS_PER_CHECKPOINT)
+    centers = normalize_rows(rng.standard_normal((checkpoint_count, dim), dtype=np.float32))
+    if AREA_SIZE:
+        # Half of a checkpoint's direction is its neighbourhood's
+        areas = normalize_rows(rng.standard_normal((max(1, size // AREA_SIZE), dim), dtype=np.float32))
+        centers = normalize_rows(centers + areas[rng.integers(0, len(areas), checkpoint_count)])
+
+    index = VectorIndex(dim=dim, ivf_min_vectors=0)
+    index.reserve(size + UPDATES)
+    start = time.perf_counter()
+    for offset in range(0, size, BATCH_SIZE):
+        count = min(BATCH_SIZE, size - offset)
+        index.add(range(offset, offset + count), shots(rng, centers, rng.integers(0, checkpoint_count, count)))
+    build_seconds = time.perf_counter() - start
+
+    queries = shots(rng, centers, rng.integers(0, checkpoint_count, query_count))
+    exact_ms = latency_ms(lambda q: index.search(q, K, exact=True), queries)
+    truth = [[key for _, key, _ in index.search(q, K, exact=True)] for q in queries]
+
+    index.ivf_min_vectors = 1
+    start = time.perf_counter()
+    index.train()
+    train_seconds = time.perf_counter() - start
+    ivf_ms = latency_ms(lambda q: index.search(q, K), queries)
+    found = [[key for _, key, _ in index.search(q, K)] for q in queries]
+    recall = statistics.mean(len(set(keys) & set(expected)) / K for keys, expected in zip(found, truth))
+    top1 = statistics.mean(keys[:1] == expected[:1] for keys, expected in zip(found, truth))
+
+    extra = shots(rng, centers, rng.integers(0, checkpoint_count, UPDATES))
+    start = time.perf_counter()
+    for i, vector in enumerate(extra):
+        index.add([size + i], vector)
+    add_us = (time.perf_counter() - start) / len(extra) * 1e6
+    start = time.perf_counter()
+    for i in range(len(extra)):
+        index.remove([i * (size // len(extra))])
+    remove_us = (time.perf_counter() - start) / len(extra) * 1e6
+
+    stats = index.stats()
+    print(f"⏱️  {size:>9,} vectors: build {size / build_seconds:>10,.0f}/s | exact {exact_ms:7.2f} ms | "
+          f"ivf {ivf_ms:6.2f} ms ({stats['ivf_lists']:,} lists, nprobe {index.nprobe}, "
+          f"recall@{K} {recall:.3f}, top-1 {top1:.0%}, trained in {train_seconds:.1f} s) | "
+          f"add {add_us:.0f} µs, remove {remove_us:.0f} µs")
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1].split(',')] if len(sys.argv) > 1 else [1_000, 100_000, 1_000_000]
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+    query_count = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    print(f"📦 {dim}-dimensional embeddings, {SHOTS_PER_CHECKPOINT} shots per checkpoint, "
+          f"median of {query_count} queries")
+    for size in sizes:
+        bench(size, dim, query_count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark the file and SQLite storage backends at scale
+
+Generates a synthetic catalog (10,000 quests and 1,000,000 leaderboard
+entries by default) in a temp directory, migrates it into SQLite, and times
+the operations the endpoints perform against both backends: listing the
+catalog, fetching one quest, reading a full leaderboard, its top 10, a
+later page and one team's rank, adding an entry and rating a quest.
+Leaderboard entries are skewed so a few popular quests hold most of them,
+like real traffic.
+
+Usage: python bench_storage.py [quests] [entries] [repeats]
+"""
+
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import quest_storage
+from leaderboard_store import LOG_FILENAME
+from storage import FileStorage, SQLiteStorage, migrate_folders_to_sqlite
+
+# Single-threaded benchmark: don't wait for writes that will never be coalesced
+quest_storage.coalescer.window = 0
+
+
+def generate_catalog(quests_dir, quest_count, entry_count, seed=0):
+    """Write quest_count quest folders and entry_count leaderboard log lines"""
+    rng = random.Random(seed)
+    # Zipf-like popularity: quest i gets weight 1 / (i + 1)
+    weights = [1.0 / (i + 1) for i in range(quest_count)]
+    per_quest = [0] * quest_count
+    for index in rng.choices(range(quest_count), weights=weights, k=entry_count):
+        per_quest[index] += 1
+
+    for i in range(quest_count):
+        folder = os.path.join(quests_dir, f"Quest_{i:05d}")
+        os.makedirs(folder)
+        quest = {
+            'id': i + 1,
+            'name': f"Quest {i}",
+            'description': 'Synthetic benchmark quest',
+            'difficulty': 'Medium',
+            'ageGroup': 'All Ages',
+            'distance': 'Walk',
+            'rating': 0,
+            'enabled': True,
+            'checkpoints': [
+                {'id': c + 1, 'name': f"Waypoint {c + 1}", 'clue': 'Look around', 'lat': 45.0, 'lng': -122.0,
+                 'answerImage': [f"quest{i}_waypoint{c + 1}.jpg"]}
+                for c in range(5)
+            ],
+            'leaderboard': {'entries': [], 'stats': {}, 'ratings': []},
+        }
+        with open(os.path.join(folder, f"Quest_{i:05d}.json"), 'w', encoding='utf-8') as f:
+            json.dump(quest, f)
+        if per_quest[i]:
+            with open(os.path.join(folder, LOG_FILENAME), 'w', encoding='utf-8') as f:
+                for n in range(per_quest[i]):
+                    f.write(json.dumps({
+                        'team_name': f"team-{i}-{n}",
+                        'waypoints_completed': rng.randint(0, 5),
+                        'completion_time': rng.randint(60_000, 7_200_000),
+                        'quest_date': '2025-01-01',
+                        'timestamp': '2025-01-01T12:00:00',
+                    }) + '\n')
+    return per_quest
+
+
+def time_op(fn, repeats):
+    """Median and max wall time of fn() in milliseconds"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+def bench(storage, hot_id, cold_id, repeats):
+    """Time each endpoint operation against one backend"""
+    entry = {'team_name': 'bench', 'waypoints_completed': 5, 'completion_time': 90_000,
+             'quest_date': '2025-01-02', 'timestamp': '2025-01-02T12:00:00'}
+    return {
+        'list quests': time_op(storage.list_quests, max(1, repeats // 10)),
+        'get quest': time_op(lambda: storage.get_quest(cold_id), repeats),
+        'leaderboard (hot quest)': time_op(lambda: storage.get_leaderboard(hot_id), max(1, repeats // 10)),
+        'top 10 (hot quest)': time_op(lambda: storage.get_leaderboard(hot_id, limit=10), repeats),
+        'page 50 (hot quest)': time_op(lambda: storage.get_leaderboard(hot_id, limit=10, offset=500), repeats),
+        'team rank (hot quest)': time_op(lambda: storage.get_leaderboard_rank(hot_id, 'team-0-500'), repeats),
+        'leaderboard (cold quest)': time_op(lambda: storage.get_leaderboard(cold_id), repeats),
+        'add entry (hot quest)': time_op(lambda: storage.add_leaderboard_entry(hot_id, entry), repeats),
+        'rate quest': time_op(lambda: storage.add_rating(cold_id, 4), repeats),
+    }
+
+
+def main():
+    quest_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    entry_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    workdir = tempfile.mkdtemp(prefix='cityquest-bench-')
+    try:
+        quests_dir = os.path.join(workdir, 'quests')
+        db_path = os.path.join(workdir, 'cityquest.db')
+
+        print(f"📦 Generating {quest_count:,} quests and {entry_count:,} leaderboard entries...")
+        start = time.perf_counter()
+        per_quest = generate_catalog(quests_dir, quest_count, entry_count)
+        print(f"   done in {time.perf_counter() - start:.1f}s (hottest quest has {max(per_quest):,} entries)")
+
+        start = time.perf_counter()
+        migrate_folders_to_sqlite(quests_dir, db_path)
+        print(f"📦 Migrated to SQLite in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(db_path) / 1e6:.0f} MB)")
+
+        hot_id = '1'
+        cold_id = str(quest_count // 2 + 1)
+
+        file_storage = FileStorage(quests_dir)
+        file_storage.prepare()
+        sqlite_storage = SQLiteStorage(db_path)
+        sqlite_storage.prepare()
+
+        results = {}
+        for storage in (file_storage, sqlite_storage):
+            print(f"⏱️  Benchmarking {storage.name} backend...")
+            results[storage.name] = bench(storage, hot_id, cold_id, repeats)
+
+        print(f"\n{'operation':<26}{'file median':>14}{'sqlite median':>16}{'file max':>12}{'sqlite max':>13}")
+        for op in results['file']:
+            file_median, file_max = results['file'][op]
+            sqlite_median, sqlite_max = results['sqlite'][op]
+            print(f"{op:<26}{file_median:>12.2f}ms{sqlite_median:>14.2f}ms{file_max:>10.1f}ms{sqlite_max:>11.1f}ms")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Throughput of the pre-forked server at 1, 2, 4 and 8 workers
+
+For each worker count, starts `python src/clip_server.py` with WORKERS=n
+on a free port (the model is loaded once, in the master), waits until
+every worker is up and then keeps `concurrency` clients busy posting the
+answer photos in quests/ to /compare for a fixed time. Each upload gets a
+few random bytes appended after the JPEG end marker, so the compare cache
+never answers it and every request runs the model.
+
+Reports compares per second, median and p95 latency, and the memory of
+the server processes: RSS summed over the master and its workers, next to
+their PSS (proportional set size), which counts the pages they share
+copy-on-write only once.
+
+Usage: python bench_workers.py [workers] [seconds] [concurrency]
+e.g.   python bench_workers.py 1,2,4,8 20 16
+Needs the model dependencies (torch, transformers) and Linux /proc. The
+results depend on the machine's cores and memory, so run it on the
+instance type the server is deployed to.
+"""
+
+import glob
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STARTUP_TIMEOUT = 600
+MAX_PHOTOS = 20
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def answer_photos():
+    """(filename, bytes) of up to MAX_PHOTOS answer photos from the quest folders"""
+    paths = sorted(glob.glob(os.path.join(ROOT, 'quests', '*', '*.jp*g')))[:MAX_PHOTOS]
+    if not paths:
+        sys.exit("❌ No answer photos found in quests/")
+    photos = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            photos.append((os.path.basename(path), f.read()))
+    return photos
+
+
+def worker_pids(master_pid):
+    """PIDs of the master's child processes"""
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def memory_mb(pids):
+    """(RSS, PSS) in MB summed over the given processes"""
+    rss = pss = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith('Rss:'):
+                    rss += int(line.split()[1])
+                elif line.startswith('Pss:'):
+                    pss += int(line.split()[1])
+    return rss / 1024, pss / 1024
+
+
+def wait_until_ready(base_url, server, workers):
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"❌ Server exited with code {server.returncode} during startup")
+        try:
+            with urllib.request.urlopen(f"{base_url}/ready", timeout=5) as response:
+                status = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            # /ready answers 503 until the model is loaded and warmed up
+            status = json.loads(e.read())
+        except OSError:
+            status = {}
+        if status.get('ready') and len(worker_pids(server.pid)) == workers:
+            return
+        if status.get('state') == 'failed':
+            # The server stays up without its model; nothing to measure
+            sys.exit(f"❌ Model startup failed: {status.get('error')}")
+        time.sleep(0.5)
+    sys.exit("❌ Server did not become ready in time")
+
+
+def compare(base_url, filename, photo):
+    """POST one uncacheable copy of a photo to /compare; returns the latency in seconds"""
+    query = urllib.parse.urlencode({'answerImage': filename})
+    request = urllib.request.Request(f"{base_url}/compare?{query}", data=photo + os.urandom(8),
+                                     headers={'Content-Type': 'image/jpeg'})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=120) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def bench(workers, seconds, concurrency, photos):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, 'WORKERS': str(workers), 'PORT': str(port)}
+    with tempfile.TemporaryFile() as log:
+        server = subprocess.Popen([sys.executable, os.path.join('src', 'clip_server.py')], cwd=ROOT, env=env,
+                                  stdout=log, stderr=subprocess.STDOUT)
+        try:
+            wait_until_ready(base_url, server, workers)
+            # Warm every worker up before measuring
+            with ThreadPoolExecutor(concurrency) as pool:
+                list(pool.map(lambda i: compare(base_url, *photos[i % len(photos)]), range(4 * workers)))
+
+            deadline = time.perf_counter() + seconds
+
+            def client(n):
+                latencies = []
+                while time.perf_counter() < deadline:
+                    latencies.append(compare(base_url, *photos[(n + len(latencies)) % len(photos)]))
+                return latencies
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                latencies = [latency for result in pool.map(client, range(concurrency)) for latency in result]
+            elapsed = time.perf_counter() - start
+            rss, pss = memory_mb([server.pid] + worker_pids(server.pid))
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    latencies.sort()
+    rate = len(latencies) / elapsed
+    print(f"⏱️  {workers} worker(s): {rate:7.1f} compares/s | median {statistics.median(latencies) * 1000:6.0f} ms | "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:6.0f} ms | RSS {rss:7.0f} MB, PSS {pss:7.0f} MB")
+    return rate
+
+
+def main():
+    worker_counts = [int(n) for n in sys.argv[1].split(',')] if len(sys.argv) > 1 else [1, 2, 4, 8]
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+    photos = answer_photos()
+    print(f"📦 {len(photos)} answer photos, {concurrency} concurrent clients, {seconds:.0f} s per run, "
+          f"{os.cpu_count()} CPU core(s); INFERENCE_THREADS={os.environ.get('INFERENCE_THREADS', 'cores / workers')}")
+    rates = {workers: bench(workers, seconds, concurrency, photos) for workers in worker_counts}
+
+    baseline = rates[worker_counts[0]]
+    print("\n🚀 " + ", ".join(f"{workers} worker(s): {rate / baseline:.2f}x" for workers, rate in rates.items()))
+
+
+if __name__ == "__main__":
+    main()
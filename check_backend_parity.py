@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Parity check for the inference backends against PyTorch fp32
+
+Embeds every answer photo under quests/ with the fp32 reference backend and
+with each candidate backend, then reports:
+- cosine drift per image (1 - cos(fp32, candidate))
+- the largest change in any image-to-image similarity score
+- whether each image's nearest neighbour stays the same
+
+Usage: python check_backend_parity.py [backend ...] [--quests quests_dir]
+       (default backends: int8 onnx)
+"""
+
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from image_decode import decode_image
+from inference_backends import create_backend
+
+MODEL_NAME = "openai/clip-vit-base-patch16"
+
+
+def find_photos(quests_dir):
+    """Return every answer photo under the quests directory"""
+    paths = []
+    for pattern in ('*.jpg', '*.jpeg', '*.JPG', '*.JPEG', '*.png'):
+        paths.extend(glob.glob(os.path.join(quests_dir, '*', pattern)))
+    return sorted(set(paths))
+
+
+def embed_all(backend, images, batch_size=8):
+    """Embed PIL images with a backend, returning (matrix, seconds)"""
+    pixel_values = np.concatenate([backend.preprocess(image) for image in images])
+    start = time.perf_counter()
+    rows = [backend.embed_batch(pixel_values[i:i + batch_size]) for i in range(0, len(pixel_values), batch_size)]
+    return np.concatenate(rows), time.perf_counter() - start
+
+
+def nearest_neighbours(embeddings):
+    """Index of each row's most similar other row"""
+    similarities = embeddings @ embeddings.T
+    np.fill_diagonal(similarities, -np.inf)
+    return similarities.argmax(axis=1)
+
+
+def main():
+    args = sys.argv[1:]
+    quests_dir = 'quests'
+    if '--quests' in args:
+        i = args.index('--quests')
+        quests_dir = args[i + 1]
+        del args[i:i + 2]
+    candidates = args or ['int8', 'onnx']
+
+    photos = find_photos(quests_dir)
+    if len(photos) < 2:
+        print(f"❌ Need at least two photos under {quests_dir}")
+        sys.exit(1)
+    images = [decode_image(open(path, 'rb').read()) for path in photos]
+    print(f"📸 Checking {len(photos)} photos from {quests_dir}")
+
+    reference_backend = create_backend('torch', MODEL_NAME)
+    reference, reference_seconds = embed_all(reference_backend, images)
+    reference_pairs = reference @ reference.T
+    reference_nn = nearest_neighbours(reference)
+    print(f"✅ torch-fp32 reference: {reference_seconds / len(images) * 1000:.1f} ms/image")
+
+    ok = True
+    for kind in candidates:
+        try:
+            backend = create_backend(kind, MODEL_NAME)
+        except Exception as e:
+            print(f"⚠️ Skipping {kind}: {e}")
+            continue
+
+        embeddings, seconds = embed_all(backend, images)
+        drift = 1.0 - np.sum(reference * embeddings, axis=1)
+        pair_delta = np.abs(embeddings @ embeddings.T - reference_pairs).max()
+        nn_agreement = float(np.mean(nearest_neighbours(embeddings) == reference_nn))
+
+        print(f"\n🔬 {backend.name}: {seconds / len(images) * 1000:.1f} ms/image "
+              f"({reference_seconds / seconds:.2f}x vs fp32)")
+        print(f"   cosine drift vs fp32: mean {drift.mean():.5f}, max {drift.max():.5f}")
+        print(f"   max change in image-to-image similarity: {pair_delta:.5f}")
+        print(f"   nearest-neighbour agreement: {nn_agreement:.0%}")
+        worst = int(drift.argmax())
+        print(f"   worst image: {os.path.basename(photos[worst])} (drift {drift[worst]:.5f})")
+        if nn_agreement < 1.0:
+            ok = False
+
+    print("\n🎉 Backends agree with fp32 on every nearest neighbour" if ok else "\n⚠️ Some nearest neighbours changed")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
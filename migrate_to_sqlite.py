@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+One-shot migration of the quest folders into the SQLite storage backend
+
+Copies every quest definition (JSON and legacy .js), leaderboard entry
+(from the append-only log, or the quest JSON for quests that never got one)
+and rating into the database. Answer photos stay where they are. Re-running
+replaces the rows of quests that were already migrated.
+
+Usage: python migrate_to_sqlite.py [quests_dir] [db_path]
+Then start the server with STORAGE_BACKEND=sqlite SQLITE_PATH=<db_path>.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from storage import migrate_folders_to_sqlite
+
+
+def main():
+    quests_dir = sys.argv[1] if len(sys.argv) > 1 else 'quests'
+    db_path = sys.argv[2] if len(sys.argv) > 2 else 'cityquest.db'
+
+    if not os.path.isdir(quests_dir):
+        print(f"❌ Quests directory not found: {quests_dir}")
+        return 1
+
+    print(f"📦 Migrating {quests_dir} into {db_path}...")
+    start = time.perf_counter()
+    quests, entries, ratings = migrate_folders_to_sqlite(quests_dir, db_path)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Migrated {quests} quests, {entries} leaderboard entries and {ratings} ratings in {elapsed:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -358,7 +358,7 @@ function MainApp() {
         },
         mode: 'cors',
         signal: controller.signal,
-        body: JSON.stringify({ action: 'get' })
+        body: JSON.stringify({ action: 'get', limit: 10 })
       });
 
       clearTimeout(timeoutId);
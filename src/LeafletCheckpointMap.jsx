@@ -484,7 +484,14 @@ export default function LeafletCheckpointMap({ quest, onQuestComplete, questStar
         },
         body: JSON.stringify({ 
           playerImage: playerImageDataUrl, 
-          answerImage: answerImageFilename 
+          answerImage: answerImageFilename,
+          // Lets the server skip photos taken nowhere near the checkpoint (not in debug mode)
+          ...(location && !debugMode ? {
+            questId: quest.id_string || quest.id,
+            lat: location.lat,
+            lng: location.lng,
+            accuracy: location.accuracy
+          } : {})
         })
       });
       if (!response.ok) {
@@ -701,13 +708,13 @@ export default function LeafletCheckpointMap({ quest, onQuestComplete, questStar
     }
     let watchId = navigator.geolocation.watchPosition(
       (pos) => {
-        const { latitude, longitude, heading } = pos.coords;
+        const { latitude, longitude, heading, accuracy } = pos.coords;
         setLocation((prev) => {
           // Only set checkpoints on first location
           if (!prev) {
             setCheckpoints(quest.checkpoints);
           }
-          return { lat: latitude, lng: longitude };
+          return { lat: latitude, lng: longitude, accuracy };
         });
         // Update heading if available
         if (heading !== null && !isNaN(heading)) {
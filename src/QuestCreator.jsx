@@ -235,41 +235,48 @@ const QuestDesigner = ({ onClose }) => {
           }
         };
 
-       // Prepare photos data
-       const photosData = {};
+       // Send the photo files as multipart parts (photos.<waypoint>.<photo>) so the
+       // server can stream them to disk instead of decoding base64 JSON
+       const formData = new FormData();
+       formData.append('questData', JSON.stringify(questData));
        waypoints.forEach((wp, wpIndex) => {
-         photosData[wpIndex] = {};
          wp.photos.forEach((photo, photoIndex) => {
-           if (photo && photo.dataUrl) {
-             photosData[wpIndex][photoIndex] = {
-               data: photo.dataUrl
-             };
+           if (photo && photo.file) {
+             formData.append(`photos.${wpIndex}.${photoIndex}`, photo.file, photo.file.name);
            }
          });
        });
 
-       const requestData = {
-         questData: questData,
-         zipData: {
-           photos: photosData
-         }
-       };
-
        const response = await fetch(`${SERVER_URL}/api/submit-quest`, {
          method: 'POST',
          headers: {
-           'Content-Type': 'application/json',
            'ngrok-skip-browser-warning': 'true'
          },
-         body: JSON.stringify(requestData)
+         body: formData
        });
 
       if (response.ok) {
         const result = await response.json();
-        setSubmitMessage(`Quest created successfully! Quest ID: ${result.quest_id}`);
-        setTimeout(() => {
-          onClose();
-        }, 3000);
+        // Photos are processed in the background; wait for the quest to be published
+        setSubmitMessage('Processing photos...');
+        let job = result;
+        while (job.status === 'queued' || job.status === 'running') {
+          await new Promise(resolve => setTimeout(resolve, 1000));
+          const statusResponse = await fetch(`${SERVER_URL}${result.statusUrl}`, {
+            headers: { 'ngrok-skip-browser-warning': 'true' }
+          });
+          if (!statusResponse.ok) break;
+          job = await statusResponse.json();
+        }
+        if (job.status === 'ready') {
+          setSubmitMessage(`Quest created successfully! Quest ID: ${job.result.questId}`);
+          setTimeout(() => {
+            onClose();
+          }, 3000);
+        } else {
+          console.error('Quest ingestion failed:', job.error);
+          setSubmitMessage('Error creating quest. Please try again.');
+        }
       } else {
         const errorText = await response.text();
         console.error('Error response:', errorText);
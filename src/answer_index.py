@@ -0,0 +1,166 @@
+"""
+In-memory filename -> path index of answer images.
+
+Built once by scanning the quest folders (and legacy asset folders), then
+kept current by incremental adds and by rescanning only the directories
+whose mtime changed. Lookups are a single dict access.
+"""
+
+import os
+import threading
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def is_image_file(filename):
+    """Check whether a filename looks like an answer image"""
+    return filename.lower().endswith(IMAGE_EXTENSIONS) and not filename.startswith('.')
+
+
+class AnswerImageIndex:
+    """Maps answer image filenames to absolute paths"""
+
+    def __init__(self, quests_dirs, flat_dirs=()):
+        # quests_dirs hold one subfolder per quest; flat_dirs hold images directly
+        self.quests_dirs = [os.path.abspath(d) for d in quests_dirs]
+        self.flat_dirs = [os.path.abspath(d) for d in flat_dirs]
+        self._paths = {}       # filename -> sorted list of absolute paths
+        self._dir_mtimes = {}  # directory -> mtime_ns when last scanned
+        self._dir_files = {}   # directory -> filenames indexed from it
+        self._built = False
+        self._lock = threading.RLock()
+
+    def _mtime(self, directory):
+        try:
+            return os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+
+    def _index_path(self, path):
+        """Record one image path (caller holds the lock)"""
+        directory, filename = os.path.split(path)
+        paths = self._paths.setdefault(filename, [])
+        if path not in paths:
+            paths.append(path)
+            paths.sort()
+        self._dir_files.setdefault(directory, set()).add(filename)
+
+    def _scan_dir(self, directory):
+        """(Re)index the images directly inside a directory (caller holds the lock)"""
+        for filename in self._dir_files.pop(directory, ()):
+            paths = [p for p in self._paths.get(filename, []) if os.path.dirname(p) != directory]
+            if paths:
+                self._paths[filename] = paths
+            else:
+                self._paths.pop(filename, None)
+
+        mtime = self._mtime(directory)
+        if mtime is None:
+            self._dir_mtimes.pop(directory, None)
+            return
+
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and is_image_file(entry.name):
+                        self._index_path(os.path.join(directory, entry.name))
+        except OSError as e:
+            print(f"Error scanning answer image folder {directory}: {e}")
+        self._dir_mtimes[directory] = mtime
+
+    def _quest_folders(self, quests_dir):
+        try:
+            with os.scandir(quests_dir) as entries:
+                return [entry.path for entry in entries if entry.is_dir()]
+        except OSError:
+            return []
+
+    def build(self):
+        """Scan every answer image folder from scratch"""
+        with self._lock:
+            self._paths = {}
+            self._dir_mtimes = {}
+            self._dir_files = {}
+            for quests_dir in self.quests_dirs:
+                self._dir_mtimes[quests_dir] = self._mtime(quests_dir)
+                for folder in self._quest_folders(quests_dir):
+                    self._scan_dir(folder)
+            for folder in self.flat_dirs:
+                self._scan_dir(folder)
+            self._built = True
+
+            print(f"✅ Indexed {sum(len(p) for p in self._paths.values())} answer images")
+            for filename, paths in self.ambiguous().items():
+                print(f"⚠️ Answer image '{filename}' is ambiguous across {len(paths)} folders: {paths}")
+
+    def refresh(self, full=False):
+        """Rescan folders that changed since the last scan.
+
+        By default only the quest roots are checked, which catches newly
+        created quest folders; full=True also checks every indexed folder.
+        """
+        with self._lock:
+            if not self._built:
+                self.build()
+                return
+
+            for quests_dir in self.quests_dirs:
+                mtime = self._mtime(quests_dir)
+                if mtime != self._dir_mtimes.get(quests_dir):
+                    self._dir_mtimes[quests_dir] = mtime
+                    for folder in self._quest_folders(quests_dir):
+                        if folder not in self._dir_mtimes:
+                            self._scan_dir(folder)
+                    for folder in list(self._dir_mtimes):
+                        if os.path.dirname(folder) == quests_dir and self._mtime(folder) is None:
+                            self._scan_dir(folder)
+
+            if full:
+                for folder, mtime in list(self._dir_mtimes.items()):
+                    if folder not in self.quests_dirs and self._mtime(folder) != mtime:
+                        self._scan_dir(folder)
+
+    def add(self, path):
+        """Index a newly written answer image without rescanning its folder"""
+        path = os.path.abspath(path)
+        with self._lock:
+            if not self._built:
+                self.build()
+            self._index_path(path)
+            directory = os.path.dirname(path)
+            self._dir_mtimes[directory] = self._mtime(directory)
+
+    def lookup(self, filename, folder=None):
+        """Return the absolute path of an answer image.
+
+        When the filename exists in several folders, the folder hint picks
+        one; otherwise the ambiguity is reported and the first path wins.
+        """
+        if not filename:
+            raise ValueError("No filename provided")
+
+        with self._lock:
+            self.refresh()
+            paths = self._paths.get(filename)
+            if not paths:
+                # The file may have been added to an existing folder by hand
+                self.refresh(full=True)
+                paths = self._paths.get(filename)
+            if not paths:
+                raise FileNotFoundError(f"Answer image '{filename}' not found in any quest folder")
+            paths = list(paths)
+
+        if len(paths) > 1:
+            if folder:
+                for path in paths:
+                    if os.path.basename(os.path.dirname(path)) == folder:
+                        return path
+            print(f"⚠️ Answer image '{filename}' is ambiguous across {len(paths)} folders {paths}; using {paths[0]}")
+        return paths[0]
+
+    def ambiguous(self):
+        """Return {filename: paths} for filenames present in more than one folder"""
+        with self._lock:
+            if self._built:
+                self.refresh()
+            return {filename: list(paths) for filename, paths in self._paths.items() if len(paths) > 1}
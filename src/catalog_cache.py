@@ -0,0 +1,50 @@
+"""
+In-memory cache of the serialized quest catalog.
+
+/api/quests is polled by the home screen, but the catalog only changes when
+a quest is added, edited or rated. CatalogCache keeps the response body
+together with a strong ETag (a hash of the body) and the storage catalog
+version it was built from, and rebuilds only when that version moves.
+Clients that send the ETag back in If-None-Match get a 304 without a body.
+"""
+
+import hashlib
+import threading
+
+
+class CatalogCache:
+    """Serialized response cached until version_fn() changes"""
+
+    def __init__(self, version_fn, build_fn):
+        self.version_fn = version_fn  # () -> hashable token
+        self.build_fn = build_fn      # () -> response body as bytes
+        self._version = None
+        self._body = None
+        self._etag = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.rebuilds = 0
+
+    def get(self):
+        """Return (body, etag), rebuilding the body if the catalog changed"""
+        version = self.version_fn()
+        with self._lock:
+            if self._body is not None and self._version == version:
+                self.hits += 1
+                return self._body, self._etag
+            # Build under the lock so a burst of requests after a change rebuilds once
+            body = self.build_fn()
+            self._body = body
+            self._etag = hashlib.sha256(body).hexdigest()[:32]
+            self._version = version
+            self.rebuilds += 1
+            return body, self._etag
+
+    def invalidate(self):
+        """Force the next get() to rebuild"""
+        with self._lock:
+            self._body = None
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'rebuilds': self.rebuilds}
@@ -1,15 +1,39 @@
-from flask import Flask, request, jsonify
-from PIL import Image
-import torch
-from transformers import CLIPProcessor, CLIPModel
-import io
+from flask import Flask, request, jsonify, send_file
 import base64
+import functools
+import io
 import os
+import shutil
 import json
+import math
+import tempfile
 import time
 from pathlib import Path
 from datetime import datetime
 import re
+import numpy as np
+from PIL import Image
+
+from embedding_store import EmbeddingStore
+from answer_index import AnswerImageIndex
+from inference_scheduler import InferenceScheduler
+from image_decode import decode_image
+from inference_backends import create_backend, load_image_processor, warm_up
+from inference_service import READY, WARMING_UP, InferenceBusy, InferenceService, RemoteBackend
+from model_startup import ModelStartup
+import quest_storage
+from storage import create_storage, id_candidates
+from catalog_cache import CatalogCache
+from legacy_quest import load_legacy_quest
+from ingestion import IngestionPipeline
+from quest_upload import parse_quest_upload
+from renditions import RenditionStore
+from result_cache import HASH_CHUNK_BYTES, ResultCache, compare_key
+from geo_index import GeoIndex
+from leaderboard_store import entry_error
+import prefork
+from vector_index import CatalogVectorIndex, VectorIndex
+from werkzeug.exceptions import RequestEntityTooLarge
 
 app = Flask(__name__)
 
@@ -19,6 +43,11 @@ CORS(app, resources={r"/*": {"origins": "*"}}, methods=["GET", "POST", "OPTIONS"
 # Quest storage
 QUESTS_DIR = "quests"
 
+# Quests, leaderboards and ratings: 'file' (the quest folders) or 'sqlite'
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'file')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'cityquest.db')
+storage = create_storage(STORAGE_BACKEND, QUESTS_DIR, SQLITE_PATH)
+
 def ensure_quests_dir():
     """Create quests directory if it doesn't exist"""
     try:
@@ -30,22 +59,10 @@ def ensure_quests_dir():
         print(f"Error creating quests directory: {e}")
         return False
 
-def save_quest_file(quest_data, quest_filepath):
-    """Save quest file to specified path"""
-    try:
-        with open(quest_filepath, 'w', encoding='utf-8') as f:
-            f.write(quest_data)
-        print(f"✅ Quest file saved: {os.path.basename(quest_filepath)}")
-        return True
-    except Exception as e:
-        print(f"Error saving quest file: {e}")
-        return False
-
 def save_quest_data(quest_data, data_filepath):
     """Save quest data (photos and metadata) to specified path"""
     try:
-        with open(data_filepath, 'w', encoding='utf-8') as f:
-            json.dump(quest_data, f, indent=2, ensure_ascii=False)
+        quest_storage.atomic_write_json(data_filepath, quest_data)
         print(f"✅ Quest data saved: {os.path.basename(data_filepath)}")
         return True
     except Exception as e:
@@ -53,199 +70,693 @@ def save_quest_data(quest_data, data_filepath):
         return False
 
 # Initialize model globally
-model = None
-processor = None
+MODEL_NAME = "openai/clip-vit-base-patch16"
+# Inference backend: torch (fp32), int8 (dynamically quantized) or onnx (ONNX Runtime)
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch')
+# Load only the vision encoder and image processor (set VISION_ONLY=0 for the full CLIP model)
+VISION_ONLY = os.environ.get('VISION_ONLY', '1') != '0'
+# Number of pre-forked worker processes; 0 runs the Flask development server
+WORKERS = int(os.environ.get('WORKERS', 0))
+# Intra-op inference threads per worker or inference process (default: the cores divided among them)
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0))
+# Host the model in this many dedicated inference processes (0 = in every server process)
+INFERENCE_PROCESSES = int(os.environ.get('INFERENCE_PROCESSES', 0))
+# Shared-memory request slots between the server processes and the inference processes
+INFERENCE_SLOTS = int(os.environ.get('INFERENCE_SLOTS', 16))
+INFERENCE_TIMEOUT = float(os.environ.get('INFERENCE_TIMEOUT', 60))
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', 8))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 5))
+# Batch sizes of the dummy forward passes run after loading (empty = no warm-up)
+WARMUP_BATCH_SIZES = sorted({int(n) for n in os.environ.get('WARMUP_BATCH_SIZES', f"1,{INFERENCE_MAX_BATCH_SIZE}")
+                             .split(',') if n.strip() and int(n) > 0})
+# Give up on the model (the server stays up, but never ready) after this long
+MODEL_STARTUP_TIMEOUT = float(os.environ.get('MODEL_STARTUP_TIMEOUT', 900))
+backend = None
+inference_service = None
+image_processor = None
+model_load_seconds = None
+# The model loads and warms up in the background; endpoints that need it answer 503 until it has loaded.
+# The last phase embeds the answer photos for /identify, which answers 503 until it is done.
+model_startup = ModelStartup(('load', 'warmup', 'index'))
+
+def start_inference_service():
+    """Fork the inference processes, which load and warm up the model in the background"""
+    global inference_service, image_processor
+    inference_service = InferenceService(
+        lambda replica_threads: create_backend(INFERENCE_BACKEND, MODEL_NAME, vision_only=VISION_ONLY,
+                                               threads=replica_threads),
+        input_shape=(3, 224, 224),
+        processes=INFERENCE_PROCESSES,
+        slots=INFERENCE_SLOTS,
+        max_items=INFERENCE_MAX_BATCH_SIZE,
+        # INFERENCE_THREADS sizes each inference process here, not the server processes
+        threads=INFERENCE_THREADS or prefork.default_threads(INFERENCE_PROCESSES),
+        max_wait_ms=INFERENCE_MAX_WAIT_MS,
+        timeout=INFERENCE_TIMEOUT,
+        warmup=lambda replica_backend: warm_up(replica_backend, WARMUP_BATCH_SIZES),
+    )
+    # Fork before this process imports anything heavy; it only keeps the image processor
+    inference_service.start()
+    image_processor = load_image_processor(MODEL_NAME)
 
-def initialize_model():
-    """Initialize the CLIP model and processor"""
-    global model, processor
+def load_model(threads=None):
+    """Startup phase: load the model, or wait until the inference processes have loaded theirs"""
+    global backend, model_load_seconds
     try:
-        model = CLIPModel.from_pretrained("openai/clip-vit-base-patch16")
-        processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch16")
-        print("✅ CLIP model loaded successfully")
+        start = time.perf_counter()
+        if inference_service:
+            inference_service.wait(WARMING_UP, timeout=MODEL_STARTUP_TIMEOUT)
+            backend = RemoteBackend(inference_service, image_processor)
+            model_load_seconds = max(replica['load_seconds'] for replica in inference_service.replicas())
+        else:
+            backend = create_backend(INFERENCE_BACKEND, MODEL_NAME, vision_only=VISION_ONLY, threads=threads)
+            model_load_seconds = time.perf_counter() - start
+        print(f"✅ CLIP model loaded successfully ({backend.name} backend, "
+              f"{'vision-only' if VISION_ONLY else 'full model'}, {model_load_seconds:.1f}s)")
+        return {'backend': backend.name}
     except Exception as e:
         print(f"❌ Error loading CLIP model: {e}")
         raise
 
+def warm_up_model():
+    """Startup phase: run dummy batches so the first compares don't pay for lazy initialization"""
+    if inference_service:
+        # Each inference process warms itself up before taking requests
+        inference_service.wait(READY, timeout=MODEL_STARTUP_TIMEOUT)
+        return {'inference_processes': inference_service.replicas()}
+    timings = warm_up(backend, WARMUP_BATCH_SIZES)
+    print(f"✅ Warm-up done (batch sizes {', '.join(timings) or 'none'})")
+    return {'batch_seconds': timings}
+
+def initialize_model(threads=None):
+    """Load and warm up the CLIP model in the foreground"""
+    model_startup.run('load', lambda: load_model(threads))
+    model_startup.run('warmup', warm_up_model)
+    model_startup.run('index', build_identify_index)
+
+def start_model(threads=None):
+    """Load (unless already loaded) and warm up the model, then build the identify index, in a background thread"""
+    model_startup.start({'load': lambda: load_model(threads), 'warmup': warm_up_model, 'index': build_identify_index})
+
 # Answer images are stored in the assets/beaverton/ directory
 # The frontend now sends the filename directly
 
-def get_embedding(image_bytes):
-    """Generate CLIP embedding for an image"""
-    if model is None or processor is None:
+# JPEGs are decoded at reduced resolution, no smaller than this on either side (0 = full decode)
+JPEG_DRAFT_SIZE = int(os.environ.get('JPEG_DRAFT_SIZE', 224))
+
+def preprocess_image(image_source):
+    """Decode an image and turn it into CLIP pixel values (runs on the request thread)"""
+    image = decode_image(image_source, min_side=JPEG_DRAFT_SIZE)
+    return backend.preprocess(image)
+
+def embed_pixel_batch(pixel_values_list):
+    """Run one forward pass over a batch of preprocessed images"""
+    return list(backend.embed_batch(np.concatenate(pixel_values_list)))
+
+# Concurrent embedding requests are batched into a single forward pass
+inference_scheduler = InferenceScheduler(
+    embed_pixel_batch,
+    max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=INFERENCE_MAX_WAIT_MS,
+)
+
+def get_embedding(image_source):
+    """Generate the normalized CLIP embedding vector for an image given as bytes or a binary file object"""
+    if backend is None:
         raise RuntimeError("CLIP model not initialized")
     
     try:
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        inputs = processor(images=image, return_tensors="pt")
-        with torch.no_grad():
-            image_features = model.get_image_features(**inputs)
-        return image_features / image_features.norm(dim=-1, keepdim=True)
+        pixel_values = preprocess_image(image_source)
+        return inference_scheduler.submit(pixel_values).result()
     except Exception as e:
         print(f"Error generating embedding: {e}")
         raise
 
-def load_answer_image(filename):
-    """Load answer image from server storage based on filename"""
-    if not filename:
-        raise ValueError("No filename provided")
+# Upright, downscaled copies of the answer photos (model input and display sizes)
+rendition_store = RenditionStore()
+
+# Precomputed answer-image embeddings, persisted per quest folder. The key
+# includes the backend and decode settings since both slightly change the embeddings.
+# Answer photos are embedded from their model rendition.
+EMBEDDING_VERSION = f"{MODEL_NAME}:{INFERENCE_BACKEND}:draft{JPEG_DRAFT_SIZE}:rendition"
+embedding_store = EmbeddingStore(EMBEDDING_VERSION, get_embedding, source_fn=rendition_store.model_path)
+
+def existing_dirs(folder):
+    """Return the locations of a folder relative to the possible working directories"""
+    candidates = [folder, f"../{folder}", f"../../{folder}", f"src/{folder}", f"../src/{folder}"]
+    dirs = []
+    for path in candidates:
+        if os.path.isdir(path) and os.path.realpath(path) not in [os.path.realpath(d) for d in dirs]:
+            dirs.append(path)
+    return dirs
+
+# Filename -> path index of answer images; legacy asset folders are kept for backward compatibility
+answer_index = AnswerImageIndex(
+    quests_dirs=existing_dirs(QUESTS_DIR) or [QUESTS_DIR],
+    flat_dirs=existing_dirs("assets/beaverton") + existing_dirs("assets/aloha") + existing_dirs("assets"),
+)
+
+def find_answer_image_path(filename, quest_folder=None):
+    """Find the path of an answer image in server storage based on filename"""
+    return answer_index.lookup(filename, folder=quest_folder)
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Liveness: 200 whenever the server answers, also while the model is loading or if it failed to"""
+    return jsonify({
+        'status': 'healthy',
+        'ready': model_startup.ready,
+        'model_loaded': backend is not None,
+        'processor_loaded': backend is not None,
+        'backend': backend.name if backend else None,
+        'model_load_seconds': model_load_seconds,
+        'startup': model_startup.status(),
+        'storage': storage.name,
+        'ambiguous_answer_images': len(answer_index.ambiguous())
+    })
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: 200 once the model is loaded and warmed up and the identify index is built, 503 until then"""
+    status = model_startup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+def embedding_error(e, message):
+    """Error response for a failed embedding; 503 when every inference slot stayed busy"""
+    if isinstance(e, InferenceBusy):
+        return jsonify({'error': f'{message}: the server is busy, try again shortly'}), 503, {'Retry-After': '1'}
+    return jsonify({'error': f'{message}: {e}'}), 500
+
+def requires_model(view):
+    """Answer 503 while the model is loading (or failed to load) instead of running the view"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if backend is not None:
+            return view(*args, **kwargs)
+        status = model_startup.status()
+        if status['state'] == 'failed':
+            return jsonify({'error': f"The image model could not be loaded ({status['error']})"}), 503
+        response = jsonify({'error': 'The image model is still loading, try again shortly',
+                            'phase': status['phase']})
+        return response, 503, {'Retry-After': '5'}
+    return wrapper
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Runtime metrics for the inference pipeline"""
+    return jsonify({
+        'inference': inference_scheduler.stats(),
+        'write_coalescing': quest_storage.coalescer.stats(),
+        'compare_cache': compare_cache.stats(),
+        'geo_index': geo_index.stats(),
+        'identify_index': identify_index.stats(),
+        'quest_catalog': quest_catalog.stats(),
+        'ingestion': ingestion.stats(),
+        'inference_service': inference_service.stats() if inference_service else None
+    })
+
+# Results of recent compares, so a retried upload of the same photo skips the model
+compare_cache = ResultCache(
+    max_entries=int(os.environ.get('COMPARE_CACHE_SIZE', 1024)),
+    ttl_seconds=float(os.environ.get('COMPARE_CACHE_TTL', 300)),
+)
+# Raw image bodies are spooled to a temporary file beyond this size, so they can be hashed and then decoded
+UPLOAD_SPOOL_BYTES = 1024 * 1024
+
+# Geo-gated compare: only checkpoints this close to the player's GPS fix are scored
+GEO_RADIUS_METERS = float(os.environ.get('GEO_RADIUS_METERS', 150))
+# The fix's reported accuracy widens the radius, up to this much
+GEO_MAX_ACCURACY_METERS = float(os.environ.get('GEO_MAX_ACCURACY_METERS', 500))
+geo_index = GeoIndex(storage.checkpoints_version, storage.list_checkpoints)
+
+def parse_position(params):
+    """Return the player's position from request params, or None if none was sent.
+
+    params needs lat, lng and questId, and may have accuracy (meters).
+    Raises ValueError when the position is incomplete or out of range.
+    """
+    if params.get('lat') in (None, '') and params.get('lng') in (None, ''):
+        return None
+    try:
+        lat = float(params.get('lat'))
+        lng = float(params.get('lng'))
+        accuracy = float(params.get('accuracy') or 0)
+    except (TypeError, ValueError):
+        raise ValueError('lat, lng and accuracy must be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or math.isnan(accuracy):
+        raise ValueError('lat/lng out of range')
+    quest_id = params.get('questId')
+    if quest_id in (None, ''):
+        raise ValueError('questId is required with a position')
+    radius = GEO_RADIUS_METERS + min(max(accuracy, 0.0), GEO_MAX_ACCURACY_METERS)
+    return {'quest_id': str(quest_id), 'lat': lat, 'lng': lng, 'radius': radius}
+
+def nearby_answers(position, answer_images):
+    """Answer images of the quest's checkpoints within the radius, nearest checkpoint first.
+
+    Returns (filenames, {filename: (distance, checkpoint)}). When the client
+    also listed answer images, only those are kept.
+    """
+    allowed = set(answer_images) if answer_images else None
+    located = {}
+    for distance, checkpoint in geo_index.nearby(position['lat'], position['lng'], position['radius'],
+                                                 set(id_candidates(position['quest_id']))):
+        for filename in checkpoint['answer_images']:
+            if (allowed is None or filename in allowed) and filename not in located:
+                located[filename] = (distance, checkpoint)
+    return list(located), located
+
+def spool_upload(stream):
+    """Copy a request body that can only be read once into a rewindable file, in chunks"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    shutil.copyfileobj(stream, spooled, HASH_CHUNK_BYTES)
+    spooled.seek(0)
+    return spooled
+
+def compare_player_image(player_image, answer_images, position=None):
+    """Score a player image (bytes or seekable file object) against answer images and return the response.
+
+    With a position, the candidates are the answer images of the quest's
+    checkpoints near it (narrowed to answer_images if any were sent); a
+    player near none of them is rejected without decoding the photo. Quests
+    without located checkpoints (or unknown to the geo index, like legacy
+    .js quests) are scored against answer_images as if no position was sent.
+    """
+    if position is not None and not geo_index.locates(id_candidates(position['quest_id'])):
+        position = None
+
+    # Convert single image to array for consistent processing
+    if isinstance(answer_images, str):
+        answer_images = [answer_images]
+    elif answer_images is None and position is not None:
+        answer_images = []
+    elif not isinstance(answer_images, list) or not all(isinstance(a, str) for a in answer_images):
+        return jsonify({'error': 'answerImage must be a string or array of strings'}), 400
+    
+    located = {}
+    if position is not None:
+        answer_images, located = nearby_answers(position, answer_images)
+        if not answer_images:
+            print(f"Rejected: no checkpoint of quest {position['quest_id']} within {position['radius']:.0f} m")
+            return jsonify({
+                'similarity': 0.0,
+                'best_match': None,
+                'cached': False,
+                'rejected': f"No checkpoint of this quest within {position['radius']:.0f} m"
+            })
     
-    # Define quest folders to search in (dynamic from quests directory)
-    quest_folders = []
+    if not answer_images:
+        return jsonify({'error': 'At least one answerImage is required'}), 400
     
-    # Add quests directory to search paths
-    if os.path.exists(QUESTS_DIR):
-        for quest_folder in os.listdir(QUESTS_DIR):
-            quest_path = os.path.join(QUESTS_DIR, quest_folder)
-            if os.path.isdir(quest_path):
-                quest_folders.append(quest_path)
+    def respond(result, cached):
+        response = {**result, 'cached': cached}
+        if result['best_match'] in located:
+            distance, checkpoint = located[result['best_match']]
+            response['checkpoint'] = {'id': checkpoint['checkpoint_id'], 'name': checkpoint['name'],
+                                      'distance_m': round(distance, 1)}
+        return jsonify(response)
     
-    # Also include legacy asset folders for backward compatibility
-    legacy_folders = ["assets/beaverton", "assets/aloha"]
-    for folder in legacy_folders:
-        if os.path.exists(folder):
-            quest_folders.append(folder)
+    # Retries send the identical photo; answer them from the cache
+    cache_key = compare_key(player_image, answer_images, EMBEDDING_VERSION)
+    cached = compare_cache.get(cache_key)
+    if cached is not None:
+        print(f"Cache hit: {cached['best_match']} with similarity: {cached['similarity']}")
+        return respond(cached, True)
     
-    # Try different possible paths for the image
-    possible_paths = []
+    # Get player embedding once
+    try:
+        player_emb = get_embedding(player_image)
+    except Exception as e:
+        return embedding_error(e, 'Error processing player image')
     
-    # Add quest-specific paths
-    for folder in quest_folders:
-        possible_paths.extend([
-            f"{folder}/{filename}",  # assets/quest/filename
-            f"../{folder}/{filename}",  # One level up
-            f"../../{folder}/{filename}",  # Two levels up
-            f"src/{folder}/{filename}",  # In src directory
-            f"../src/{folder}/{filename}",  # One level up from src
-        ])
+    # Compare with all answer images and find the highest similarity
+    max_similarity = -1.0
+    best_match = None
     
-    # Add fallback paths
-    possible_paths.extend([
-        filename,  # Just the filename (fallback)
-        f"assets/{filename}",  # Direct in assets
-        f"../assets/{filename}",  # One level up in assets
-    ])
+    for answer_image_filename in answer_images:
+        try:
+            # Answer embeddings come precomputed from the store; only
+            # images that are new or changed get embedded here
+            folder = located[answer_image_filename][1]['folder'] if answer_image_filename in located else None
+            answer_path = find_answer_image_path(answer_image_filename, folder)
+            answer_emb = embedding_store.get(answer_path)
+            
+            # Both embeddings are normalized, so the dot product is the cosine similarity
+            similarity = float(np.dot(player_emb, answer_emb))
+            
+            # Track the highest similarity
+            if similarity > max_similarity:
+                max_similarity = similarity
+                best_match = answer_image_filename
+                
+            print(f"Similarity with {answer_image_filename}: {similarity}")
+            
+        except (ValueError, FileNotFoundError) as e:
+            print(f"Warning: Could not load answer image {answer_image_filename}: {e}")
+            continue
+        except Exception as e:
+            print(f"Error processing answer image {answer_image_filename}: {e}")
+            continue
     
-    for path in possible_paths:
-        if os.path.exists(path):
-            try:
-                with open(path, 'rb') as f:
-                    print(f"✅ Found image at: {path}")
-                    return f.read()
-            except Exception as e:
-                print(f"Error reading file {path}: {e}")
-                continue
+    if max_similarity == -1.0:
+        return jsonify({'error': 'Could not load any answer images'}), 400
     
-    raise FileNotFoundError(f"Answer image '{filename}' not found at any of the expected paths")
-
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'model_loaded': model is not None,
-        'processor_loaded': processor is not None
-    })
+    print(f"Best match: {best_match} with similarity: {max_similarity}")
+    result = {'similarity': max_similarity, 'best_match': best_match}
+    compare_cache.put(cache_key, result)
+    return respond(result, False)
 
 @app.route('/compare', methods=['POST'])
+@requires_model
 def compare_images():
-    """Compare player image with server-stored answer image"""
+    """Compare player image with server-stored answer image.
+
+    Optional lat, lng, questId (and accuracy) limit the answers to that
+    quest's checkpoints near the player.
+    """
     try:
-        with torch.no_grad():
-            data = request.json
+        # Binary upload: multipart form with a playerImage file part and answerImage fields
+        if request.mimetype == 'multipart/form-data':
+            player_file = request.files.get('playerImage')
+            if player_file is None:
+                return jsonify({'error': 'Missing playerImage file part'}), 400
+            try:
+                position = parse_position(request.form)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return compare_player_image(player_file.stream, request.form.getlist('answerImage'), position)
+        
+        # Binary upload: raw image body with answerImage in the query string
+        if request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+            try:
+                position = parse_position(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return compare_player_image(spool_upload(request.stream), request.args.getlist('answerImage'), position)
+        
+        data = request.json
+        
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        try:
+            position = parse_position(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # New API format: playerImage and answerImage (supports single image or array of images)
+        if 'playerImage' in data and ('answerImage' in data or position is not None):
+            # Decode player's image
+            player_image_data = data['playerImage']
+            if player_image_data.startswith('data:image'):
+                player_image_data = player_image_data.split(',')[1]
             
-            if not data:
-                return jsonify({'error': 'No data provided'}), 400
+            try:
+                player_img_bytes = base64.b64decode(player_image_data)
+            except Exception as e:
+                return jsonify({'error': f'Invalid base64 image data: {e}'}), 400
             
-            # New API format: playerImage and answerImage (supports single image or array of images)
-            if 'playerImage' in data and 'answerImage' in data:
-                # Decode player's image
-                player_image_data = data['playerImage']
-                if player_image_data.startswith('data:image'):
-                    player_image_data = player_image_data.split(',')[1]
-                
-                try:
-                    player_img_bytes = base64.b64decode(player_image_data)
-                except Exception as e:
-                    return jsonify({'error': f'Invalid base64 image data: {e}'}), 400
-                
-                # Get answer image(s) - can be single filename or array of filenames
-                answer_images = data['answerImage']
-                
-                # Convert single image to array for consistent processing
-                if isinstance(answer_images, str):
-                    answer_images = [answer_images]
-                elif not isinstance(answer_images, list):
-                    return jsonify({'error': 'answerImage must be a string or array of strings'}), 400
-                
-                # Get player embedding once
-                try:
-                    player_emb = get_embedding(player_img_bytes)
-                except Exception as e:
-                    return jsonify({'error': f'Error processing player image: {e}'}), 500
-                
-                # Compare with all answer images and find the highest similarity
-                max_similarity = -1.0
-                best_match = None
-                
-                for answer_image_filename in answer_images:
-                    try:
-                        # Load answer image from server storage
-                        answer_img_bytes = load_answer_image(answer_image_filename)
-                        
-                        # Get embedding for answer image
-                        answer_emb = get_embedding(answer_img_bytes)
-                        
-                        # Calculate similarity
-                        similarity = torch.nn.functional.cosine_similarity(player_emb, answer_emb).item()
-                        
-                        # Track the highest similarity
-                        if similarity > max_similarity:
-                            max_similarity = similarity
-                            best_match = answer_image_filename
-                            
-                        print(f"Similarity with {answer_image_filename}: {similarity}")
-                        
-                    except (ValueError, FileNotFoundError) as e:
-                        print(f"Warning: Could not load answer image {answer_image_filename}: {e}")
-                        continue
-                    except Exception as e:
-                        print(f"Error processing answer image {answer_image_filename}: {e}")
-                        continue
-                
-                if max_similarity == -1.0:
-                    return jsonify({'error': 'Could not load any answer images'}), 400
-                
-                print(f"Best match: {best_match} with similarity: {max_similarity}")
-                return jsonify({'similarity': max_similarity})
+            # Get answer image(s) - can be single filename or array of filenames
+            return compare_player_image(player_img_bytes, data.get('answerImage'), position)
+        
+        # Legacy API format: img1 and img2 (for backward compatibility)
+        elif 'img1' in data and 'img2' in data:
+            try:
+                img1_bytes = base64.b64decode(data['img1'].split(',')[1])
+                img2_bytes = base64.b64decode(data['img2'].split(',')[1])
+            except Exception as e:
+                return jsonify({'error': f'Invalid base64 image data: {e}'}), 400
             
-            # Legacy API format: img1 and img2 (for backward compatibility)
-            elif 'img1' in data and 'img2' in data:
-                try:
-                    img1_bytes = base64.b64decode(data['img1'].split(',')[1])
-                    img2_bytes = base64.b64decode(data['img2'].split(',')[1])
-                except Exception as e:
-                    return jsonify({'error': f'Invalid base64 image data: {e}'}), 400
-                
-                try:
-                    emb1 = get_embedding(img1_bytes)
-                    emb2 = get_embedding(img2_bytes)
-                except Exception as e:
-                    return jsonify({'error': f'Error processing images: {e}'}), 500
-                
-                similarity = torch.nn.functional.cosine_similarity(emb1, emb2).item()
-                return jsonify({'similarity': similarity})
+            try:
+                emb1 = get_embedding(img1_bytes)
+                emb2 = get_embedding(img2_bytes)
+            except Exception as e:
+                return embedding_error(e, 'Error processing images')
+            
+            similarity = float(np.dot(emb1, emb2))
+            return jsonify({'similarity': similarity})
+        
+        else:
+            return jsonify({'error': 'Invalid request format. Expected playerImage and answerImage (string or array), or img1 and img2'}), 400
             
-            else:
-                return jsonify({'error': 'Invalid request format. Expected playerImage and answerImage (string or array), or img1 and img2'}), 400
-                
     except Exception as e:
         print(f"Unexpected error in compare_images: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/leaderboard/<quest_id>/get', methods=['POST', 'OPTIONS'])
+# Upper bound on the photos in one /compare/batch request
+COMPARE_BATCH_MAX_ITEMS = int(os.environ.get('COMPARE_BATCH_MAX_ITEMS', 32))
+
+def decode_base64_image(image_data):
+    """Decode a base64 image string (optionally a data URL) to bytes"""
+    if not isinstance(image_data, str) or not image_data:
+        raise ValueError('playerImage must be a base64 string')
+    if image_data.startswith('data:image'):
+        image_data = image_data.split(',')[1]
+    return base64.b64decode(image_data)
+
+def embed_answer_paths(paths):
+    """Return (paths, matrix) for the answer image files that could be embedded"""
+    try:
+        return list(paths), embedding_store.get_many(paths)
+    except Exception as e:
+        # One unreadable answer photo shouldn't sink the others
+        print(f"Error embedding answer images as a batch, retrying one by one: {e}")
+        rows, loaded = [], []
+        for path in paths:
+            try:
+                rows.append(embedding_store.get(path))
+                loaded.append(path)
+            except Exception as e:
+                print(f"Error processing answer image {os.path.basename(path)}: {e}")
+        return loaded, np.stack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+
+def answer_embedding_matrix(filenames):
+    """Return ({filename: row}, matrix) for the answer images that could be loaded"""
+    paths = {}
+    for filename in filenames:
+        try:
+            paths[filename] = find_answer_image_path(filename)
+        except (ValueError, FileNotFoundError) as e:
+            print(f"Warning: Could not load answer image {filename}: {e}")
+    names = {path: name for name, path in paths.items()}
+    loaded, matrix = embed_answer_paths(list(paths.values()))
+    return {names[path]: row for row, path in enumerate(loaded)}, matrix
+
+def compare_batch(items):
+    """Score (player image, answer images) pairs; returns one result or error dict per item.
+
+    A player image is bytes, a binary file object, or the exception raised
+    while decoding it.
+
+    Photos that miss the compare cache are embedded together in one forward
+    pass and scored against every answer embedding with one matrix multiply.
+    """
+    results = [None] * len(items)
+    pending = []  # (index, cache key, answer filenames, pixel values)
+    for index, (player_image, answer_images) in enumerate(items):
+        if isinstance(answer_images, str):
+            answer_images = [answer_images]
+        if not isinstance(answer_images, list) or not answer_images or not all(isinstance(a, str) for a in answer_images):
+            results[index] = {'index': index, 'error': 'answerImage must be a string or a non-empty array of strings'}
+            continue
+        try:
+            if isinstance(player_image, Exception):
+                raise player_image
+            cache_key = compare_key(player_image, answer_images, EMBEDDING_VERSION)
+            cached = compare_cache.get(cache_key)
+            if cached is not None:
+                results[index] = {'index': index, **cached, 'cached': True}
+                continue
+            if backend is None:
+                raise RuntimeError("CLIP model not initialized")
+            pending.append((index, cache_key, answer_images, preprocess_image(player_image)))
+        except Exception as e:
+            results[index] = {'index': index, 'error': f'Error processing player image: {e}'}
+    
+    if pending:
+        try:
+            player_matrix = np.stack(inference_scheduler.submit_many([pixels for *_, pixels in pending]).result())
+        except Exception as e:
+            print(f"Error embedding batch of {len(pending)} player images: {e}")
+            for index, *_ in pending:
+                results[index] = {'index': index, 'error': f'Error processing player image: {e}'}
+            return results
+        
+        rows, answer_matrix = answer_embedding_matrix(sorted({a for _, _, answers, _ in pending for a in answers}))
+        # Every embedding is normalized, so this is every cosine similarity at once
+        scores = player_matrix @ answer_matrix.T if rows else np.zeros((len(pending), 0), dtype=np.float32)
+        for position, (index, cache_key, answers, _) in enumerate(pending):
+            loaded = [a for a in answers if a in rows]
+            if not loaded:
+                results[index] = {'index': index, 'error': 'Could not load any answer images'}
+                continue
+            item_scores = scores[position, [rows[a] for a in loaded]]
+            best = int(np.argmax(item_scores))
+            result = {'similarity': float(item_scores[best]), 'best_match': loaded[best]}
+            compare_cache.put(cache_key, result)
+            results[index] = {'index': index, **result, 'cached': False}
+    return results
+
+@app.route('/compare/batch', methods=['POST'])
+@requires_model
+def compare_images_batch():
+    """Compare several player photos, each against its own answer images, in one request.
+
+    JSON: {"items": [{"playerImage": <base64>, "answerImage": <filename or [filenames]>}, ...]}
+    Multipart: file parts playerImage.<n> with answerImage.<n> fields.
+    Failed items carry an error instead of a similarity; the rest still succeed.
+    """
+    try:
+        if request.mimetype == 'multipart/form-data':
+            numbers = sorted(int(key.split('.', 1)[1]) for key in request.files
+                             if key.startswith('playerImage.') and key.split('.', 1)[1].isdigit())
+            items = [(request.files[f'playerImage.{n}'].stream, request.form.getlist(f'answerImage.{n}'))
+                     for n in numbers]
+        else:
+            data = request.get_json(silent=True)
+            raw_items = data.get('items') if isinstance(data, dict) else None
+            if not isinstance(raw_items, list):
+                return jsonify({'error': 'Expected {"items": [{"playerImage": ..., "answerImage": ...}, ...]}'}), 400
+            items = []
+            for item in raw_items:
+                item = item if isinstance(item, dict) else {}
+                try:
+                    player_image = decode_base64_image(item.get('playerImage'))
+                except Exception as e:
+                    player_image = e  # reported as this item's error
+                items.append((player_image, item.get('answerImage')))
+        
+        if not items:
+            return jsonify({'error': 'At least one item is required'}), 400
+        if len(items) > COMPARE_BATCH_MAX_ITEMS:
+            return jsonify({'error': f'At most {COMPARE_BATCH_MAX_ITEMS} items per batch'}), 400
+        
+        results = compare_batch(items)
+        failed = sum(1 for result in results if 'error' in result)
+        print(f"Batch compare: {len(results) - failed} of {len(results)} items succeeded")
+        return jsonify({'results': results, 'succeeded': len(results) - failed, 'failed': failed})
+        
+    except Exception as e:
+        print(f"Unexpected error in compare_images_batch: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+# City-wide visual search: every located checkpoint's answer photos in one vector index
+IDENTIFY_MAX_K = int(os.environ.get('IDENTIFY_MAX_K', 20))
+# Above this many answer photos /identify searches an approximate IVF index (0 = always exact)
+IDENTIFY_IVF_MIN_VECTORS = int(os.environ.get('IDENTIFY_IVF_MIN_VECTORS', 50000))
+
+def identify_entries():
+    """{answer image path: checkpoint} for the answer photos of every located checkpoint"""
+    entries = {}
+    for checkpoint in storage.list_checkpoints():
+        for filename in checkpoint['answer_images']:
+            try:
+                path = find_answer_image_path(filename, checkpoint['folder'])
+            except (ValueError, FileNotFoundError):
+                continue
+            entries.setdefault(path, {**checkpoint, 'answer_image': filename})
+    return entries
+
+identify_index = CatalogVectorIndex(
+    storage.checkpoints_version, identify_entries, embed_answer_paths,
+    VectorIndex(ivf_min_vectors=IDENTIFY_IVF_MIN_VECTORS, nprobe=int(os.environ.get('IDENTIFY_NPROBE', 16))),
+)
+
+def build_identify_index():
+    """Startup phase: embed every answer photo into the identify index so no request has to"""
+    identify_index.sync()
+    return {'answer_photos': len(identify_index.index)}
+
+def identify_player_image(player_image, k=5, exact=False):
+    """Find the k checkpoints across all quests whose answer photos best match a player image"""
+    if not identify_index.synced:
+        status = model_startup.status()
+        if status['state'] == 'failed':
+            return jsonify({'error': f"The identify index could not be built ({status['error']})"}), 503
+        return jsonify({'error': 'The identify index is still being built, try again shortly',
+                        'phase': status['phase']}), 503, {'Retry-After': '5'}
+    try:
+        player_emb = get_embedding(player_image)
+    except Exception as e:
+        return embedding_error(e, 'Error processing player image')
+    
+    # A checkpoint usually has several answer photos; keep each one's best
+    matches = []
+    seen = set()
+    for similarity, _, checkpoint in identify_index.search(player_emb, k * 4, exact):
+        checkpoint_key = (checkpoint['quest_id'], checkpoint['checkpoint_id'])
+        if checkpoint_key in seen:
+            continue
+        seen.add(checkpoint_key)
+        matches.append({
+            'similarity': similarity,
+            'quest_id': checkpoint['quest_id'],
+            'folder': checkpoint['folder'],
+            'checkpoint': {'id': checkpoint['checkpoint_id'], 'name': checkpoint['name'],
+                           'lat': checkpoint['lat'], 'lng': checkpoint['lng']},
+            'answer_image': checkpoint['answer_image'],
+        })
+        if len(matches) == k:
+            break
+    
+    if matches:
+        print(f"Identified: {matches[0]['checkpoint']['name']} ({matches[0]['quest_id']}) "
+              f"with similarity: {matches[0]['similarity']}")
+    return jsonify({
+        'matches': matches,
+        'method': 'exact' if exact or not identify_index.index.ivf_active else 'ivf',
+        'indexed': len(identify_index.index)
+    })
+
+@app.route('/identify', methods=['POST'])
+@requires_model
+def identify_image():
+    """Which checkpoint is this? Search a player photo against every quest's answer photos.
+
+    The photo is sent like /compare's playerImage (multipart file part,
+    raw image body or base64 JSON). Optional k (default 5) and exact.
+    """
+    try:
+        if request.mimetype == 'multipart/form-data':
+            params = request.form
+            player_file = request.files.get('playerImage')
+            if player_file is None:
+                return jsonify({'error': 'Missing playerImage file part'}), 400
+            player_image = player_file.stream
+        elif request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+            params = request.args
+            player_image = request.stream
+        else:
+            params = request.get_json(silent=True)
+            if not isinstance(params, dict) or 'playerImage' not in params:
+                return jsonify({'error': 'Expected playerImage'}), 400
+            try:
+                player_image = decode_base64_image(params['playerImage'])
+            except Exception as e:
+                return jsonify({'error': f'Invalid base64 image data: {e}'}), 400
+        
+        try:
+            k = int(params.get('k') or 5)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'k must be an integer'}), 400
+        if not 1 <= k <= IDENTIFY_MAX_K:
+            return jsonify({'error': f'k must be between 1 and {IDENTIFY_MAX_K}'}), 400
+        exact = str(params.get('exact', '')).lower() in ('1', 'true', 'yes')
+        
+        return identify_player_image(player_image, k, exact)
+        
+    except Exception as e:
+        print(f"Unexpected error in identify_image: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/leaderboard/<quest_id>/get', methods=['GET', 'POST', 'OPTIONS'])
 def get_leaderboard(quest_id):
-    """Get leaderboard for a specific quest"""
+    """Get leaderboard for a specific quest, best first.
+
+    Optional parameters (query string or JSON body): limit, offset, cursor
+    (the next_cursor of a previous page) and team (adds that team's rank).
+    Without limit every entry is returned.
+    """
     if request.method == 'OPTIONS':
         # Handle preflight request
         response = jsonify({'status': 'ok'})
@@ -255,112 +766,55 @@ def get_leaderboard(quest_id):
         return response
     
     try:
-        # Get leaderboard from quest's JSON file
-        quest_file_path = find_quest_file_by_id(quest_id)
-        if not quest_file_path:
-            return jsonify({'error': 'Quest not found'}), 404
+        params = dict(request.args)
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            params.update(body)
         
         try:
-            with open(quest_file_path, 'r', encoding='utf-8') as f:
-                quest_data = json.load(f)
-            
-            leaderboard_data = quest_data.get('leaderboard', {})
-            quest_leaderboard = leaderboard_data.get('entries', [])
-            
-            # Sort by waypoints completed (descending), then by completion time (ascending)
-            sorted_leaderboard = sorted(
-                quest_leaderboard,
-                key=lambda x: (-x.get('waypoints_completed', 0), x.get('completion_time', float('inf')))
-            )
-            
-            return jsonify({
-                'quest_id': quest_id,
-                'leaderboard': sorted_leaderboard,
-                'stats': leaderboard_data.get('stats', {})
-            })
-        except Exception as e:
-            print(f"Error reading quest leaderboard: {e}")
-            return jsonify({'error': 'Internal server error'}), 500
+            limit = int(params['limit']) if params.get('limit') is not None else None
+            offset = int(params.get('offset') or 0)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'limit and offset must be integers'}), 400
+        if (limit is not None and limit < 0) or offset < 0:
+            return jsonify({'error': 'limit and offset must not be negative'}), 400
+        
+        cursor, team_name = params.get('cursor'), params.get('team')
+        if not isinstance(cursor, (str, type(None))):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        if not isinstance(team_name, (str, type(None))):
+            return jsonify({'error': 'team must be a string'}), 400
+        
+        try:
+            page = storage.get_leaderboard(quest_id, limit=limit, offset=offset, cursor=cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        if page is None:
+            return jsonify({'error': 'Quest not found'}), 404
+        
+        response = {
+            'quest_id': quest_id,
+            'leaderboard': page['entries'],
+            'stats': page['stats'],
+            'total': page['total'],
+            'next_cursor': page['next_cursor']
+        }
+        
+        if team_name:
+            rank, entry = storage.get_leaderboard_rank(quest_id, team_name) or (None, None)
+            response['team_rank'] = {'team_name': team_name, 'rank': rank, 'entry': entry}
+        
+        return jsonify(response)
     except Exception as e:
         print(f"Error getting leaderboard: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
-def find_quest_file_by_id(quest_id):
-    """Find quest JSON file by quest ID"""
-    if os.path.exists(QUESTS_DIR):
-        for quest_folder in os.listdir(QUESTS_DIR):
-            quest_path = os.path.join(QUESTS_DIR, quest_folder)
-            if os.path.isdir(quest_path):
-                # Look for JSON files
-                json_files = [f for f in os.listdir(quest_path) if f.endswith('.json') and not f.endswith('_metadata.json')]
-                for json_file in json_files:
-                    file_path = os.path.join(quest_path, json_file)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            quest_data = json.load(f)
-                            # Check if the quest ID matches
-                            if str(quest_data.get('id')) == str(quest_id):
-                                return file_path
-                    except Exception as e:
-                        print(f"Error reading quest file {json_file}: {e}")
-                        continue
-    return None
-
 def update_quest_leaderboard(quest_id, new_entry):
-    """Update the leaderboard in the quest's JSON file"""
-    quest_file_path = find_quest_file_by_id(quest_id)
-    if not quest_file_path:
-        print(f"⚠️ Quest file not found for ID {quest_id}")
-        return False
-    
+    """Append an entry to the quest's leaderboard and update its running stats"""
     try:
-        # Load the quest data
-        with open(quest_file_path, 'r', encoding='utf-8') as f:
-            quest_data = json.load(f)
-        
-        # Get or create leaderboard data
-        leaderboard_data = quest_data.get('leaderboard', {})
-        if not leaderboard_data:
-            leaderboard_data = {
-                'entries': [],
-                'stats': {
-                    'total_completions': 0,
-                    'average_time': 0,
-                    'best_time': None,
-                    'last_updated': None
-                },
-                'ratings': []
-            }
-        
-        # Add new entry to entries
-        entries = leaderboard_data.get('entries', [])
-        entries.append(new_entry)
-        leaderboard_data['entries'] = entries
-        
-        # Update stats
-        stats = leaderboard_data.get('stats', {})
-        stats['total_completions'] = len(entries)
-        
-        # Calculate average time
-        if entries:
-            total_time = sum(entry.get('completion_time', 0) for entry in entries)
-            stats['average_time'] = total_time / len(entries)
-            
-            # Find best time
-            completion_times = [entry.get('completion_time', 0) for entry in entries if entry.get('completion_time', 0) > 0]
-            if completion_times:
-                stats['best_time'] = min(completion_times)
-        
-        stats['last_updated'] = datetime.now().isoformat()
-        leaderboard_data['stats'] = stats
-        
-        # Update the quest data
-        quest_data['leaderboard'] = leaderboard_data
-        
-        # Save the updated quest file
-        with open(quest_file_path, 'w', encoding='utf-8') as f:
-            json.dump(quest_data, f, indent=2, ensure_ascii=False)
-        
+        if not storage.add_leaderboard_entry(quest_id, new_entry):
+            print(f"⚠️ Quest not found for ID {quest_id}")
+            return False
         print(f"✅ Updated quest {quest_id} leaderboard with new entry")
         return True
         
@@ -388,6 +842,10 @@ def add_leaderboard_entry(quest_id):
         for field in required_fields:
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
+        # Anything stored must rank against the other entries
+        error = entry_error(data)
+        if error:
+            return jsonify({'error': error}), 400
         
         # Create new entry
         new_entry = {
@@ -407,134 +865,115 @@ def add_leaderboard_entry(quest_id):
         print(f"Error adding leaderboard entry: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/submit-quest', methods=['POST', 'OPTIONS'])
-def submit_quest():
-    """Submit a new quest with photos and metadata"""
-    if request.method == 'OPTIONS':
-        # Handle preflight request
-        response = jsonify({'status': 'ok'})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, ngrok-skip-browser-warning')
-        response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        return response
-    
+# Submitted quests are ingested in the background; /api/submit-quest returns a job id
+# Multipart uploads stream their photos here before they are moved into the quest folder
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR', 'uploads')
+INGEST_STAGES = ('photos', 'renditions', 'normalize', 'embeddings', 'publish')
+# Job statuses are shared through files here, so any worker process can answer a status poll
+INGEST_STATUS_DIR = os.environ.get('INGEST_STATUS_DIR', 'ingest_jobs')
+ingestion = IngestionPipeline(
+    max_jobs=int(os.environ.get('INGEST_WORKERS', 2)),
+    max_parallel=int(os.environ.get('INGEST_PARALLELISM', 4)),
+    status_dir=INGEST_STATUS_DIR or None,
+)
+
+def submitted_photos(zip_data, waypoint_index):
+    """Return the {photo_index: photo} dict submitted for a waypoint.
+
+    A photo has base64 'data' (JSON submissions) or the 'path' of a file
+    staged by a multipart upload.
+    """
+    waypoint_photos = zip_data.get('photos', {}).get(str(waypoint_index), {})
+    if not isinstance(waypoint_photos, dict):
+        print(f"Warning: waypoint_photos for waypoint {waypoint_index} is not a dict: {type(waypoint_photos)}")
+        return {}
+    return {index: photo for index, photo in waypoint_photos.items()
+            if photo and isinstance(photo, dict) and (photo.get('data') or photo.get('path'))}
+
+def decode_quest_photo(image_data):
+    """Decode a base64 (or data URL) photo and check that it is a readable image"""
+    if image_data.startswith('data:image'):
+        image_data = image_data.split(',')[1]
+    image_bytes = base64.b64decode(image_data)
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.verify()
+    return image_bytes
+
+def store_quest_photo(photo, image_filepath):
+    """Verify a submitted photo and write it to image_filepath"""
+    if 'path' in photo:
+        # Already on disk from a multipart upload: verify and move it in place
+        with Image.open(photo['path']) as image:
+            image.verify()
+        quest_storage.atomic_move(photo['path'], image_filepath)
+    else:
+        # Drop the base64 text as soon as it is decoded
+        quest_storage.atomic_write_bytes(image_filepath, decode_quest_photo(photo.pop('data')))
+
+def claim_quest_folder(safe_name, timestamp):
+    """Create a new, empty quest folder and return its name.
+
+    Submissions with the same name in the same second get numbered
+    folders. mkdir is atomic, so two jobs (even in different worker
+    processes) never share a folder, and a failed job can delete its own.
+    """
+    os.makedirs(QUESTS_DIR, exist_ok=True)
+    base = f"{safe_name}_{timestamp}"
+    for number in range(1, 1000):
+        quest_folder = base if number == 1 else f"{base}_{number}"
+        try:
+            os.mkdir(os.path.join(QUESTS_DIR, quest_folder))
+        except FileExistsError:
+            continue
+        print(f"✅ Created quest folder: {quest_folder}")
+        return quest_folder
+    raise RuntimeError(f"Too many quest folders named {base}")
+
+def ingest_quest(job, quest_data, zip_data, quest_folder, upload=None):
+    """Background job: write the photos, build the quest, embed the answers, then publish it.
+
+    quest_folder was created for this job by claim_quest_folder() and is removed if the job fails.
+    """
+    quest_name = quest_data['name'].strip()
+    quest_folder_path = os.path.join(QUESTS_DIR, quest_folder)
+    quest_filename = f"{quest_folder}.json"
+
     try:
-        # Ensure quests directory exists
-        if not ensure_quests_dir():
-            return jsonify({'error': 'Failed to create quests directory'}), 500
-        
-        data = request.json
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-        
-        print(f"Received data: {type(data)}")
-        print(f"Data keys: {data.keys() if isinstance(data, dict) else 'Not a dict'}")
-        
-        quest_data = data.get('questData')
-        zip_data = data.get('zipData')
-        
-        print(f"Quest data type: {type(quest_data)}")
-        print(f"Zip data type: {type(zip_data)}")
-        
-        if isinstance(zip_data, str):
+        # Only waypoints with coordinates are kept, numbered in order
+        waypoints = [(i, cp) for i, cp in enumerate(quest_data.get('checkpoints', [])) if cp.get('lat') and cp.get('lng')]
+        photo_items = [
+            (i, photo_index, photo)
+            for i, _ in waypoints
+            for photo_index, photo in submitted_photos(zip_data, i).items()
+        ]
+
+        def save_photo(item):
+            i, photo_index, photo = item
+            image_filename = f"{quest_folder}_waypoint{i+1}_photo{int(photo_index)+1}.jpg"
             try:
-                zip_data = json.loads(zip_data)
-                print("Successfully parsed zip_data from JSON string")
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse zip_data JSON: {e}")
-                return jsonify({'error': 'Invalid zip_data format'}), 400
-        
-        if not quest_data:
-            return jsonify({'error': 'Quest data is required'}), 400
-        
-        # Validate quest name
-        quest_name = quest_data.get('name', '').strip()
-        print(f"Received quest name: '{quest_name}' (length: {len(quest_name)})")
-        if not quest_name:
-            return jsonify({'error': 'Quest name is required and cannot be empty'}), 400
-        
-        if len(quest_name) < 3:
-            return jsonify({'error': 'Quest name must be at least 3 characters long'}), 400
-        
-        if len(quest_name) > 100:
-            return jsonify({'error': 'Quest name must be less than 100 characters'}), 400
-        
-        # Validate that each waypoint has at least one photo
-        for i, cp in enumerate(quest_data.get('checkpoints', [])):
-            if cp.get('lat') and cp.get('lng'):
-                waypoint_photos = zip_data.get('photos', {}).get(str(i), {})
-                if not isinstance(waypoint_photos, dict):
-                    print(f"Warning: waypoint_photos for waypoint {i} is not a dict: {type(waypoint_photos)}")
-                    waypoint_photos = {}
-                photo_count = len([p for p in waypoint_photos.values() if p and isinstance(p, dict) and p.get('data')])
-                if photo_count == 0:
-                    return jsonify({'error': f'Waypoint {i+1} must have at least one photo'}), 400
-        
-        # Create a safe quest folder name
-        safe_name = re.sub(r'[^a-zA-Z0-9]', '_', quest_name)
-        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        quest_folder = f"{safe_name}_{timestamp}"
-        quest_folder_path = os.path.join(QUESTS_DIR, quest_folder)
-        quest_filename = f"{safe_name}_{timestamp}.json"
-        
-        # Create quest folder
-        try:
-            os.makedirs(quest_folder_path, exist_ok=True)
-            print(f"✅ Created quest folder: {quest_folder}")
-        except Exception as e:
-            print(f"Error creating quest folder: {e}")
-            return jsonify({'error': 'Failed to create quest folder'}), 500
-        
-        # Process photos and save them as JPEG files
-        saved_images = []
-        waypoints_with_photos = []
-        
-        for i, cp in enumerate(quest_data.get('checkpoints', [])):
-            if cp.get('lat') and cp.get('lng'):
-                waypoint_images = []
-                
-                # Get photos for this waypoint from zip_data
-                waypoint_photos = zip_data.get('photos', {}).get(str(i), {})
-                if not isinstance(waypoint_photos, dict):
-                    print(f"Warning: waypoint_photos for waypoint {i} is not a dict: {type(waypoint_photos)}")
-                    waypoint_photos = {}
-                
-                for photo_index, photo_data in waypoint_photos.items():
-                    if photo_data and isinstance(photo_data, dict) and photo_data.get('data'):
-                        # Extract base64 image data
-                        image_data = photo_data['data']
-                        if image_data.startswith('data:image'):
-                            image_data = image_data.split(',')[1]
-                        
-                        try:
-                            # Decode base64 and save as JPEG
-                            image_bytes = base64.b64decode(image_data)
-                            image_filename = f"{safe_name}_{timestamp}_waypoint{i+1}_photo{int(photo_index)+1}.jpg"
-                            
-                            # Save image file
-                            image_filepath = os.path.join(quest_folder_path, image_filename)
-                            with open(image_filepath, 'wb') as f:
-                                f.write(image_bytes)
-                            
-                            waypoint_images.append(image_filename)
-                            saved_images.append(image_filename)
-                            print(f"✅ Saved image: {image_filename}")
-                            
-                        except Exception as e:
-                            print(f"Error saving image for waypoint {i+1}, photo {photo_index}: {e}")
-                            continue  # Skip this image but continue with others
-                
-                waypoints_with_photos.append({
-                    'id': i + 1,  # Sequential waypoint number
-                    'name': cp.get('name', f'Waypoint {i+1}'),
-                    'clue': cp.get('clue', f'Find waypoint {i+1}'),
-                    'lat': cp.get('lat', 0),
-                    'lng': cp.get('lng', 0),
-                    'funFact': cp.get('funFact', ''),
-                    'answerImage': waypoint_images if waypoint_images else []  # Include all images as an array
-                })
-        
-        # Generate the quest file content as JSON
+                store_quest_photo(photo, os.path.join(quest_folder_path, image_filename))
+            except Exception as e:
+                # Skip this image but keep the others
+                job.warn(f"Could not save photo {photo_index} of waypoint {i+1}: {e}")
+                return None
+            return image_filename
+
+        job.start_stage('photos', len(photo_items))
+        saved = ingestion.map(job, save_photo, photo_items)
+        waypoint_images = {}
+        for (i, _, _), image_filename in zip(photo_items, saved):
+            if image_filename:
+                waypoint_images.setdefault(i, []).append(image_filename)
+        saved_images = [name for name in saved if name]
+        if photo_items and not saved_images:
+            raise ValueError("None of the submitted photos could be read")
+
+        # Upright model and display copies, before the embeddings that read them
+        image_paths = [os.path.join(quest_folder_path, name) for name in saved_images]
+        job.start_stage('renditions', len(image_paths))
+        rendition_store.ensure_many(image_paths, lambda fn, paths: ingestion.map(job, fn, paths))
+
+        job.start_stage('normalize', 1)
         quest_json_data = {
             'id': quest_data.get('id', int(time.time() * 1000)), # Use provided ID or generate timestamp
             'name': quest_name,
@@ -546,15 +985,15 @@ def submit_quest():
             'enabled': quest_data.get('enabled', True),
             'checkpoints': [
                 {
-                    'id': wp['id'],
-                    'name': wp['name'],
-                    'clue': wp['clue'],
-                    'lat': wp['lat'],
-                    'lng': wp['lng'],
-                    'funFact': wp.get('funFact', ''),
-                    'answerImage': wp['answerImage'] if wp['answerImage'] else []
+                    'id': n + 1,  # Sequential waypoint number
+                    'name': cp.get('name', f'Waypoint {i+1}'),
+                    'clue': cp.get('clue', f'Find waypoint {i+1}'),
+                    'lat': cp.get('lat', 0),
+                    'lng': cp.get('lng', 0),
+                    'funFact': cp.get('funFact', ''),
+                    'answerImage': waypoint_images.get(i, [])  # Include all images as an array
                 }
-                for wp in waypoints_with_photos
+                for n, (i, cp) in enumerate(waypoints)
             ],
             'leaderboard': quest_data.get('leaderboard', {
                 'entries': [],
@@ -567,39 +1006,206 @@ def submit_quest():
                 'ratings': []
             })
         }
+        job.advance()
+
+        # Embed the new answer images now so the first compare doesn't pay for it;
+        # concurrent embeddings are batched by the inference scheduler
+        job.start_stage('embeddings', len(image_paths) if backend is not None else 0)
+        if backend is not None:
+            try:
+                embedding_store.precompute(image_paths, lambda fn, paths: ingestion.map(job, fn, paths))
+            except Exception as e:
+                job.warn(f"Could not precompute embeddings: {e}")
+
+        # Writing the quest definition is what makes it visible in /api/quests
+        job.start_stage('publish', 1)
+        for image_path in image_paths:
+            answer_index.add(image_path)
+        storage.save_quest(quest_json_data, quest_folder_path, quest_filename)
+        if identify_index.synced:
+            # Only the new answer photos are added; their embeddings are already stored
+            try:
+                identify_index.sync()
+            except Exception as e:
+                job.warn(f"Could not update the identify index: {e}")
+        job.advance()
+    except BaseException:
+        shutil.rmtree(quest_folder_path, ignore_errors=True)
+        raise
+    finally:
+        if upload is not None:
+            upload.cleanup()
+
+    print(f"🎉 Quest ingested: {quest_filename} ({len(saved_images)} images)")
+    return {
+        'questId': str(quest_json_data['id']),
+        'questFile': quest_filename,
+        'savedImages': saved_images,
+        'waypointsCount': len(waypoints)
+    }
+
+def validate_submission(quest_data, zip_data):
+    """Return an error message for a submission that can't be ingested, or None"""
+    if not quest_data or not isinstance(quest_data, dict):
+        return 'Quest data is required'
+    
+    # Validate quest name
+    quest_name = str(quest_data.get('name', '')).strip()
+    print(f"Received quest name: '{quest_name}' (length: {len(quest_name)})")
+    if not quest_name:
+        return 'Quest name is required and cannot be empty'
+    
+    if len(quest_name) < 3:
+        return 'Quest name must be at least 3 characters long'
+    
+    if len(quest_name) > 100:
+        return 'Quest name must be less than 100 characters'
+    
+    # Validate that each waypoint has at least one photo
+    for i, cp in enumerate(quest_data.get('checkpoints', [])):
+        if cp.get('lat') and cp.get('lng') and not submitted_photos(zip_data, i):
+            return f'Waypoint {i+1} must have at least one photo'
+    return None
+
+@app.route('/api/submit-quest', methods=['POST', 'OPTIONS'])
+def submit_quest():
+    """Validate a new quest and queue it for ingestion; returns a job id (202).
+
+    Accepts JSON ({questData, zipData: {photos}} with base64 photos) or
+    multipart/form-data with a questData JSON field and one file part per
+    photo named photos.<waypoint>.<photo>, which is streamed to disk.
+    """
+    if request.method == 'OPTIONS':
+        # Handle preflight request
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, ngrok-skip-browser-warning')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        return response
+    
+    upload = None
+    try:
+        # Ensure quests directory exists
+        if not ensure_quests_dir():
+            return jsonify({'error': 'Failed to create quests directory'}), 500
         
-        quest_file_content = json.dumps(quest_json_data, indent=2)
+        if request.mimetype == 'multipart/form-data':
+            try:
+                upload = parse_quest_upload(request.stream, request.mimetype, request.content_length,
+                                            request.mimetype_params, UPLOAD_DIR)
+                quest_data = json.loads(upload.form.get('questData') or 'null')
+            except RequestEntityTooLarge:
+                return jsonify({'error': 'questData is too large'}), 413
+            except ValueError as e:
+                print(f"Invalid multipart submission: {e}")
+                return jsonify({'error': 'Invalid multipart submission'}), 400
+            zip_data = {'photos': upload.photos}
+        else:
+            data = request.json
+            if not data:
+                return jsonify({'error': 'No data provided'}), 400
+            
+            quest_data = data.get('questData')
+            zip_data = data.get('zipData')
+            
+            if isinstance(zip_data, str):
+                try:
+                    zip_data = json.loads(zip_data)
+                except json.JSONDecodeError as e:
+                    print(f"Failed to parse zip_data JSON: {e}")
+                    return jsonify({'error': 'Invalid zip_data format'}), 400
+            if not isinstance(zip_data, dict):
+                zip_data = {}
         
-        # Save the quest file
-        quest_filepath = os.path.join(quest_folder_path, quest_filename)
-        if not save_quest_file(quest_file_content, quest_filepath):
-            return jsonify({'error': 'Failed to save quest file'}), 500
+        error = validate_submission(quest_data, zip_data)
+        if error:
+            return jsonify({'error': error}), 400
         
-
+        # Create a safe quest folder name
+        quest_name = quest_data['name'].strip()
+        safe_name = re.sub(r'[^a-zA-Z0-9]', '_', quest_name)
+        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        quest_folder = claim_quest_folder(safe_name, timestamp)
         
-        print(f"🎉 Quest submitted successfully: {quest_filename}")
-        print(f"📸 Saved {len(saved_images)} images")
+        try:
+            job = ingestion.submit(INGEST_STAGES, ingest_quest, quest_data, zip_data, quest_folder, upload)
+        except BaseException:
+            os.rmdir(os.path.join(QUESTS_DIR, quest_folder))
+            raise
+        upload = None  # the job owns the staged photos now
+        print(f"📥 Quest {quest_folder} queued for ingestion as job {job.id}")
         
-        return jsonify({
+        response = jsonify({
             'success': True,
-            'message': 'Quest submitted successfully',
-            'questFile': quest_filename,
-            'savedImages': saved_images,
-            'waypointsCount': len(waypoints_with_photos)
+            'message': 'Quest accepted for processing',
+            'jobId': job.id,
+            'status': job.status,
+            'statusUrl': f"/api/submit-quest/{job.id}",
+            'questFile': f"{quest_folder}.json"
         })
+        response.status_code = 202
+        response.headers['Location'] = f"/api/submit-quest/{job.id}"
+        return response
         
     except Exception as e:
         print(f"Error submitting quest: {e}")
         return jsonify({'error': 'Internal server error'}), 500
+    finally:
+        if upload is not None:
+            upload.cleanup()
+
+@app.route('/api/submit-quest/<job_id>', methods=['GET'])
+def get_submission_status(job_id):
+    """Progress of a quest submission; status is queued, running, ready or failed"""
+    status = ingestion.get_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(status)
+
+def build_quest_catalog():
+    """Serialize the list of all available quests for /api/quests"""
+    quests = []
+    for summary in storage.list_quests():
+        # Generate a sequential numeric ID for the list
+        quest_id = len(quests) + 1
+        raw_id = summary['raw_id']
+        if summary['is_json']:
+            raw_id = raw_id or quest_id
+            quest_id_str = str(raw_id) if isinstance(raw_id, int) else raw_id
+        else:
+            # Use the original ID as a string identifier
+            quest_id_str = raw_id if raw_id else f"quest_{quest_id}"
+        
+        quests.append({
+            'id': quest_id,
+            'id_string': quest_id_str,
+            'name': summary['name'],
+            'description': summary['description'],
+            'difficulty': summary['difficulty'],
+            'ageGroup': summary['ageGroup'],
+            'distance': summary['distance'],
+            'waypoints': summary['waypoints'],
+            'folder': summary['folder'],
+            'filename': summary['filename'],
+            'rating': summary['rating'],
+            'enabled': summary['enabled']
+        })
+    
+    # Sort quests by ID
+    quests.sort(key=lambda x: x['id'])
+    return app.json.dumps(quests).encode('utf-8')
+
+# Serialized /api/quests response, rebuilt only when the catalog changes
+quest_catalog = CatalogCache(storage.catalog_version, build_quest_catalog)
 
 @app.route('/api/quests', methods=['GET', 'OPTIONS'])
 def get_all_quests():
-    """Get a list of all available quests"""
+    """Get a list of all available quests (supports If-None-Match)"""
     if request.method == 'OPTIONS':
         # Handle preflight request
         response = jsonify({'status': 'ok'})
         response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, ngrok-skip-browser-warning')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, ngrok-skip-browser-warning, If-None-Match')
         response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         return response
     
@@ -607,100 +1213,13 @@ def get_all_quests():
         if not ensure_quests_dir():
             return jsonify({'error': 'Failed to create quests directory'}), 500
         
-        quests = []
-        if os.path.exists(QUESTS_DIR):
-            for quest_folder in os.listdir(QUESTS_DIR):
-                quest_path = os.path.join(QUESTS_DIR, quest_folder)
-                
-                # Check if it's a directory
-                if os.path.isdir(quest_path):
-                    # Look for .json files in the quest folder (preferred) or .js files (fallback)
-                    # Exclude metadata files
-                    json_files = [f for f in os.listdir(quest_path) if f.endswith('.json') and not f.endswith('_metadata.json')]
-                    js_files = [f for f in os.listdir(quest_path) if f.endswith('.js')]
-                    
-                    # Use JSON files if available, otherwise fall back to JS files
-                    quest_files = json_files if json_files else js_files
-                    
-                    for quest_file in quest_files:
-                        try:
-                            filepath = os.path.join(quest_path, quest_file)
-                            is_json = quest_file.endswith('.json')
-                            
-                            if is_json:
-                                # Load JSON file directly
-                                with open(filepath, 'r', encoding='utf-8') as f:
-                                    quest_data = json.load(f)
-                                
-                                # Extract quest info from JSON
-                                quest_id = quest_data.get('id', len(quests) + 1)
-                                quest_id_str = str(quest_id) if isinstance(quest_id, int) else quest_id
-                                waypoint_count = len(quest_data.get('checkpoints', []))
-                                
-                                quests.append({
-                                    'id': len(quests) + 1,  # Sequential ID for the list
-                                    'id_string': quest_id_str,
-                                    'name': quest_data.get('name', ''),
-                                    'description': quest_data.get('description', ''),
-                                    'difficulty': quest_data.get('difficulty', 'Medium'),
-                                    'ageGroup': quest_data.get('ageGroup', 'All Ages'),
-                                    'distance': quest_data.get('distance', 'Unknown'),
-                                    'waypoints': waypoint_count,
-                                    'folder': quest_folder,
-                                    'filename': quest_file,
-                                    'rating': quest_data.get('rating', 0),
-                                    'enabled': quest_data.get('enabled', True)
-                                })
-                            else:
-                                # Handle JS files (legacy support)
-                                with open(filepath, 'r', encoding='utf-8') as f:
-                                    content = f.read()
-                                
-                                # Extract quest info from the file content
-                                name_match = re.search(r"name: '([^']+)'", content)
-                                description_match = re.search(r"description: '([^']+)'", content)
-                                difficulty_match = re.search(r"difficulty: '([^']+)'", content)
-                                age_group_match = re.search(r"ageGroup: '([^']+)'", content)
-                                distance_match = re.search(r"distance: '([^']+)'", content)
-                                
-                                # Try to extract ID - support both numeric and string IDs
-                                id_match = re.search(r"id: '([^']+)'", content)  # String ID
-                                if not id_match:
-                                    id_match = re.search(r"id: ([0-9]+)", content)  # Numeric ID
-                                
-                                if name_match:
-                                    # Count waypoints by looking for checkpoint entries
-                                    waypoint_count = len(re.findall(r"id: [0-9]+", content)) - 1  # Subtract 1 for quest id
-                                    
-                                    # Generate a numeric ID for the quest list
-                                    quest_id = len(quests) + 1
-                                    if id_match:
-                                        # Use the original ID as a string identifier
-                                        quest_id_str = id_match.group(1)
-                                    else:
-                                        quest_id_str = f"quest_{quest_id}"
-                                    
-                                    quests.append({
-                                        'id': quest_id,
-                                        'id_string': quest_id_str,
-                                        'name': name_match.group(1),
-                                        'description': description_match.group(1) if description_match else '',
-                                        'difficulty': difficulty_match.group(1) if difficulty_match else 'Medium',
-                                        'ageGroup': age_group_match.group(1) if age_group_match else 'All Ages',
-                                        'distance': distance_match.group(1) if distance_match else 'Unknown',
-                                        'waypoints': waypoint_count,
-                                        'folder': quest_folder,
-                                        'filename': quest_file,
-                                        'rating': 0,  # JS files don't have ratings yet
-                                        'enabled': True
-                                    })
-                        except Exception as e:
-                            print(f"Error reading quest file {js_file} in {quest_folder}: {e}")
-                            continue
-        
-        # Sort quests by ID
-        quests.sort(key=lambda x: x['id'])
-        return jsonify(quests)
+        body, etag = quest_catalog.get()
+        response = app.response_class(body, mimetype=app.json.mimetype)
+        response.set_etag(etag)
+        # Let browsers keep the catalog but revalidate it on every poll
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Access-Control-Expose-Headers'] = 'ETag'
+        return response.make_conditional(request)
         
     except Exception as e:
         print(f"Error getting quests: {e}")
@@ -722,102 +1241,20 @@ def get_quest_by_id(quest_id):
             return jsonify({'error': 'Failed to create quests directory'}), 500
         
         print(f"🔍 Looking for quest with ID: {quest_id}")
-        print(f"📁 QUESTS_DIR: {QUESTS_DIR}")
-        print(f"📁 QUESTS_DIR exists: {os.path.exists(QUESTS_DIR)}")
         
-        if os.path.exists(QUESTS_DIR):
-            quest_folders = os.listdir(QUESTS_DIR)
-            print(f"📁 Found quest folders: {quest_folders}")
-            
-            for quest_folder in quest_folders:
-                quest_path = os.path.join(QUESTS_DIR, quest_folder)
-                
-                # Check if it's a directory
-                if os.path.isdir(quest_path):
-                    # Look for .json files in the quest folder (preferred) or .js files (fallback)
-                    # Exclude metadata files
-                    json_files = [f for f in os.listdir(quest_path) if f.endswith('.json') and not f.endswith('_metadata.json')]
-                    js_files = [f for f in os.listdir(quest_path) if f.endswith('.js')]
-                    
-                    # Use JSON files if available, otherwise fall back to JS files
-                    quest_files = json_files if json_files else js_files
-                    
-                    for quest_file in quest_files:
-                        try:
-                            filepath = os.path.join(quest_path, quest_file)
-                            is_json = quest_file.endswith('.json')
-                            
-                            if is_json:
-                                # Load JSON file directly
-                                with open(filepath, 'r', encoding='utf-8') as f:
-                                    quest_data = json.load(f)
-                                
-                                # Check if this quest matches the requested ID
-                                quest_id_from_file = quest_data.get('id')
-                                quest_found = False
-                                
-                                if quest_id_from_file:
-                                    quest_id_str = str(quest_id_from_file)
-                                    print(f"🔍 Comparing JSON quest_id_str='{quest_id_str}' with requested quest_id='{quest_id}'")
-                                    # Try to match by string ID or numeric ID
-                                    if quest_id.isdigit():
-                                        # Requested ID is numeric
-                                        quest_found = (quest_id_str == quest_id or quest_id_str == f"quest_{quest_id}")
-                                        print(f"  Numeric comparison: quest_found={quest_found}")
-                                    else:
-                                        # Requested ID is string
-                                        quest_found = (quest_id_str == quest_id)
-                                        print(f"  String comparison: quest_found={quest_found}")
-                                else:
-                                    print(f"❌ No ID found in JSON quest file {quest_file}")
-                                
-                                if quest_found:
-                                    # Found the quest, return the JSON data
-                                    return jsonify({
-                                        'id': quest_id,
-                                        'content': json.dumps(quest_data, indent=2),
-                                        'folder': quest_folder,
-                                        'filename': quest_file
-                                    })
-                            else:
-                                # Handle JS files (legacy support)
-                                with open(filepath, 'r', encoding='utf-8') as f:
-                                    content = f.read()
-                                
-                                # Extract quest info from the file content
-                                # Try to extract ID - support both numeric and string IDs
-                                id_match = re.search(r"id: '([^']+)'", content)  # String ID
-                                if not id_match:
-                                    id_match = re.search(r"id: ([0-9]+)", content)  # Numeric ID
-                                
-                                # Check if this quest matches the requested ID
-                                quest_found = False
-                                if id_match:
-                                    quest_id_str = id_match.group(1)
-                                    print(f"🔍 Comparing JS quest_id_str='{quest_id_str}' with requested quest_id='{quest_id}'")
-                                    # Try to match by string ID or numeric ID
-                                    if quest_id.isdigit():
-                                        # Requested ID is numeric
-                                        quest_found = (quest_id_str == quest_id or quest_id_str == f"quest_{quest_id}")
-                                        print(f"  Numeric comparison: quest_found={quest_found}")
-                                    else:
-                                        # Requested ID is string
-                                        quest_found = (quest_id_str == quest_id)
-                                        print(f"  String comparison: quest_found={quest_found}")
-                                else:
-                                    print(f"❌ No ID found in JS quest file {quest_file}")
-                                
-                                if quest_found:
-                                    # Found the quest, return the full content
-                                    return jsonify({
-                                        'id': quest_id,
-                                        'content': content,
-                                        'folder': quest_folder,
-                                        'filename': quest_file
-                                    })
-                        except Exception as e:
-                            print(f"Error reading quest file {quest_file} in {quest_folder}: {e}")
-                            continue
+        try:
+            quest = storage.get_quest(quest_id)
+        except Exception as e:
+            print(f"Error reading quest {quest_id}: {e}")
+            quest = None
+        if quest:
+            # Found the quest, return the JSON data or the full JS content
+            return jsonify({
+                'id': quest_id,
+                'content': quest['content'],
+                'folder': quest['folder'],
+                'filename': quest['filename']
+            })
         
         return jsonify({'error': 'Quest not found'}), 404
         
@@ -841,93 +1278,53 @@ def rate_quest(quest_id):
             return jsonify({'error': 'Rating is required'}), 400
         
         rating = data['rating']
-        if not isinstance(rating, int) or rating < 1 or rating > 5:
+        if isinstance(rating, bool) or not isinstance(rating, int) or rating < 1 or rating > 5:
             return jsonify({'error': 'Rating must be an integer between 1 and 5'}), 400
         
         print(f"⭐ Rating quest {quest_id} with {rating} stars")
         
-        # Find the quest file by checking the ID in the JSON content
-        quest_file_path = None
-        if os.path.exists(QUESTS_DIR):
-            for quest_folder in os.listdir(QUESTS_DIR):
-                quest_path = os.path.join(QUESTS_DIR, quest_folder)
-                if os.path.isdir(quest_path):
-                    # Look for JSON files
-                    json_files = [f for f in os.listdir(quest_path) if f.endswith('.json')]
-                    for json_file in json_files:
-                        file_path = os.path.join(quest_path, json_file)
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                quest_data = json.load(f)
-                                # Check if the quest ID matches
-                                if str(quest_data.get('id')) == str(quest_id):
-                                    quest_file_path = file_path
-                                    break
-                        except Exception as e:
-                            print(f"Error reading quest file {json_file}: {e}")
-                            continue
-                    if quest_file_path:
-                        break
-        
-        if not quest_file_path or not os.path.exists(quest_file_path):
+        result = storage.add_rating(quest_id, rating)
+        if result is None:
             return jsonify({'error': 'Quest not found'}), 404
+        average_rating, total_ratings = result['average'], result['count']
         
-        # Load the quest data
-        with open(quest_file_path, 'r', encoding='utf-8') as f:
-            quest_data = json.load(f)
-        
-        # Get or create leaderboard data
-        leaderboard_data = quest_data.get('leaderboard', {})
-        if not leaderboard_data:
-            leaderboard_data = {
-                'entries': [],
-                'stats': {
-                    'total_completions': 0,
-                    'average_time': 0,
-                    'best_time': None,
-                    'last_updated': None
-                }
-            }
-        
-        # Get or create ratings array
-        ratings = leaderboard_data.get('ratings', [])
-        if not ratings:
-            ratings = []
-        
-        # Add the new rating
-        ratings.append({
-            'rating': rating,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-        # Calculate new average rating
-        if ratings:
-            total_rating = sum(r['rating'] for r in ratings)
-            average_rating = round(total_rating / len(ratings), 1)
-        else:
-            average_rating = 0
-        
-        # Update the quest data
-        leaderboard_data['ratings'] = ratings
-        quest_data['leaderboard'] = leaderboard_data
-        quest_data['rating'] = average_rating
-        
-        # Save the updated quest file
-        with open(quest_file_path, 'w', encoding='utf-8') as f:
-            json.dump(quest_data, f, indent=2, ensure_ascii=False)
-        
-        print(f"✅ Updated quest {quest_id} rating to {average_rating} (based on {len(ratings)} ratings)")
+        print(f"✅ Updated quest {quest_id} rating to {average_rating} (based on {total_ratings} ratings)")
         
         return jsonify({
             'message': 'Rating submitted successfully',
             'new_average_rating': average_rating,
-            'total_ratings': len(ratings)
+            'total_ratings': total_ratings,
+            'rating_histogram': result['histogram']
         })
         
     except Exception as e:
         print(f"Error rating quest {quest_id}: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/answer-images/<filename>', methods=['GET'])
+def get_answer_image(filename):
+    """Serve an answer photo for display, upright and no larger than needed.
+
+    ?width=<px> is the longest side the client will draw (default 1280);
+    the smallest rendition covering it is sent, or the original if none
+    does. ?folder=<quest folder> picks between photos with the same name.
+    """
+    try:
+        width = int(request.args.get('width', 1280))
+        if width <= 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'width must be a positive integer'}), 400
+    
+    try:
+        original = find_answer_image_path(filename, request.args.get('folder'))
+    except (ValueError, FileNotFoundError):
+        return jsonify({'error': 'Answer image not found'}), 404
+    
+    path = rendition_store.best_path(original, max_side=width)
+    # Renditions are rebuilt under the same name when the photo changes; let clients revalidate
+    return send_file(os.path.abspath(path), max_age=3600, conditional=True)
+
 @app.route('/api/submitted-quests', methods=['GET', 'OPTIONS'])
 def get_submitted_quests():
     """Get a list of all submitted quests (legacy endpoint)"""
@@ -955,20 +1352,15 @@ def get_submitted_quests():
                     
                     for js_file in js_files:
                         try:
-                            filepath = os.path.join(quest_path, js_file)
-                            with open(filepath, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                            
-                            # Extract quest info from the file content
-                            name_match = re.search(r"name: '([^']+)'", content)
-                            description_match = re.search(r"description: '([^']+)'", content)
+                            # Parsed once per file version, then served from memory
+                            quest_data = load_legacy_quest(os.path.join(quest_path, js_file))
                             
-                            if name_match:
+                            if quest_data.get('name'):
                                 quests.append({
                                     'filename': js_file,
-                                    'name': name_match.group(1),
-                                    'description': description_match.group(1) if description_match else '',
-                                    'waypoints': len(re.findall(r"name: '", content)) - 1  # Subtract 1 for quest name
+                                    'name': quest_data['name'],
+                                    'description': quest_data['description'],
+                                    'waypoints': len(quest_data['checkpoints'])
                                 })
                         except Exception as e:
                             print(f"Error reading quest file {js_file} in {quest_folder}: {e}")
@@ -986,16 +1378,21 @@ def root():
     return jsonify({
         'message': 'CityQuest Image Comparison Server',
         'status': 'running',
-        'model_loaded': model is not None,
+        'model_loaded': backend is not None,
         'endpoints': {
-            'health': '/health',
+            'health': '/health (liveness)',
+            'ready': '/ready (readiness: 503 until the model is loaded and warmed up)',
+            'metrics': '/metrics',
             'compare': '/compare (supports multiple answer images)',
+            'compare_batch': '/compare/batch (several player photos in one request)',
+            'identify': '/identify (which checkpoint of any quest a photo shows)',
             'leaderboard': {
                 'add_entry': '/leaderboard/<quest_id>/add',
                 'get_leaderboard': '/leaderboard/<quest_id>/get'
             },
             'quests': '/api/quests (get all available quests)',
             'quest_by_id': '/api/quests/<id> (get specific quest)',
+            'answer_image': '/api/answer-images/<filename>?width=<px> (smallest upright rendition that fits)',
             'quest_creator': {
                 'submit_quest': '/api/submit-quest',
                 'get_quests': '/api/submitted-quests'
@@ -1003,13 +1400,69 @@ def root():
         }
     })
 
+def prepare_server():
+    """Build the in-memory indexes and fork the inference processes, if any.
+
+    In a pre-forked server this runs once, in the master. The model itself
+    is loaded by initialize_model(), prepare_workers() or, in the
+    background, start_model().
+    """
+    if INFERENCE_PROCESSES > 0:
+        start_inference_service()
+    answer_index.build()
+    storage.prepare()
+    if hasattr(storage, 'close'):
+        # SQLite connections must not be carried across a fork
+        storage.close()
+
+def prepare_workers():
+    """Load the model and build the identify index in a pre-fork master, so the workers share both.
+
+    The model is loaded single-threaded; each worker sizes its own thread
+    pool after the fork. Embedding the catalog here, once, keeps N workers
+    from each embedding it (and writing the same embedding files) at startup.
+    """
+    try:
+        model_startup.run('load', lambda: load_model(threads=1))
+        model_startup.run('index', build_identify_index)
+    except Exception:
+        pass  # the workers still serve everything but the model and report the error
+    if hasattr(storage, 'close'):
+        storage.close()
+
+def start_worker(number):
+    """Runs in each forked worker before it accepts connections"""
+    if inference_service:
+        print(f"✅ Worker {number}: embedding in {inference_service.processes} inference process(es)")
+    elif backend is not None:
+        threads = INFERENCE_THREADS or prefork.default_threads(WORKERS)
+        backend.set_threads(threads)
+        print(f"✅ Worker {number}: {backend.name} backend with {threads} inference thread(s)")
+    # Warm-up state is per process, so every worker warms up (or waits for the inference processes) itself;
+    # the model and the identify index came from the master
+    start_model()
+
 if __name__ == '__main__':
-    # Initialize model on startup
     print("🚀 Starting CityQuest Image Comparison Server...")
-    initialize_model()
     
     # Get port from environment variable or use default
     port = int(os.environ.get('PORT', 5000))
     
-    print(f"✅ Server ready on port {port}")
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    prepare_server()
+    if WORKERS > 0:
+        prepare_workers()
+        prefork.serve(app, '0.0.0.0', port, WORKERS, on_worker_start=start_worker,
+                      on_child_exit=inference_service.reap if inference_service else None)
+        if inference_service:
+            inference_service.close()
+    else:
+        if inference_service:
+            # No pre-fork master to restart inference processes that die
+            inference_service.monitor()
+        start_model(threads=INFERENCE_THREADS or None)
+        print(f"✅ Server accepting requests on port {port}; the model loads in the background (see /ready)")
+        try:
+            app.run(host='0.0.0.0', port=port)
+        finally:
+            if inference_service:
+                inference_service.close()
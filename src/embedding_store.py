@@ -0,0 +1,144 @@
+"""
+Persistent store of precomputed CLIP embeddings for answer images.
+
+Each quest folder gets one .npz file per model holding a row per answer
+image. Rows are keyed by filename plus the file's mtime and size, so an
+edited or replaced photo is re-embedded automatically. source_fn can point
+the embedding at a smaller copy of the photo (its model rendition) while
+the row stays keyed by the original.
+
+Pre-forked workers each keep their own copy in memory, so a save merges
+the rows on disk under the file's lock instead of overwriting them.
+"""
+
+import os
+import re
+import threading
+
+import numpy as np
+
+from quest_storage import quest_lock
+
+
+def store_filename(model_name):
+    """Name of the per-folder embedding file for a given model"""
+    safe_model = re.sub(r'[^a-zA-Z0-9._-]', '_', model_name)
+    return f".embeddings_{safe_model}.npz"
+
+
+def file_signature(image_path):
+    """Return the (mtime_ns, size) pair used to detect changed images"""
+    st = os.stat(image_path)
+    return st.st_mtime_ns, st.st_size
+
+
+class EmbeddingStore:
+    """Caches answer-image embeddings in memory and on disk, per quest folder"""
+
+    def __init__(self, model_name, embed_fn, source_fn=None):
+        # embed_fn takes raw image bytes and returns a normalized 1-D vector
+        self.model_name = model_name
+        self.embed_fn = embed_fn
+        # source_fn maps an answer image path to the file actually embedded
+        self.source_fn = source_fn
+        self._folders = {}  # folder -> {filename: (mtime_ns, size, vector)}
+        self._lock = threading.Lock()
+
+    def _store_path(self, folder):
+        return os.path.join(folder, store_filename(self.model_name))
+
+    def _load_folder(self, folder):
+        """Load a folder's embedding file into memory (caller holds the lock)"""
+        entries = self._folders.get(folder)
+        if entries is not None:
+            return entries
+
+        entries = {}
+        store_path = self._store_path(folder)
+        if os.path.exists(store_path):
+            try:
+                with np.load(store_path, allow_pickle=False) as data:
+                    if str(data['model']) == self.model_name:
+                        for name, mtime, size, vector in zip(data['names'], data['mtimes'], data['sizes'], data['vectors']):
+                            entries[str(name)] = (int(mtime), int(size), vector)
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable embedding store {store_path}: {e}")
+                entries = {}
+
+        self._folders[folder] = entries
+        return entries
+
+    def _save_folder(self, folder, entries):
+        """Atomically write a folder's embeddings to disk (caller holds the lock and the file's quest_lock)"""
+        names = sorted(entries)
+        store_path = self._store_path(folder)
+        # Unique per process, since pre-forked workers may save the same folder
+        tmp_path = f"{store_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    model=np.array(self.model_name),
+                    names=np.array(names, dtype=str),
+                    mtimes=np.array([entries[n][0] for n in names], dtype=np.int64),
+                    sizes=np.array([entries[n][1] for n in names], dtype=np.int64),
+                    vectors=np.stack([entries[n][2] for n in names]).astype(np.float32) if names else np.zeros((0, 0), dtype=np.float32),
+                )
+            os.replace(tmp_path, store_path)
+        except Exception as e:
+            print(f"⚠️ Could not persist embedding store {store_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _lookup(self, image_path):
+        """Return the cached vector for image_path if it is still fresh"""
+        folder, filename = os.path.split(os.path.abspath(image_path))
+        mtime, size = file_signature(image_path)
+        with self._lock:
+            entry = self._load_folder(folder).get(filename)
+        if entry and entry[0] == mtime and entry[1] == size:
+            return entry[2]
+        return None
+
+    def _compute(self, image_path):
+        """Embed one image file; returns its (mtime_ns, size, vector) entry"""
+        mtime, size = file_signature(image_path)
+        source_path = self.source_fn(image_path) if self.source_fn else image_path
+        with open(source_path, 'rb') as f:
+            vector = np.asarray(self.embed_fn(f.read()), dtype=np.float32).reshape(-1)
+        return mtime, size, vector
+
+    def get_many(self, image_paths, map_fn=map):
+        """Return an (n, dim) matrix of embeddings, computing any missing rows.
+
+        Missing rows are computed with map_fn(fn, paths); pass a parallel map
+        to embed them concurrently. Each folder's store is written once.
+        """
+        vectors = [self._lookup(image_path) for image_path in image_paths]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        computed = {}  # folder -> {filename: entry}
+        for i, entry in zip(missing, map_fn(self._compute, [image_paths[i] for i in missing])):
+            folder, filename = os.path.split(os.path.abspath(image_paths[i]))
+            computed.setdefault(folder, {})[filename] = entry
+            vectors[i] = entry[2]
+
+        for folder, new_entries in computed.items():
+            with self._lock, quest_lock(self._store_path(folder)):
+                # Another process may have stored rows since we loaded the file
+                self._folders.pop(folder, None)
+                entries = self._load_folder(folder)
+                entries.update(new_entries)
+                self._save_folder(folder, entries)
+            print(f"💾 Stored {len(new_entries)} new embedding(s) for {os.path.basename(folder)}")
+
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(vectors)
+
+    def get(self, image_path):
+        """Return the embedding vector for a single answer image"""
+        return self.get_many([image_path])[0]
+
+    def precompute(self, image_paths, map_fn=map):
+        """Fill the store for the given images ahead of the first compare"""
+        self.get_many(image_paths, map_fn)
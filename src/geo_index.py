@@ -0,0 +1,117 @@
+"""
+Spatial index over every quest checkpoint.
+
+/compare can take the player's GPS fix and a quest id instead of trusting
+the answer filenames the client sends. The checkpoints are bucketed into a
+uniform grid of cell_degrees x cell_degrees cells. A radius query only
+looks at the cells overlapping the radius's bounding box and then checks
+the haversine distance of the few checkpoints in them. A player nowhere
+near a checkpoint is rejected before any image is decoded.
+
+Near the poles or across the antimeridian the bounding box spans most
+longitudes, so such queries scan the occupied cells of the latitude band
+instead of walking the box cell by cell.
+
+Like the catalog cache, the index is rebuilt from storage only when its
+version moves; the server keys it on the checkpoints version, so ratings
+don't trigger rebuilds.
+"""
+
+import math
+import threading
+
+EARTH_RADIUS_METERS = 6_371_000
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_METERS / 180
+
+
+def haversine_meters(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoIndex:
+    """Grid index of checkpoints, rebuilt from load_fn() whenever version_fn() changes"""
+
+    def __init__(self, version_fn, load_fn, cell_degrees=0.01):
+        self.version_fn = version_fn  # () -> hashable token
+        self.load_fn = load_fn        # () -> checkpoint dicts with quest_id, lat and lng
+        self.cell_degrees = cell_degrees
+        self._version = None
+        self._cells = None  # (lat cell, lng cell) -> [checkpoint, ...]
+        self._quest_ids = frozenset()  # quests with at least one located checkpoint
+        self._count = 0
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.queries = 0
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees)
+
+    def _current(self):
+        """Return the grid, rebuilding it if the catalog changed"""
+        version = self.version_fn()
+        with self._lock:
+            if self._cells is None or self._version != version:
+                cells = {}
+                quest_ids = set()
+                count = 0
+                for checkpoint in self.load_fn():
+                    cells.setdefault(self._cell(checkpoint['lat'], checkpoint['lng']), []).append(checkpoint)
+                    quest_ids.add(checkpoint['quest_id'])
+                    count += 1
+                self._cells = cells
+                self._quest_ids = frozenset(quest_ids)
+                self._count = count
+                self._version = version
+                self.rebuilds += 1
+            return self._cells
+
+    def locates(self, quest_ids):
+        """Whether any of these quests has a checkpoint with coordinates"""
+        self._current()
+        with self._lock:
+            return not self._quest_ids.isdisjoint(quest_ids)
+
+    def nearby(self, lat, lng, radius_meters, quest_ids=None):
+        """Checkpoints within radius_meters of (lat, lng), nearest first.
+
+        Returns (distance, checkpoint) pairs; quest_ids limits the result to
+        checkpoints of those quests.
+        """
+        cells = self._current()
+        with self._lock:
+            self.queries += 1
+        lat_span = radius_meters / METERS_PER_DEGREE
+        # Longitude degrees shrink towards the poles
+        lng_span = radius_meters / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        min_cell = self._cell(lat - lat_span, lng - lng_span)
+        max_cell = self._cell(lat + lat_span, lng + lng_span)
+        box_cells = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1)
+
+        if lng - lng_span < -180 or lng + lng_span > 180 or box_cells > len(cells):
+            # The box wraps around or holds more cells than are occupied
+            candidates = [points for (cell_lat, _), points in cells.items() if min_cell[0] <= cell_lat <= max_cell[0]]
+        else:
+            candidates = [cells.get((cell_lat, cell_lng), ())
+                          for cell_lat in range(min_cell[0], max_cell[0] + 1)
+                          for cell_lng in range(min_cell[1], max_cell[1] + 1)]
+
+        found = []
+        for points in candidates:
+            for checkpoint in points:
+                if quest_ids is not None and checkpoint['quest_id'] not in quest_ids:
+                    continue
+                distance = haversine_meters(lat, lng, checkpoint['lat'], checkpoint['lng'])
+                if distance <= radius_meters:
+                    found.append((distance, checkpoint))
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {'checkpoints': self._count, 'cells': len(self._cells or ()),
+                    'rebuilds': self.rebuilds, 'queries': self.queries}
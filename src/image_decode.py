@@ -0,0 +1,31 @@
+"""
+Image decoding for the model input path.
+
+CLIP only ever sees 224x224 pixels, so fully decoding a 12-megapixel phone
+JPEG is wasted work. For JPEGs we use PIL's draft mode, which makes libjpeg
+scale the image down by 1/2, 1/4 or 1/8 in the DCT domain while decoding.
+The result is the smallest such scale that still keeps both sides at or
+above the requested size, and the processor's own resize does the rest.
+Phone photos are turned upright from their EXIF orientation, like the
+answer-photo renditions the model sees on the other side.
+"""
+
+import io
+
+from PIL import Image, ImageOps
+
+CLIP_INPUT_SIZE = 224
+
+
+def decode_image(image_source, min_side=CLIP_INPUT_SIZE):
+    """Decode raw bytes or a binary file object to an RGB image.
+
+    JPEGs are decoded at reduced resolution with both sides >= min_side;
+    other formats, or min_side=0, get a full decode.
+    """
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        image_source = io.BytesIO(image_source)
+    image = Image.open(image_source)
+    if min_side and image.format == 'JPEG':
+        image.draft('RGB', (min_side, min_side))
+    return ImageOps.exif_transpose(image.convert('RGB'))
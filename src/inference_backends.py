@@ -0,0 +1,217 @@
+"""
+Pluggable inference backends for CLIP image embeddings.
+
+Every backend exposes the same two steps used by get_embedding():
+preprocess(image) turns a PIL image into a (1, 3, 224, 224) float32 array,
+and embed_batch(pixel_values) turns an (n, 3, 224, 224) array into n
+L2-normalized embedding rows. Backends are picked by name:
+
+- torch: PyTorch fp32, the reference implementation
+- int8:  PyTorch with dynamically quantized int8 Linear layers
+- onnx:  ONNX Runtime running an exported copy of the vision encoder
+
+By default only the vision tower and projection are loaded, together with
+the image processor; the text tower and tokenizer are never used for image
+embeddings. torch, transformers and onnxruntime are only imported when a
+backend that needs them is created.
+
+threads caps the intra-op threads of one forward pass. A pre-forked server
+loads the model with one thread and then calls set_threads() in each
+worker, so the workers together use about one thread per core.
+
+The first forward passes of a freshly loaded backend are slow (lazy
+initialization, allocator pools growing to the batch size); warm_up() pays
+for them at startup instead of on the first requests.
+"""
+
+import os
+import re
+import time
+
+import numpy as np
+
+BACKENDS = ('torch', 'int8', 'onnx')
+
+
+def normalize_rows(features):
+    """L2-normalize each row so dot products are cosine similarities"""
+    features = np.asarray(features, dtype=np.float32)
+    return features / np.linalg.norm(features, axis=-1, keepdims=True)
+
+
+def load_image_processor(model_name, vision_only=True):
+    """Load the image preprocessing side of CLIPProcessor, or the full processor"""
+    if vision_only:
+        from transformers import CLIPImageProcessor
+        return CLIPImageProcessor.from_pretrained(model_name)
+    from transformers import CLIPProcessor
+    return CLIPProcessor.from_pretrained(model_name)
+
+
+def load_vision_model(model_name, vision_only=True):
+    """Load a model exposing vision_model and visual_projection.
+
+    In vision-only mode the text tower's weights are skipped entirely.
+    Safetensors checkpoints are memory-mapped, so the weights are paged in
+    from the file rather than copied through a second buffer.
+    """
+    if vision_only:
+        from transformers import CLIPVisionModelWithProjection as model_class
+    else:
+        from transformers import CLIPModel as model_class
+    model = model_class.from_pretrained(model_name, low_cpu_mem_usage=True)
+    model.eval()
+    return model
+
+
+class TorchBackend:
+    """PyTorch fp32 CLIP vision encoder on CPU"""
+
+    name = 'torch-fp32'
+
+    def __init__(self, model_name, vision_only=True, threads=None):
+        import torch
+
+        self.torch = torch
+        if threads:
+            self.set_threads(threads)
+        self.model_name = model_name
+        self.vision_only = vision_only
+        self.processor = load_image_processor(model_name, vision_only)
+        self.model = self._load_model()
+
+    def _load_model(self):
+        return load_vision_model(self.model_name, self.vision_only)
+
+    def set_threads(self, threads):
+        """Limit the intra-op threads of a forward pass"""
+        self.torch.set_num_threads(threads)
+
+    def preprocess(self, image):
+        """Resize, crop and normalize a PIL image into model input"""
+        return self.processor(images=image, return_tensors="np")["pixel_values"].astype(np.float32)
+
+    def embed_batch(self, pixel_values):
+        """Embed a batch of preprocessed images in one forward pass"""
+        with self.torch.no_grad():
+            # Vision tower + projection is what get_image_features computes
+            pooled = self.model.vision_model(pixel_values=self.torch.from_numpy(pixel_values)).pooler_output
+            features = self.model.visual_projection(pooled)
+        return normalize_rows(features.numpy())
+
+
+class Int8Backend(TorchBackend):
+    """PyTorch CLIP with Linear layers dynamically quantized to int8"""
+
+    name = 'torch-int8'
+
+    def _load_model(self):
+        model = super()._load_model()
+        return self.torch.ao.quantization.quantize_dynamic(model, {self.torch.nn.Linear}, dtype=self.torch.qint8)
+
+
+def default_onnx_path(model_name):
+    """Where the exported ONNX vision encoder is cached"""
+    cache_dir = os.environ.get('ONNX_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'cityquest', 'onnx'))
+    return os.path.join(cache_dir, re.sub(r'[^a-zA-Z0-9._-]', '_', model_name) + '.onnx')
+
+
+def export_onnx(model_name, onnx_path):
+    """Export the CLIP vision encoder and projection to an ONNX file"""
+    import torch
+
+    class VisionEmbedder(torch.nn.Module):
+        def __init__(self, clip_model):
+            super().__init__()
+            self.vision_model = clip_model.vision_model
+            self.visual_projection = clip_model.visual_projection
+
+        def forward(self, pixel_values):
+            return self.visual_projection(self.vision_model(pixel_values=pixel_values).pooler_output)
+
+    model = load_vision_model(model_name)
+    embedder = VisionEmbedder(model)
+    size = model.config.image_size
+
+    os.makedirs(os.path.dirname(onnx_path) or '.', exist_ok=True)
+    tmp_path = f"{onnx_path}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            embedder,
+            (torch.zeros(1, 3, size, size),),
+            tmp_path,
+            input_names=['pixel_values'],
+            output_names=['image_embeds'],
+            dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+            opset_version=17,
+        )
+    os.replace(tmp_path, onnx_path)
+    print(f"✅ Exported ONNX vision encoder to {onnx_path}")
+
+
+class OnnxBackend:
+    """ONNX Runtime running the exported CLIP vision encoder"""
+
+    name = 'onnx'
+
+    def __init__(self, model_name, onnx_path=None, threads=None):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise RuntimeError("The onnx backend needs onnxruntime: pip install onnxruntime") from e
+
+        self.onnxruntime = onnxruntime
+        self.model_name = model_name
+        self.processor = load_image_processor(model_name)
+
+        onnx_path = onnx_path or os.environ.get('ONNX_MODEL_PATH') or default_onnx_path(model_name)
+        if not os.path.exists(onnx_path):
+            print(f"📦 No ONNX export at {onnx_path}, exporting {model_name}...")
+            export_onnx(model_name, onnx_path)
+
+        self.onnx_path = onnx_path
+        self.set_threads(threads)
+
+    def set_threads(self, threads):
+        """(Re)create the session with this many intra-op threads (None: one per core).
+
+        Session thread pools don't survive a fork, so a forked worker always
+        gets a session of its own.
+        """
+        options = self.onnxruntime.SessionOptions()
+        options.graph_optimization_level = self.onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = self.onnxruntime.InferenceSession(self.onnx_path, options, providers=['CPUExecutionProvider'])
+
+    def preprocess(self, image):
+        """Resize, crop and normalize a PIL image into model input"""
+        return self.processor(images=image, return_tensors="np")["pixel_values"].astype(np.float32)
+
+    def embed_batch(self, pixel_values):
+        """Embed a batch of preprocessed images in one session run"""
+        features = self.session.run(None, {'pixel_values': np.ascontiguousarray(pixel_values, dtype=np.float32)})[0]
+        return normalize_rows(features)
+
+
+def warm_up(backend, batch_sizes):
+    """Embed a blank image at each batch size; returns the seconds each took, by batch size"""
+    from PIL import Image
+    pixel_values = backend.preprocess(Image.new('RGB', (224, 224)))
+    timings = {}
+    for size in batch_sizes:
+        start = time.perf_counter()
+        backend.embed_batch(np.repeat(pixel_values, size, axis=0))
+        timings[str(size)] = round(time.perf_counter() - start, 3)
+    return timings
+
+
+def create_backend(kind, model_name, vision_only=True, threads=None):
+    """Create the inference backend selected by name (see BACKENDS)"""
+    if kind == 'torch':
+        return TorchBackend(model_name, vision_only, threads)
+    if kind == 'int8':
+        return Int8Backend(model_name, vision_only, threads)
+    if kind == 'onnx':
+        return OnnxBackend(model_name, threads=threads)
+    raise ValueError(f"Unknown inference backend '{kind}', expected one of {', '.join(BACKENDS)}")
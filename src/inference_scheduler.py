@@ -0,0 +1,134 @@
+"""
+Dynamic micro-batching for model inference.
+
+Request threads submit single items and get a Future back. A worker thread
+collects whatever arrives within a short window (or until the batch is
+full) and runs one batched call, then resolves each request's Future with
+its own row of the result. submit_many() queues a group of items that is
+never split, so a batch request gets all of its rows in one call.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class InferenceScheduler:
+    """Gathers concurrent inference requests into batches"""
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=5, name="inference"):
+        # batch_fn takes a list of items and returns a list of results in the same order
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._items = 0
+        self._failed_batches = 0
+        self._batch_sizes = {}  # batch size -> number of batches
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._total_run = 0.0
+
+    def start(self):
+        """Start the batching worker thread if it isn't running"""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-scheduler", daemon=True)
+                self._thread.start()
+
+    def submit(self, item):
+        """Queue one item for inference and return a Future for its result"""
+        future = Future()
+        self.start()
+        self._queue.put(([item], future, time.perf_counter(), True))
+        return future
+
+    def submit_many(self, items):
+        """Queue a group of items to run in the same batch; the Future gets a list of results.
+
+        A group is never split, even when it is larger than max_batch_size.
+        """
+        future = Future()
+        if not items:
+            future.set_result([])
+            return future
+        self.start()
+        self._queue.put((list(items), future, time.perf_counter(), False))
+        return future
+
+    def _collect(self):
+        """Block for the first request, then gather more until full or the window closes"""
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    entry = self._queue.get_nowait()
+                else:
+                    entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(entry)
+            size += len(entry[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            items = [item for group, _, _, _ in batch for item in group]
+            waits = [started - queued_at for group, _, queued_at, _ in batch for _ in group]
+
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name} batch returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                print(f"Error running {self.name} batch of {len(items)}: {e}")
+                for _, future, _, _ in batch:
+                    future.set_exception(e)
+                with self._stats_lock:
+                    self._failed_batches += 1
+                continue
+
+            offset = 0
+            for group, future, _, single in batch:
+                group_results = results[offset:offset + len(group)]
+                offset += len(group)
+                future.set_result(group_results[0] if single else list(group_results))
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(items)
+                self._batch_sizes[len(items)] = self._batch_sizes.get(len(items), 0) + 1
+                self._total_wait += sum(waits)
+                self._max_wait_seen = max(self._max_wait_seen, max(waits))
+                self._total_run += time.perf_counter() - started
+
+    def stats(self):
+        """Return batch size and queue-wait metrics"""
+        with self._stats_lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'queued': self._queue.qsize(),
+                'batches': self._batches,
+                'failed_batches': self._failed_batches,
+                'items': self._items,
+                'mean_batch_size': self._items / self._batches if self._batches else 0,
+                'batch_size_histogram': {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                'mean_queue_wait_ms': self._total_wait / self._items * 1000 if self._items else 0,
+                'max_queue_wait_ms': self._max_wait_seen * 1000,
+                'mean_batch_run_ms': self._total_run / self._batches * 1000 if self._batches else 0,
+            }
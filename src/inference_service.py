@@ -0,0 +1,490 @@
+"""
+Model replicas in dedicated inference processes.
+
+With the model loaded in every HTTP worker, RAM caps how many workers a
+machine can run. An InferenceService instead hosts the model in
+`processes` replica processes, forked from the master before the HTTP
+workers. The workers only keep the (weightless) image processor and use
+RemoteBackend, which has the same preprocess()/embed_batch() interface as
+the local backends.
+
+Tensors never go through pickle. A block of shared memory is cut into
+`slots`, each holding up to max_items pixel tensors and their embeddings:
+
+1. A worker takes a free slot, numbers the request with the slot's next
+   sequence number, writes the pixel values into it and puts
+   (slot, count, sequence) on the request queue.
+2. A replica picks the request up and feeds it to its InferenceScheduler,
+   which batches requests from all workers into one forward pass. It
+   writes the embeddings (or an error) back into the slot, tagged with the
+   sequence number, and releases the slot's semaphore.
+3. The worker copies the embeddings out and returns the slot.
+
+A worker that gets no answer within the timeout returns the slot anyway
+and clears its sequence number. Replicas drop requests and answers whose
+sequence number is no longer the slot's, and the slot's next user skips
+any wake-up meant for an earlier request, so a late answer never reaches
+the wrong caller and timeouts don't leak slots. When no slot frees up
+within the timeout, embed() raises InferenceBusy.
+
+The request queue and the free-slot list are pipes of fixed-size
+messages rather than multiprocessing queues: a pipe write this small is
+atomic and every read takes exactly one message, so no lock is needed. A
+process killed in the middle of a call therefore can't leave a lock held
+and deadlock everyone else.
+
+start() returns right after forking: each replica loads (and, given a
+warmup function, warms up) its backend in the background and publishes its
+state, timings and backend name or error in shared memory, where every
+process can read them. wait() blocks until all replicas reach a state.
+
+A replica that dies is restarted by reap(), which the supervising master
+calls with the exit status of its children. Requests that the dead replica
+had picked up fail instead of hanging. A replica that failed to load the
+model is not restarted. Replicas exit on their own once the master is gone.
+Each slot also records the pid of the worker holding it, so reap() gives
+back the slots of a worker that was killed or crashed in the middle of a
+call. Without a supervising master (a single server process), monitor()
+calls reap() from a background thread.
+"""
+
+import functools
+import multiprocessing
+import os
+import queue
+import select
+import signal
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from inference_scheduler import InferenceScheduler
+
+# Slot header fields (int64)
+STATE, COUNT, DIM, OWNER, ERROR_LENGTH, SEQUENCE, ISSUED, ANSWERED, HOLDER = range(9)
+HEADER_FIELDS = 9
+ERROR_BYTES = 1024
+# Slot states
+PENDING, DONE, FAILED = 0, 1, 2
+# Replica states, in startup order
+LOADING, WARMING_UP, READY, LOAD_FAILED = 0, 1, 2, 3
+REPLICA_STATES = {LOADING: 'loading', WARMING_UP: 'warming_up', READY: 'ready', LOAD_FAILED: 'failed'}
+
+MAX_EMBEDDING_DIM = 1024
+POLL_SECONDS = 1.0
+RESTART_DELAY_SECONDS = 1.0
+
+
+class InferenceBusy(RuntimeError):
+    """Every slot stayed taken for the whole timeout; the caller should retry later"""
+
+
+def _aligned(size, alignment=64):
+    return -(-size // alignment) * alignment
+
+
+class MessagePipe:
+    """Lock-free queue of fixed-size integer tuples between forked processes.
+
+    Holds at most PIPE_BUF / message size messages before put() blocks, so
+    it is only used for things bounded by the number of slots.
+    """
+
+    def __init__(self, fields):
+        self._format = struct.Struct(f'{fields}q')
+        self._read_fd, self._write_fd = os.pipe()
+        # Readers race for each message; the losers must not block in read()
+        os.set_blocking(self._read_fd, False)
+
+    def put(self, *values):
+        os.write(self._write_fd, self._format.pack(*values))
+
+    def get(self, timeout=None):
+        """Return the next message; raises queue.Empty after timeout seconds"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        poller = select.poll()
+        poller.register(self._read_fd, select.POLLIN)
+        while True:
+            remaining = None if deadline is None else max(0, int((deadline - time.monotonic()) * 1000))
+            if poller.poll(remaining):
+                try:
+                    return self._format.unpack(os.read(self._read_fd, self._format.size))
+                except BlockingIOError:
+                    continue  # another reader took it
+            if deadline is not None and time.monotonic() >= deadline:
+                raise queue.Empty
+
+    def close(self):
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+class InferenceService:
+    """Runs a backend in replica processes and embeds pixel batches through shared memory"""
+
+    def __init__(self, backend_factory, input_shape, processes=1, slots=8, max_items=8,
+                 threads=None, max_wait_ms=5, timeout=60.0, warmup=None):
+        # backend_factory(threads) runs in each replica and returns a loaded backend;
+        # warmup(backend), if given, runs there next, before the replica takes requests
+        self.backend_factory = backend_factory
+        self.warmup = warmup
+        self.input_shape = tuple(input_shape)
+        self.processes = processes
+        self.slots = slots
+        self.max_items = max_items
+        self.threads = threads
+        self.max_wait_ms = max_wait_ms
+        self.timeout = timeout
+
+        context = multiprocessing.get_context('fork')
+        self._requests = MessagePipe(3)  # (slot, count, sequence)
+        self._free = MessagePipe(1)      # (slot,)
+        self._done = [context.Semaphore(0) for _ in range(slots)]
+
+        input_size = int(np.prod(self.input_shape))
+        header_bytes = _aligned(HEADER_FIELDS * 8 + ERROR_BYTES)
+        input_bytes = _aligned(max_items * input_size * 4)
+        output_bytes = _aligned(max_items * MAX_EMBEDDING_DIM * 4)
+        slot_bytes = header_bytes + input_bytes + output_bytes
+        self._shm = shared_memory.SharedMemory(create=True, size=slot_bytes * slots)
+        buffer = self._shm.buf
+        self._headers, self._errors, self._inputs, self._outputs = [], [], [], []
+        for slot in range(slots):
+            offset = slot * slot_bytes
+            self._headers.append(np.ndarray((HEADER_FIELDS,), np.int64, buffer, offset))
+            self._errors.append(np.ndarray((ERROR_BYTES,), np.uint8, buffer, offset + HEADER_FIELDS * 8))
+            self._inputs.append(np.ndarray((max_items, *self.input_shape), np.float32, buffer, offset + header_bytes))
+            self._outputs.append(np.ndarray((max_items, MAX_EMBEDDING_DIM), np.float32, buffer,
+                                            offset + header_bytes + input_bytes))
+            self._free.put(slot)
+
+        # Startup state of each replica: a REPLICA_STATES key, timings and its backend name or error
+        self._states = context.Array('q', processes, lock=False)
+        self._load_seconds = context.Array('d', processes, lock=False)
+        self._warmup_seconds = context.Array('d', processes, lock=False)
+        self._messages = [context.Array('c', ERROR_BYTES, lock=False) for _ in range(processes)]
+
+        self._owner_pid = None
+        self._pids = {}  # replica pid -> replica number
+        self._monitor = None
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.items = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.busy = 0
+        # Replicas are restarted by the master; the workers read the count from shared memory
+        self._restarts = context.Value('q', 0, lock=False)
+
+    # Replica side
+
+    def _spawn(self, number):
+        self._states[number] = LOADING
+        pid = os.fork()
+        if pid == 0:
+            self._run_replica(number)
+        self._pids[pid] = number
+
+    def _publish(self, number, state, message=None):
+        if message is not None:
+            self._messages[number].value = message.encode('utf-8', 'replace')[:ERROR_BYTES - 1]
+        self._states[number] = state
+
+    def _run_replica(self, number):
+        """Body of a replica process; never returns"""
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            start = time.perf_counter()
+            try:
+                backend = self.backend_factory(self.threads)
+                self._load_seconds[number] = time.perf_counter() - start
+                self._publish(number, WARMING_UP, backend.name)
+                if self.warmup is not None:
+                    start = time.perf_counter()
+                    self.warmup(backend)
+                    self._warmup_seconds[number] = time.perf_counter() - start
+            except Exception as e:
+                self._publish(number, LOAD_FAILED, str(e))
+                raise
+            self._publish(number, READY)
+            print(f"🧠 Inference process {number} (pid {os.getpid()}) ready: {backend.name}, "
+                  f"{self.threads or 'default'} thread(s)")
+
+            scheduler = InferenceScheduler(
+                lambda items: list(backend.embed_batch(np.stack(items))),
+                max_batch_size=self.max_items, max_wait_ms=self.max_wait_ms, name=f"replica-{number}",
+            )
+            while True:
+                try:
+                    slot, count, sequence = self._requests.get(timeout=POLL_SECONDS)
+                except queue.Empty:
+                    if os.getppid() != self._owner_pid:
+                        break  # the master is gone
+                    continue
+                if self._headers[slot][SEQUENCE] != sequence:
+                    continue  # the caller gave up before we got to it
+                self._headers[slot][OWNER] = os.getpid()
+                future = scheduler.submit_many(list(self._inputs[slot][:count].copy()))
+                future.add_done_callback(functools.partial(self._complete, slot, sequence))
+        except BaseException as e:
+            if not isinstance(e, KeyboardInterrupt):
+                print(f"❌ Inference process {number} failed: {e}")
+                code = 1
+        finally:
+            os._exit(code)
+
+    def _fail(self, slot, message):
+        encoded = message.encode('utf-8', 'replace')[:ERROR_BYTES]
+        self._errors[slot][:len(encoded)] = np.frombuffer(encoded, np.uint8)
+        self._headers[slot][ERROR_LENGTH] = len(encoded)
+        self._headers[slot][STATE] = FAILED
+
+    def _answer(self, slot, sequence):
+        header = self._headers[slot]
+        header[ANSWERED] = sequence
+        header[OWNER] = 0
+        self._done[slot].release()
+
+    def _complete(self, slot, sequence, future):
+        """Write a finished request's embeddings (or error) into its slot and wake the worker"""
+        header = self._headers[slot]
+        if header[SEQUENCE] != sequence:
+            return  # the caller timed out; the slot may already carry another request
+        try:
+            rows = np.asarray(future.result(), dtype=np.float32)
+            if rows.shape[1] > MAX_EMBEDDING_DIM:
+                raise ValueError(f"Embeddings have {rows.shape[1]} dimensions, at most {MAX_EMBEDDING_DIM} fit a slot")
+            self._outputs[slot][:len(rows), :rows.shape[1]] = rows
+            header[DIM] = rows.shape[1]
+            header[STATE] = DONE
+        except Exception as e:
+            self._fail(slot, str(e))
+        self._answer(slot, sequence)
+
+    # Master side
+
+    def start(self):
+        """Fork the replicas; they load their backends in the background (see wait())"""
+        self._owner_pid = os.getpid()
+        for number in range(self.processes):
+            self._spawn(number)
+
+    def wait(self, state=READY, timeout=None):
+        """Wait until every replica has reached state (WARMING_UP: loaded, READY: warmed up).
+
+        Raises RuntimeError if a replica failed to load or the timeout expires.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            for number in range(self.processes):
+                if self._states[number] == LOAD_FAILED:
+                    raise RuntimeError(f"Inference process {number} could not load the model: "
+                                       f"{self._message(number)}")
+            if all(self._states[number] >= state for number in range(self.processes)):
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                raise RuntimeError(f"Inference processes not {REPLICA_STATES[state]} after {timeout:.0f}s")
+            time.sleep(0.05)
+
+    def _message(self, number):
+        return self._messages[number].value.decode('utf-8', 'replace')
+
+    @property
+    def backend_name(self):
+        """Name of the replicas' backend, once one has loaded"""
+        for number in range(self.processes):
+            if self._states[number] in (WARMING_UP, READY):
+                return self._message(number)
+        return None
+
+    def replicas(self):
+        """Startup state and timings of each replica"""
+        return [{
+            'state': REPLICA_STATES[self._states[number]],
+            'load_seconds': round(self._load_seconds[number], 3) or None,
+            'warmup_seconds': round(self._warmup_seconds[number], 3) or None,
+            'error': self._message(number) if self._states[number] == LOAD_FAILED else None,
+        } for number in range(self.processes)]
+
+    def reap(self, pid, status):
+        """Handle the exit of a child process: returns the slots it held and restarts it if it was a replica.
+
+        Returns False for processes that aren't replicas of this service.
+        """
+        self._reclaim(pid)
+        number = self._pids.pop(pid, None)
+        if number is None:
+            return False
+        code = os.waitstatus_to_exitcode(status)
+        if self._states[number] == LOAD_FAILED:
+            # Loading would fail again; wait() reports the error
+            print(f"❌ Inference process {number} (pid {pid}) could not load the model, not restarting")
+            return True
+        print(f"⚠️ Inference process {number} (pid {pid}) exited with code {code}, restarting")
+        for slot in range(self.slots):
+            header = self._headers[slot]
+            if header[OWNER] == pid and header[SEQUENCE]:
+                # Fail the requests it had picked up rather than leaving them waiting
+                self._fail(slot, "Inference process died")
+                self._answer(slot, header[SEQUENCE])
+        time.sleep(RESTART_DELAY_SECONDS)
+        if self._stopping.is_set():
+            return True
+        self._restarts.value += 1
+        self._spawn(number)
+        return True
+
+    def _reclaim(self, pid):
+        """Put the slots held by a process that exited back in circulation"""
+        reclaimed = 0
+        for slot in range(self.slots):
+            header = self._headers[slot]
+            if header[HOLDER] == pid:
+                # As after a timeout: the replicas drop the request and its answer
+                header[SEQUENCE] = 0
+                header[HOLDER] = 0
+                self._free.put(slot)
+                reclaimed += 1
+        if reclaimed:
+            print(f"♻️ Reclaimed {reclaimed} inference slot(s) held by pid {pid}")
+
+    def monitor(self):
+        """Reap and restart dead replicas from a background thread.
+
+        For a master that doesn't wait for its children itself; a pre-fork
+        master passes reap() to prefork.serve() instead.
+        """
+        def watch():
+            while not self._stopping.wait(POLL_SECONDS):
+                for pid in list(self._pids):
+                    try:
+                        reaped, status = os.waitpid(pid, os.WNOHANG)
+                    except ChildProcessError:
+                        continue
+                    if reaped:
+                        self.reap(pid, status)
+
+        self._monitor = threading.Thread(target=watch, name='inference-monitor', daemon=True)
+        self._monitor.start()
+
+    def stop(self):
+        """Terminate the replicas (they also exit by themselves when the master exits)"""
+        self._stopping.set()
+        if self._monitor is not None:
+            self._monitor.join()
+        for pid in list(self._pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self._pids.pop(pid, None)
+
+    def close(self):
+        """Stop the replicas and release the shared memory and pipes"""
+        self.stop()
+        self._headers = self._errors = self._inputs = self._outputs = []
+        self._shm.close()
+        self._shm.unlink()
+        self._requests.close()
+        self._free.close()
+
+    # Worker side
+
+    def _embed_chunk(self, pixel_values):
+        try:
+            (slot,) = self._free.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._stats_lock:
+                self.busy += 1
+            raise InferenceBusy(f"No free inference slot within {self.timeout:.0f}s")
+        header = self._headers[slot]
+        # If this process dies holding the slot, the master's reap() gives it back
+        header[HOLDER] = os.getpid()
+        try:
+            header[ISSUED] += 1
+            sequence = int(header[ISSUED])
+            header[OWNER] = 0
+            header[STATE] = PENDING
+            header[COUNT] = len(pixel_values)
+            self._inputs[slot][:len(pixel_values)] = pixel_values
+            header[SEQUENCE] = sequence
+            self._requests.put(slot, len(pixel_values), sequence)
+            deadline = time.monotonic() + self.timeout
+            while True:
+                if not self._done[slot].acquire(timeout=max(0.0, deadline - time.monotonic())):
+                    with self._stats_lock:
+                        self.timeouts += 1
+                    raise TimeoutError(f"No answer from the inference processes within {self.timeout:.0f}s")
+                if header[ANSWERED] == sequence:
+                    break
+                # A late wake-up for a request that timed out in this slot earlier
+            if header[STATE] != DONE:
+                raise RuntimeError(bytes(self._errors[slot][:header[ERROR_LENGTH]]).decode('utf-8', 'replace'))
+            return self._outputs[slot][:len(pixel_values), :header[DIM]].copy()
+        finally:
+            # No request of ours is in the slot anymore; late answers for it are dropped
+            header[SEQUENCE] = 0
+            header[HOLDER] = 0
+            self._free.put(slot)
+
+    def embed(self, pixel_values):
+        """Embed an (n, *input_shape) array in the replicas; returns an (n, dim) array"""
+        pixel_values = np.asarray(pixel_values, dtype=np.float32)
+        if pixel_values.shape[1:] != self.input_shape:
+            raise ValueError(f"Expected pixel values of shape (n, {', '.join(map(str, self.input_shape))}), "
+                             f"got {pixel_values.shape}")
+        chunks = []
+        try:
+            for start in range(0, len(pixel_values), self.max_items):
+                chunks.append(self._embed_chunk(pixel_values[start:start + self.max_items]))
+        except Exception:
+            with self._stats_lock:
+                self.failures += 1
+            raise
+        with self._stats_lock:
+            self.requests += 1
+            self.items += len(pixel_values)
+        return np.concatenate(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+
+    def stats(self):
+        """Counters of this process's requests to the replicas"""
+        with self._stats_lock:
+            return {
+                'processes': self.processes,
+                'slots': self.slots,
+                'max_items_per_slot': self.max_items,
+                'requests': self.requests,
+                'items': self.items,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'busy': self.busy,
+                'restarts': self._restarts.value,
+                'replicas': self.replicas(),
+            }
+
+
+class RemoteBackend:
+    """Backend that preprocesses locally and embeds in an InferenceService"""
+
+    def __init__(self, service, processor):
+        self.service = service
+        self.processor = processor
+        self.name = f"{service.backend_name} x{service.processes} (remote)"
+
+    def preprocess(self, image):
+        """Resize, crop and normalize a PIL image into model input"""
+        return self.processor(images=image, return_tensors="np")["pixel_values"].astype(np.float32)
+
+    def embed_batch(self, pixel_values):
+        """Embed a batch of preprocessed images in the inference processes"""
+        return self.service.embed(pixel_values)
+
+    def set_threads(self, threads):
+        """The replicas size their own thread pools"""
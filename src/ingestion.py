@@ -0,0 +1,216 @@
+"""
+Background ingestion of submitted quests.
+
+/api/submit-quest used to decode, write and embed every photo inside the
+request, which held a worker for seconds on a large quest. Now the request
+only validates the submission and returns a job id. The work runs as an
+IngestionJob on a small pool of job threads, and each job goes through its
+stages in order:
+
+1. photos: decode, verify and write each photo to the quest folder
+2. renditions: write the upright model and display copies of each photo
+3. normalize: build the quest JSON from the submitted checkpoints
+4. embeddings: precompute the answer-image embeddings
+5. publish: save the quest definition, which adds it to /api/quests
+
+Per-item work within a stage (photos, renditions, embeddings) is spread over a
+separate task pool with IngestionPipeline.map, so a job never waits on its
+own pool. The quest definition is written last, so /api/quests never lists
+a quest whose assets are still being processed.
+
+Jobs live in memory. Finished jobs are kept for their status endpoint
+until more than keep_finished newer ones have finished. With several
+worker processes, the status poll may reach a worker other than the one
+running the job. With a status_dir, each job's status is therefore also
+written there as JSON whenever it changes (progress at most every
+PUBLISH_INTERVAL seconds), and get_status() falls back to that file.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from quest_storage import atomic_write_json
+
+QUEUED = 'queued'
+RUNNING = 'running'
+READY = 'ready'
+FAILED = 'failed'
+
+PUBLISH_INTERVAL = 0.5
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class IngestionJob:
+    """Status and progress of one quest submission"""
+
+    def __init__(self, stages, on_change=None):
+        self.id = uuid.uuid4().hex
+        self.stages = list(stages)
+        self.status = QUEUED
+        self.stage = None
+        self.done = 0    # items finished in the current stage
+        self.total = 0   # items in the current stage
+        self.warnings = []
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._on_change = on_change  # called with the job when its status changes
+        self._changed_at = 0.0
+
+    def changed(self, force=True):
+        """Report a status change; progress-only changes are throttled"""
+        now = time.monotonic()
+        if self._on_change is not None and (force or now - self._changed_at >= PUBLISH_INTERVAL):
+            self._changed_at = now
+            self._on_change(self)
+
+    def start_stage(self, stage, total=0):
+        with self._lock:
+            self.stage = stage
+            self.done = 0
+            self.total = total
+        self.changed()
+
+    def advance(self, count=1):
+        with self._lock:
+            self.done += count
+        self.changed(force=False)
+
+    def warn(self, message):
+        print(f"⚠️ Ingestion {self.id[:8]}: {message}")
+        with self._lock:
+            self.warnings.append(message)
+        self.changed()
+
+    def to_dict(self):
+        """Status as returned by /api/submit-quest/<job>"""
+        with self._lock:
+            stage_index = self.stages.index(self.stage) if self.stage in self.stages else -1
+            return {
+                'jobId': self.id,
+                'status': self.status,
+                'stage': self.stage,
+                'stages': self.stages,
+                'stageProgress': {'done': self.done, 'total': self.total},
+                'stagesCompleted': len(self.stages) if self.status == READY else max(stage_index, 0),
+                'warnings': list(self.warnings),
+                'error': self.error,
+                'result': self.result,
+                'createdAt': self.created_at,
+                'finishedAt': self.finished_at,
+            }
+
+
+class IngestionPipeline:
+    """Runs ingestion jobs in the background and keeps their status"""
+
+    def __init__(self, max_jobs=2, max_parallel=4, keep_finished=200, status_dir=None):
+        self._jobs_pool = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='ingest-job')
+        self._tasks_pool = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix='ingest-task')
+        self.keep_finished = keep_finished
+        self.status_dir = status_dir
+        self._jobs = {}
+        self._finished = OrderedDict()  # job id -> None, oldest first
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, stages, run_fn, *args):
+        """Queue run_fn(job, *args) and return its job right away.
+
+        run_fn reports progress through the job and returns the job's result;
+        an exception fails the job with its message.
+        """
+        job = IngestionJob(stages, self._publish if self.status_dir else None)
+        with self._lock:
+            self._jobs[job.id] = job
+        job.changed()
+        self._jobs_pool.submit(self._run, job, run_fn, args)
+        return job
+
+    def _status_path(self, job_id):
+        return os.path.join(self.status_dir, f"{job_id}.json")
+
+    def _publish(self, job):
+        """Write a job's status where other worker processes can read it"""
+        try:
+            os.makedirs(self.status_dir, exist_ok=True)
+            atomic_write_json(self._status_path(job.id), job.to_dict())
+        except OSError as e:
+            print(f"⚠️ Could not publish status of ingestion {job.id[:8]}: {e}")
+
+    def _run(self, job, run_fn, args):
+        job.status = RUNNING
+        job.changed()
+        start = time.perf_counter()
+        try:
+            result = run_fn(job, *args)
+        except Exception as e:
+            print(f"❌ Ingestion {job.id[:8]} failed in {job.stage}: {e}")
+            with job._lock:
+                job.error = str(e)
+                job.status = FAILED
+        else:
+            with job._lock:
+                job.result = result
+                job.status = READY
+            print(f"✅ Ingestion {job.id[:8]} ready in {time.perf_counter() - start:.1f}s")
+        job.finished_at = time.time()
+        job.changed()
+        self._finish(job)
+
+    def _finish(self, job):
+        with self._lock:
+            if job.status == READY:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self._finished[job.id] = None
+            while len(self._finished) > self.keep_finished:
+                old_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(old_id, None)
+                if self.status_dir:
+                    try:
+                        os.remove(self._status_path(old_id))
+                    except OSError:
+                        pass
+
+    def map(self, job, fn, items):
+        """Run fn over items on the task pool, advancing job progress; results in input order"""
+        futures = [self._tasks_pool.submit(fn, item) for item in items]
+        results = []
+        for future in futures:
+            results.append(future.result())
+            job.advance()
+        return results
+
+    def get(self, job_id):
+        """Return a job by id, or None if it is unknown or expired"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_status(self, job_id):
+        """Return a job's status dict, from this process or the status_dir, or None"""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.status_dir and JOB_ID.match(job_id):
+            try:
+                with open(self._status_path(job_id), 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return None
+
+    def stats(self):
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job.status in (QUEUED, RUNNING))
+            return {'active': active, 'completed': self.completed, 'failed': self.failed}
@@ -0,0 +1,391 @@
+"""
+Append-only leaderboard storage, one log per quest folder.
+
+Entries are appended as JSON lines to leaderboard.jsonl and never
+rewritten. A small leaderboard_stats.json header next to it keeps running
+totals (count, sum and best time), so adding an entry is O(1) and the
+quest definition file is no longer touched when a team finishes.
+
+Quests created before this existed keep their entries inside the quest
+JSON; the first time such a quest is written to, those entries seed the
+log and are removed from the quest JSON, and from then on the log is the
+source of truth.
+
+Writes hold the quest's cross-process lock, and adds that arrive close
+together are appended with a single write (see quest_storage).
+
+For reads, each store keeps the entries in leaderboard order in memory
+(RankedLeaderboard). New log lines are bisect-inserted as they appear, so
+serving the top 10, a page, or one team's rank never sorts the full list.
+"""
+
+import json
+import math
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from quest_storage import atomic_write_bytes, atomic_write_text, coalescer, quest_lock, update_json
+
+LOG_FILENAME = "leaderboard.jsonl"
+STATS_FILENAME = "leaderboard_stats.json"
+
+
+def empty_stats():
+    """Stats header for a quest nobody has finished yet"""
+    return {
+        'total_completions': 0,
+        'time_sum': 0,
+        'average_time': 0,
+        'best_time': None,
+        'last_updated': None,
+        'log_size': 0,
+    }
+
+
+def apply_entry(stats, entry):
+    """Fold one leaderboard entry into the running stats"""
+    completion_time = entry.get('completion_time', 0) or 0
+    stats['total_completions'] += 1
+    stats['time_sum'] += completion_time
+    stats['average_time'] = stats['time_sum'] / stats['total_completions']
+    if completion_time > 0 and (stats['best_time'] is None or completion_time < stats['best_time']):
+        stats['best_time'] = completion_time
+    return stats
+
+
+def public_stats(stats):
+    """The stats fields exposed by the API (same shape as the legacy quest JSON)"""
+    return {
+        'total_completions': stats['total_completions'],
+        'average_time': stats['average_time'],
+        'best_time': stats['best_time'],
+        'last_updated': stats['last_updated'],
+    }
+
+
+def _number(value, types):
+    """Whether value is one of types; bools are ints in Python but not numbers here"""
+    return isinstance(value, types) and not isinstance(value, bool)
+
+
+def entry_error(entry):
+    """Why a new entry can't be stored and ranked, or None if it can"""
+    if not isinstance(entry.get('team_name'), str):
+        return 'team_name must be a string'
+    waypoints = entry.get('waypoints_completed')
+    if not _number(waypoints, int) or waypoints < 0:
+        return 'waypoints_completed must be a non-negative integer'
+    completion_time = entry.get('completion_time')
+    if completion_time is not None and (not _number(completion_time, (int, float))
+                                        or not math.isfinite(completion_time) or completion_time < 0):
+        return 'completion_time must be a non-negative number of milliseconds or null'
+    return None
+
+
+def rank_key(entry, seq):
+    """Leaderboard order: most waypoints first, then fastest time, then earliest entry"""
+    completion_time = entry.get('completion_time')
+    if completion_time is None:
+        completion_time = float('inf')
+    return (-(entry.get('waypoints_completed', 0) or 0), completion_time, seq)
+
+
+class RankedLeaderboard:
+    """Leaderboard entries kept in rank order as they are inserted"""
+
+    def __init__(self, entries=()):
+        self._keys = []
+        self._entries = []
+        self._team_best = {}  # team name -> rank key of its best entry
+        self.extend(entries)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def insert(self, entry):
+        """Insert the next entry in log order"""
+        key = rank_key(entry, len(self._keys))
+        index = bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        self._entries.insert(index, entry)
+        team_name = entry.get('team_name')
+        best = self._team_best.get(team_name)
+        if best is None or key < best:
+            self._team_best[team_name] = key
+
+    def extend(self, entries):
+        """Insert entries in log order; large batches are merged with one sort instead"""
+        entries = list(entries)
+        if len(entries) < 64:
+            for entry in entries:
+                self.insert(entry)
+            return
+        seq = len(self._keys)
+        pairs = list(zip(self._keys, self._entries))
+        for entry in entries:
+            key = rank_key(entry, seq)
+            seq += 1
+            pairs.append((key, entry))
+            best = self._team_best.get(entry.get('team_name'))
+            if best is None or key < best:
+                self._team_best[entry.get('team_name')] = key
+        # Keys are unique (they end in the sequence number), so entries are never compared
+        pairs.sort(key=lambda pair: pair[0])
+        self._keys = [key for key, _ in pairs]
+        self._entries = [entry for _, entry in pairs]
+
+    def page(self, offset=0, limit=None, after=None):
+        """Return (entries, total, cursor_key) for a slice in rank order.
+
+        after is the rank key of the last entry already seen and takes
+        precedence over offset. cursor_key is the key of the last returned
+        entry if more entries follow, else None.
+        """
+        start = bisect_right(self._keys, after) if after is not None else max(0, offset)
+        end = len(self._keys) if limit is None else min(len(self._keys), start + limit)
+        cursor_key = self._keys[end - 1] if start < end < len(self._keys) else None
+        return self._entries[start:end], len(self._keys), cursor_key
+
+    def rank(self, team_name):
+        """Return (rank, entry) of a team's best entry (rank is 1-based), or (None, None)"""
+        key = self._team_best.get(team_name)
+        if key is None:
+            return None, None
+        index = bisect_left(self._keys, key)
+        return index + 1, self._entries[index]
+
+
+class LeaderboardStore:
+    """Append-only leaderboard log plus running stats for one quest folder"""
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        self.log_path = os.path.join(folder_path, LOG_FILENAME)
+        self.stats_path = os.path.join(folder_path, STATS_FILENAME)
+        self._stats = None
+        self._ranked = None
+        self._ranked_offset = 0  # bytes of the log already in _ranked
+        self._lock = threading.Lock()
+
+    def exists(self):
+        """Whether this quest has a leaderboard log yet"""
+        return os.path.exists(self.log_path)
+
+    def _log_size(self):
+        try:
+            return os.path.getsize(self.log_path)
+        except OSError:
+            return 0
+
+    def _read_log(self):
+        """Yield every entry in the log, skipping a torn final line"""
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"⚠️ Skipping corrupt leaderboard line in {self.log_path}")
+
+    def _rebuild_stats(self):
+        """Recompute the header from the log (only needed after a crash)"""
+        stats = empty_stats()
+        last_timestamp = None
+        for entry in self._read_log():
+            apply_entry(stats, entry)
+            last_timestamp = entry.get('timestamp', last_timestamp)
+        stats['last_updated'] = last_timestamp
+        stats['log_size'] = self._log_size()
+        return stats
+
+    def _write_stats(self, stats):
+        atomic_write_text(self.stats_path, json.dumps(stats))
+
+    def _load_stats(self):
+        """Return the cached header, validating it against the log size (caller holds the lock)"""
+        if self._stats is not None and self._stats['log_size'] == self._log_size():
+            return self._stats
+
+        stats = None
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                stats = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            pass
+
+        if stats is None or stats.get('log_size') != self._log_size():
+            # The header is missing or a crash landed between the append and
+            # the header update: recount from the log once
+            stats = self._rebuild_stats()
+            if self.exists():
+                self._write_stats(stats)
+
+        self._stats = stats
+        return stats
+
+    def seed(self, legacy_entries):
+        """Create the log from entries stored in a legacy quest JSON; returns False if it already existed"""
+        with quest_lock(self.log_path), self._lock:
+            if self.exists():
+                return False
+            stats = empty_stats()
+            lines = []
+            for entry in legacy_entries:
+                lines.append(json.dumps(entry, ensure_ascii=False) + '\n')
+                apply_entry(stats, entry)
+                stats['last_updated'] = entry.get('timestamp', stats['last_updated'])
+            atomic_write_bytes(self.log_path, ''.join(lines).encode('utf-8'))
+            stats['log_size'] = self._log_size()
+            self._write_stats(stats)
+            self._stats = stats
+            print(f"✅ Seeded leaderboard log for {os.path.basename(self.folder_path)} with {len(legacy_entries)} entries")
+            return True
+
+    def _append(self, entries):
+        """Append a batch of entries with one write (caller holds the quest lock).
+
+        Returns the stats as they stood right after each entry.
+        """
+        data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries).encode('utf-8')
+        with self._lock:
+            stats = dict(self._load_stats())
+            with open(self.log_path, 'ab+') as f:
+                # A crash mid-append can leave a torn last line; start on a fresh one
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        data = b'\n' + data
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            results = []
+            for entry in entries:
+                apply_entry(stats, entry)
+                stats['last_updated'] = entry.get('timestamp') or datetime.now().isoformat()
+                results.append(public_stats(stats))
+            stats['log_size'] = self._log_size()
+            self._write_stats(stats)
+            self._stats = stats
+            return results
+
+    def add(self, entry):
+        """Append one entry and update the running stats; returns the new stats"""
+        return coalescer.submit(self.log_path, self._append, entry)
+
+    def entries(self):
+        """Return every entry in insertion order"""
+        with self._lock:
+            return list(self._read_log())
+
+    def _sync_ranked(self):
+        """Bring the ranked entries up to date with the log (caller holds the lock).
+
+        Only lines appended since the last call are read, so entries written
+        by this or any other process are picked up without a rebuild.
+        """
+        log_size = self._log_size()
+        if self._ranked is None or log_size < self._ranked_offset:
+            self._ranked = RankedLeaderboard()
+            self._ranked_offset = 0
+        if log_size == self._ranked_offset:
+            return self._ranked
+
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._ranked_offset)
+            data = f.read(log_size - self._ranked_offset)
+        # Leave a trailing partial line for later; it is either still being
+        # written or torn, in which case the next append starts a new line
+        complete = data.rfind(b'\n') + 1
+        entries = []
+        for line in data[:complete].splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"⚠️ Skipping corrupt leaderboard line in {self.log_path}")
+        self._ranked.extend(entries)
+        self._ranked_offset += complete
+        return self._ranked
+
+    def page(self, offset=0, limit=None, after=None):
+        """Return (entries, total, cursor_key) in leaderboard order (see RankedLeaderboard.page)"""
+        with self._lock:
+            return self._sync_ranked().page(offset, limit, after)
+
+    def rank(self, team_name):
+        """Return (rank, entry) of a team's best entry, or (None, None)"""
+        with self._lock:
+            return self._sync_ranked().rank(team_name)
+
+    def stats(self):
+        """Return the running stats in the API shape"""
+        with self._lock:
+            return public_stats(self._load_stats())
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_leaderboard_store(quest_file_path):
+    """Return the shared store for the folder containing a quest file"""
+    folder_path = os.path.dirname(os.path.abspath(quest_file_path))
+    with _stores_lock:
+        store = _stores.get(folder_path)
+        if store is None:
+            store = _stores[folder_path] = LeaderboardStore(folder_path)
+        return store
+
+
+def load_legacy_leaderboard(quest_file_path):
+    """Return the leaderboard dict embedded in a quest JSON file"""
+    with open(quest_file_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('leaderboard', {}) or {}
+
+
+def add_entry(quest_file_path, entry):
+    """Append a leaderboard entry for a quest, seeding the log from the quest JSON on first use"""
+    store = get_leaderboard_store(quest_file_path)
+    if not store.exists():
+        legacy_entries = load_legacy_leaderboard(quest_file_path).get('entries') or []
+        if store.seed(legacy_entries) and legacy_entries:
+            drop_legacy_leaderboard(quest_file_path)
+    return store.add(entry)
+
+
+def drop_legacy_leaderboard(quest_file_path):
+    """Remove the entries and stats a seeded log replaces from the quest JSON (ratings are rating_store's)"""
+    def drop_entries(quest_data):
+        leaderboard = quest_data.get('leaderboard')
+        if isinstance(leaderboard, dict):
+            leaderboard.pop('entries', None)
+            leaderboard.pop('stats', None)
+    update_json(quest_file_path, drop_entries)
+    print(f"✅ Moved the leaderboard of {os.path.basename(os.path.dirname(quest_file_path))} out of the quest file")
+
+
+def ranked_leaderboard(quest_file_path):
+    """Return (ranked, stats) for a quest; ranked has page() and rank() like LeaderboardStore"""
+    store = get_leaderboard_store(quest_file_path)
+    if store.exists():
+        return store, store.stats()
+    # Legacy quests keep a handful of entries in the quest JSON: rank them on the fly
+    leaderboard_data = load_legacy_leaderboard(quest_file_path)
+    return RankedLeaderboard(leaderboard_data.get('entries', [])), leaderboard_data.get('stats', {})
+
+
+def read_leaderboard(quest_file_path):
+    """Return (entries, stats) for a quest from its log, or from the quest JSON if it has no log yet"""
+    store = get_leaderboard_store(quest_file_path)
+    if store.exists():
+        return store.entries(), store.stats()
+    leaderboard_data = load_legacy_leaderboard(quest_file_path)
+    return leaderboard_data.get('entries', []), leaderboard_data.get('stats', {})
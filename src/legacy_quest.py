@@ -0,0 +1,167 @@
+"""
+Parser for legacy .js quest files.
+
+Early quests were written as ES modules (`export const fooQuest = {...};`).
+parse_legacy_quest() turns one into the same dict shape as a JSON quest,
+using one tokenizer pass with precompiled patterns: unquoted keys are
+quoted, single-quoted strings are re-encoded, comments and trailing commas
+are dropped, and the result is handed to json.loads. Files the tokenizer
+can't handle fall back to pulling out the top-level fields one by one.
+
+load_legacy_quest() memoizes the parsed quest by path, mtime and size, so a
+legacy file is read once, not on every request.
+"""
+
+import json
+import os
+import re
+import threading
+
+# One alternative per token kind; anything else in the object literal is an error
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<comment>//[^\n]*|/\*.*?\*/)
+      | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`(?:[^`\\$]|\\.)*`)
+      | (?P<number>-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<literal>true|false|null)
+      | (?P<key>[A-Za-z_$][\w$]*)(?=\s*:)
+      | (?P<punct>[{}\[\],:])
+    )""", re.VERBOSE | re.DOTALL)
+_ESCAPE = re.compile(r"\\(u[0-9a-fA-F]{4}|.)", re.DOTALL)
+_EXPORT = re.compile(r"(?:export\s+(?:default\s+)?)?(?:const|let|var)\s+\w+\s*=\s*|export\s+default\s+")
+
+# Fallback: top-level fields that older parsers looked for
+_FIELD_PATTERNS = {
+    field: re.compile(rf"{field}: '([^']+)'")
+    for field in ('name', 'description', 'difficulty', 'ageGroup', 'distance')
+}
+_ID_PATTERNS = (re.compile(r"id: '([^']+)'"), re.compile(r"id: ([0-9]+)"))
+_CHECKPOINT_ID = re.compile(r"id: [0-9]+")
+
+_JS_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0'}
+
+
+def _unescape(body):
+    """Decode the escapes of a JS string literal body"""
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] == 'u' and len(escape) == 5:
+            return chr(int(escape[1:], 16))
+        if escape == '\n':  # line continuation
+            return ''
+        return _JS_ESCAPES.get(escape, escape)
+    return _ESCAPE.sub(replace, body)
+
+
+def js_object_to_json(source):
+    """Convert a JS object literal to JSON text; raises ValueError on anything else"""
+    parts = []
+    position = 0
+    end = len(source.rstrip())
+    while position < end:
+        match = _TOKEN.match(source, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Unexpected JS at offset {position}: {source[position:position + 30]!r}")
+        position = match.end()
+        kind = match.lastgroup
+        token = match.group(kind)
+        if kind == 'comment':
+            continue
+        if kind == 'string':
+            parts.append(json.dumps(_unescape(token[1:-1]), ensure_ascii=False))
+        elif kind == 'key':
+            parts.append(json.dumps(token))
+        else:
+            if token in '}]' and parts and parts[-1] == ',':
+                parts.pop()  # trailing comma
+            parts.append(token)
+    return ''.join(parts)
+
+
+def _extract_object(source):
+    """Return the object literal assigned or exported by a quest module"""
+    export = _EXPORT.search(source)
+    start = source.find('{', export.end() if export else 0)
+    end = source.rfind('}')
+    if start < 0 or end < start:
+        raise ValueError("No object literal found")
+    return source[start:end + 1]
+
+
+def _fallback_fields(source):
+    """Pull the top-level fields out one regex at a time (for files the tokenizer rejects)"""
+    quest = {}
+    for field, pattern in _FIELD_PATTERNS.items():
+        match = pattern.search(source)
+        if match:
+            quest[field] = match.group(1)
+    for pattern in _ID_PATTERNS:
+        match = pattern.search(source)
+        if match:
+            quest['id'] = match.group(1)
+            break
+    # Without a parse, checkpoints are only known by count
+    quest['checkpoints'] = [{} for _ in range(max(0, len(_CHECKPOINT_ID.findall(source)) - 1))]
+    return quest
+
+
+def normalize_quest(quest):
+    """Fill in the fields a JSON quest has, so legacy quests look the same to callers"""
+    normalized = dict(quest)
+    normalized.setdefault('description', '')
+    normalized.setdefault('difficulty', 'Medium')
+    normalized.setdefault('ageGroup', 'All Ages')
+    normalized.setdefault('distance', 'Unknown')
+    normalized.setdefault('rating', 0)
+    normalized.setdefault('enabled', True)
+
+    checkpoints = []
+    for index, checkpoint in enumerate(quest.get('checkpoints') or []):
+        checkpoint = dict(checkpoint)
+        checkpoint.setdefault('id', index + 1)
+        checkpoint.setdefault('name', f"Waypoint {index + 1}")
+        checkpoint.setdefault('clue', '')
+        checkpoint.setdefault('funFact', '')
+        # JSON quests list every accepted photo
+        answer_image = checkpoint.get('answerImage')
+        if answer_image is None:
+            checkpoint['answerImage'] = []
+        elif not isinstance(answer_image, list):
+            checkpoint['answerImage'] = [answer_image]
+        checkpoints.append(checkpoint)
+    normalized['checkpoints'] = checkpoints
+    return normalized
+
+
+def parse_legacy_quest(source):
+    """Parse the text of a legacy .js quest into a normalized quest dict"""
+    try:
+        quest = json.loads(js_object_to_json(_extract_object(source)))
+        if not isinstance(quest, dict):
+            raise ValueError("Quest is not an object")
+    except ValueError:
+        quest = _fallback_fields(source)
+    return normalize_quest(quest)
+
+
+_cache = {}  # path -> (mtime_ns, size, quest)
+_cache_lock = threading.Lock()
+
+
+def load_legacy_quest(path):
+    """Return the normalized quest for a .js file, re-parsing only when the file changes.
+
+    The returned dict is shared between callers and must not be modified.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    with _cache_lock:
+        cached = _cache.get(path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        quest = parse_legacy_quest(f.read())
+    with _cache_lock:
+        _cache[path] = (stat.st_mtime_ns, stat.st_size, quest)
+    return quest
@@ -0,0 +1,113 @@
+"""
+Background model startup with separate liveness and readiness.
+
+Loading CLIP (download, weights, lazy initialization) takes seconds to
+minutes, and so do the first forward passes. ModelStartup runs these
+startup phases in a background thread, so the server accepts connections
+and answers the endpoints that don't need the model (quests, leaderboards)
+right away.
+
+A server that answers requests is live. It is ready once every phase has
+finished. A phase that raises leaves the server live but never ready, with
+the error on record, so /health can tell "loading" from "broken". Each
+phase's duration is kept, plus whatever details the phase returns.
+
+Phases can also run in the foreground with run(), e.g. loading the model
+in a pre-fork master so the workers share it and then warming it up in the
+background in each worker; start() skips the phases that already ran.
+"""
+
+import threading
+import time
+
+# Startup states
+STARTING, READY, FAILED = 'starting', 'ready', 'failed'
+
+
+class ModelStartup:
+    """Runs named startup phases in order and reports their progress"""
+
+    def __init__(self, phases):
+        self.phases = tuple(phases)
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._records = {name: {'state': 'pending', 'seconds': None} for name in self.phases}
+        self._current = None
+        self._error = None
+        self.created = time.time()
+
+    def run(self, name, fn):
+        """Run one phase in the foreground; re-raises its error after recording it"""
+        with self._lock:
+            if self._records[name]['state'] != 'pending':
+                raise RuntimeError(f"Startup phase '{name}' already ran")
+            self._current = name
+            self._records[name]['state'] = 'running'
+        start = time.perf_counter()
+        try:
+            details = fn()
+        except Exception as e:
+            with self._lock:
+                self._records[name].update(state=FAILED, seconds=round(time.perf_counter() - start, 3))
+                self._error = f"{name}: {e}"
+                self._current = None
+            self._finished.set()
+            raise
+        with self._lock:
+            self._records[name].update(details or {}, state='done', seconds=round(time.perf_counter() - start, 3))
+            self._current = None
+            if all(record['state'] == 'done' for record in self._records.values()):
+                self._finished.set()
+        return details
+
+    def start(self, functions):
+        """Run the phases that haven't run yet in a background thread (none after a failure).
+
+        functions maps each remaining phase name to a callable taking no
+        arguments; it may return a dict of details to report with the phase.
+        """
+        if self._error is not None:
+            return
+        pending = [name for name in self.phases if self._records[name]['state'] == 'pending']
+
+        def run_all():
+            for name in pending:
+                try:
+                    self.run(name, functions[name])
+                except Exception as e:
+                    print(f"❌ Startup phase '{name}' failed: {e}")
+                    return
+
+        threading.Thread(target=run_all, name='model-startup', daemon=True).start()
+
+    def wait(self, timeout=None):
+        """Wait until the server is ready or startup failed; returns whether it is ready"""
+        self._finished.wait(timeout)
+        return self.ready
+
+    @property
+    def ready(self):
+        with self._lock:
+            return self._error is None and all(record['state'] == 'done' for record in self._records.values())
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._error is not None:
+                return FAILED
+            if all(record['state'] == 'done' for record in self._records.values()):
+                return READY
+            return STARTING
+
+    def status(self):
+        """State, the running phase, per-phase timings and the error, if any"""
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'ready': state == READY,
+                'phase': self._current,
+                'phases': {name: dict(record) for name, record in self._records.items()},
+                'error': self._error,
+                'uptime_seconds': round(time.time() - self.created, 1),
+            }
@@ -0,0 +1,110 @@
+"""
+Pre-fork serving for production.
+
+app.run() is Flask's development server, a single process. serve() instead
+lets the master process do the expensive setup once (load the model, build
+the answer index) and then forks the worker processes, which inherit it.
+The model weights are never written after loading, so the workers share
+their memory pages copy-on-write instead of each holding a copy.
+gc.freeze() moves the master's objects out of the collector's reach, so
+garbage collection in a worker doesn't write to, and un-share, their pages.
+
+The master binds the listening socket before forking. Every worker accepts
+connections on it with a threaded WSGI server, and the kernel hands each
+connection to one of them. The master only supervises: it restarts a
+worker that dies and stops all of them on SIGTERM or SIGINT. Every child
+that exits, workers included, is handed to on_child_exit, so children the
+master forked before serve() (inference processes) can be restarted and
+whatever a dead worker held in them returned.
+"""
+
+import gc
+import os
+import signal
+import socket
+import time
+import traceback
+
+from werkzeug.serving import make_server
+
+RESTART_DELAY_SECONDS = 1.0
+
+
+def default_threads(workers):
+    """Inference threads per worker so that all workers together use one per core"""
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _run_worker(app, host, port, sock, number, on_worker_start):
+    """Body of a forked worker process; never returns"""
+    code = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        if on_worker_start is not None:
+            on_worker_start(number)
+        server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+        print(f"👷 Worker {number} (pid {os.getpid()}) accepting connections")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        # Skip the master's atexit handlers and buffered state
+        os._exit(code)
+
+
+def serve(app, host, port, workers, on_worker_start=None, on_child_exit=None):
+    """Serve app from `workers` forked processes until SIGTERM or SIGINT.
+
+    on_worker_start(number) runs in each worker right after it is forked,
+    before it accepts connections (e.g. to size its inference threads).
+    on_child_exit(pid, status) runs in the master when any child exits,
+    before a worker is restarted (e.g. to restart an inference process, or
+    to take back the inference slots a dead worker held).
+    """
+    sock = socket.create_server((host, port), backlog=128)
+    sock.set_inheritable(True)
+    children = {}  # pid -> worker number
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def spawn(number):
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(app, host, port, sock, number, on_worker_start)
+        children[pid] = number
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    # Everything allocated so far is shared with the workers; keep it that way
+    gc.freeze()
+    for number in range(workers):
+        spawn(number)
+    print(f"✅ Master (pid {os.getpid()}) serving on {host}:{port} with {workers} worker(s)")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        number = children.pop(pid, None)
+        if on_child_exit is not None and not stopping:
+            on_child_exit(pid, status)
+        if number is not None and not stopping:
+            print(f"⚠️ Worker {number} (pid {pid}) exited with code {os.waitstatus_to_exitcode(status)}, restarting")
+            time.sleep(RESTART_DELAY_SECONDS)
+            if not stopping:
+                spawn(number)
+    sock.close()
+    print("👋 All workers stopped")
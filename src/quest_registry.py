@@ -0,0 +1,311 @@
+"""
+Central registry of quest files under the quests directory.
+
+Maps quest id -> file path plus a parsed summary so endpoints don't have to
+walk every folder and json.load every file to find one quest. Entries are
+invalidated by mtime: a lookup stats the quests root and the matched file,
+and only falls back to checking every folder when an id isn't found.
+generation changes whenever a quest is added, removed, rewritten or its
+summary changes, so callers can cache anything derived from the catalog.
+checkpoint_generation only changes when some quest's checkpoints do, so
+caches of checkpoint locations and answer photos survive new ratings.
+"""
+
+import json
+import os
+import threading
+
+from legacy_quest import load_legacy_quest
+from rating_store import current_rating
+
+# JSON files in a quest folder that are not quest definitions
+NON_QUEST_JSON_SUFFIXES = ('_metadata.json', '_stats.json')
+
+
+def list_quest_files(folder_path):
+    """Return the quest definition files in a folder.
+
+    JSON files are preferred; legacy .js files are only used when a folder
+    has no JSON quest. Metadata and stats files are never quest definitions.
+    """
+    try:
+        filenames = sorted(os.listdir(folder_path))
+    except OSError:
+        return []
+    json_files = [f for f in filenames if f.endswith('.json') and not f.endswith(NON_QUEST_JSON_SUFFIXES)]
+    js_files = [f for f in filenames if f.endswith('.js')]
+    return json_files if json_files else js_files
+
+
+def checkpoints_key(checkpoints):
+    """Comparable form of a quest's checkpoint list"""
+    return json.dumps(checkpoints, sort_keys=True, default=str)
+
+
+def parse_json_quest(path):
+    """Return (quest_id, summary, checkpoints key) for a JSON quest file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        quest_data = json.load(f)
+    quest_id = quest_data.get('id')
+    summary = {
+        'raw_id': quest_id,
+        'name': quest_data.get('name', ''),
+        'description': quest_data.get('description', ''),
+        'difficulty': quest_data.get('difficulty', 'Medium'),
+        'ageGroup': quest_data.get('ageGroup', 'All Ages'),
+        'distance': quest_data.get('distance', 'Unknown'),
+        'waypoints': len(quest_data.get('checkpoints', [])),
+        'rating': current_rating(path, quest_data.get('rating', 0)),
+        'enabled': quest_data.get('enabled', True),
+    }
+    return (str(quest_id) if quest_id else None), summary, checkpoints_key(quest_data.get('checkpoints'))
+
+
+def parse_js_quest(path):
+    """Return (quest_id, summary, checkpoints key) for a legacy .js quest file"""
+    quest_data = load_legacy_quest(path)
+    raw_id = quest_data.get('id')
+    # Legacy ids are kept as strings, as they appear in the source
+    quest_id = str(raw_id) if raw_id is not None and raw_id != '' else None
+
+    summary = None
+    if quest_data.get('name'):
+        summary = {
+            'raw_id': quest_id,
+            'name': quest_data['name'],
+            'description': quest_data['description'],
+            'difficulty': quest_data['difficulty'],
+            'ageGroup': quest_data['ageGroup'],
+            'distance': quest_data['distance'],
+            'waypoints': len(quest_data['checkpoints']),
+            'rating': 0,  # JS files don't have ratings yet
+            'enabled': quest_data['enabled'],
+        }
+    return quest_id, summary, checkpoints_key(quest_data.get('checkpoints'))
+
+
+class QuestRecord:
+    """One quest file known to the registry"""
+
+    __slots__ = ('path', 'folder', 'filename', 'is_json', 'mtime', 'quest_id', 'summary', 'checkpoints')
+
+    def __init__(self, path, folder, filename, mtime, quest_id, summary, checkpoints):
+        self.path = path
+        self.folder = folder
+        self.filename = filename
+        self.is_json = filename.endswith('.json')
+        self.mtime = mtime
+        self.quest_id = quest_id
+        self.summary = summary
+        self.checkpoints = checkpoints
+
+
+def _identity(record):
+    """What callers can derive from a record; None for a record that is gone"""
+    return None if record is None else (record.path, record.mtime, record.quest_id, record.summary)
+
+
+def _checkpoint_identity(record):
+    """What checkpoint listings derive from a record"""
+    return None if record is None else (record.path, record.quest_id, record.checkpoints)
+
+
+class QuestRegistry:
+    """Quest id -> QuestRecord map kept in sync with the quests directory"""
+
+    def __init__(self, quests_dir):
+        self.quests_dir = quests_dir
+        self._records = {}        # path -> QuestRecord
+        self._by_id = {}          # quest id string -> path
+        self._folder_mtimes = {}  # folder name -> mtime_ns when last scanned
+        self._folder_paths = {}   # folder name -> quest file paths loaded from it
+        self._root_mtime = None
+        self._built = False
+        self.generation = 0
+        self.checkpoint_generation = 0
+        self._lock = threading.RLock()
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load_record(self, path, folder, filename):
+        """Parse a quest file into a record, or None if unreadable"""
+        mtime = self._mtime(path)
+        if mtime is None:
+            return None
+        try:
+            if filename.endswith('.json'):
+                quest_id, summary, checkpoints = parse_json_quest(path)
+            else:
+                quest_id, summary, checkpoints = parse_js_quest(path)
+        except Exception as e:
+            print(f"Error reading quest file {filename} in {folder}: {e}")
+            return None
+        return QuestRecord(path, folder, filename, mtime, quest_id, summary, checkpoints)
+
+    def _changed(self, old_records, new_records):
+        """Bump the generations for records that were replaced (caller holds the lock)"""
+        if [_identity(r) for r in old_records] != [_identity(r) for r in new_records]:
+            self.generation += 1
+        if [_checkpoint_identity(r) for r in old_records] != [_checkpoint_identity(r) for r in new_records]:
+            self.checkpoint_generation += 1
+
+    def _reindex_ids(self):
+        """Rebuild the id map in folder/file order so the first file wins (caller holds the lock)"""
+        self._by_id = {}
+        for path in sorted(self._records):
+            record = self._records[path]
+            if record.quest_id is not None and record.quest_id not in self._by_id:
+                self._by_id[record.quest_id] = path
+
+    def _scan_folder(self, folder):
+        """(Re)load the quest files of one folder (caller holds the lock)"""
+        folder_path = os.path.join(self.quests_dir, folder)
+        old_records = [self._records.pop(path, None) for path in self._folder_paths.pop(folder, ())]
+
+        mtime = self._mtime(folder_path)
+        if mtime is None or not os.path.isdir(folder_path):
+            self._folder_mtimes.pop(folder, None)
+            self._changed(old_records, [])
+            return
+
+        for filename in list_quest_files(folder_path):
+            path = os.path.join(folder_path, filename)
+            record = self._load_record(path, folder, filename)
+            if record:
+                self._records[path] = record
+                self._folder_paths.setdefault(folder, []).append(path)
+        self._folder_mtimes[folder] = mtime
+
+        # Leaderboard and rating writes touch the folder too; only count real catalog changes
+        new_records = [self._records[path] for path in self._folder_paths.get(folder, ())]
+        self._changed(old_records, new_records)
+
+    def _list_folders(self):
+        try:
+            return sorted(f for f in os.listdir(self.quests_dir) if os.path.isdir(os.path.join(self.quests_dir, f)))
+        except OSError:
+            return []
+
+    def build(self):
+        """Scan and parse every quest file from scratch"""
+        with self._lock:
+            self._records = {}
+            self._folder_mtimes = {}
+            self._folder_paths = {}
+            self._root_mtime = self._mtime(self.quests_dir)
+            for folder in self._list_folders():
+                self._scan_folder(folder)
+            self._reindex_ids()
+            self._built = True
+            self.generation += 1
+            self.checkpoint_generation += 1
+
+    def refresh(self, full=False):
+        """Pick up added or removed quest folders, and with full=True edited files too"""
+        with self._lock:
+            if not self._built:
+                self.build()
+                return
+
+            changed = False
+            root_mtime = self._mtime(self.quests_dir)
+            if root_mtime != self._root_mtime:
+                self._root_mtime = root_mtime
+                folders = self._list_folders()
+                for folder in folders:
+                    if folder not in self._folder_mtimes:
+                        self._scan_folder(folder)
+                for folder in set(self._folder_mtimes) - set(folders):
+                    self._scan_folder(folder)
+                changed = True
+
+            if full:
+                for folder, mtime in list(self._folder_mtimes.items()):
+                    if self._mtime(os.path.join(self.quests_dir, folder)) != mtime:
+                        self._scan_folder(folder)
+                        changed = True
+                for path, record in list(self._records.items()):
+                    if self._mtime(path) != record.mtime:
+                        changed |= self._reload(path)
+
+            if changed:
+                self._reindex_ids()
+
+    def _reload(self, path):
+        """Re-parse one known quest file (caller holds the lock).
+
+        Returns True when the id map needs rebuilding, i.e. the file's id
+        changed or the file disappeared.
+        """
+        record = self._records.get(path)
+        if record is None:
+            return False
+        new_record = self._load_record(path, record.folder, record.filename)
+        self._changed([record], [new_record])
+        if new_record is None:
+            del self._records[path]
+            return True
+        self._records[path] = new_record
+        return new_record.quest_id != record.quest_id
+
+    def rescan_folder(self, folder):
+        """Re-read one folder right after the server added a quest file to it"""
+        with self._lock:
+            if not self._built:
+                self.build()
+                return
+            self._scan_folder(folder)
+            self._reindex_ids()
+
+    def invalidate(self, path):
+        """Re-parse a quest file right after the server wrote it"""
+        with self._lock:
+            if self._built and self._reload(path):
+                self._reindex_ids()
+
+    def _match(self, quest_id, json_only):
+        """Look up an id, accepting the legacy 'quest_<n>' form for numeric ids (caller holds the lock)"""
+        quest_id = str(quest_id)
+        candidates = [quest_id]
+        if quest_id.isdigit():
+            candidates.append(f"quest_{quest_id}")
+        for candidate in candidates:
+            path = self._by_id.get(candidate)
+            if path is None:
+                continue
+            record = self._records.get(path)
+            if record is None or (json_only and not record.is_json):
+                continue
+            return record
+        return None
+
+    def find(self, quest_id, json_only=False):
+        """Return the QuestRecord for a quest id, or None"""
+        with self._lock:
+            self.refresh()
+            record = self._match(quest_id, json_only)
+            if record is not None and self._mtime(record.path) != record.mtime:
+                # The file was edited since it was parsed; its id may have changed
+                if self._reload(record.path):
+                    self._reindex_ids()
+                record = self._match(quest_id, json_only)
+            if record is None:
+                # Slow path: a file may have been added or edited by hand
+                self.refresh(full=True)
+                record = self._match(quest_id, json_only)
+            return record
+
+    def find_path(self, quest_id):
+        """Return the path of the JSON quest file with the given id, or None"""
+        record = self.find(quest_id, json_only=True)
+        return record.path if record else None
+
+    def records(self):
+        """Return every current quest record in folder/file order"""
+        with self._lock:
+            self.refresh(full=True)
+            return [self._records[path] for path in sorted(self._records)]
@@ -0,0 +1,196 @@
+"""
+Crash-safe, concurrency-safe writes for quest files.
+
+- quest_lock(path) serializes writers of one file across threads (a lock
+  per path) and across processes (flock on a sidecar .lock file, where
+  fcntl is available).
+- atomic_write_* write to a temp file in the same folder, fsync it and
+  rename it over the target, so readers never see a half-written file
+  and a crash leaves either the old or the new version. atomic_move puts
+  a file that was written elsewhere in place the same way.
+- WriteCoalescer groups updates to the same file that arrive close
+  together and applies them with one lock acquisition and one write,
+  while every caller still gets its own result back.
+"""
+
+import errno
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock_for(path):
+    with _thread_locks_guard:
+        lock = _thread_locks.get(path)
+        if lock is None:
+            lock = _thread_locks[path] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def quest_lock(path):
+    """Hold the exclusive write lock for a file across threads and processes"""
+    path = os.path.abspath(path)
+    with _thread_lock_for(path):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write_bytes(path, data):
+    """Write bytes to path via a temp file and rename"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_move(src, path):
+    """Move a finished file to path; across filesystems it is copied via a temp file and rename"""
+    try:
+        os.replace(src, path)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(src, 'rb') as source, open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(source, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.remove(src)
+
+
+def atomic_write_text(path, text):
+    """Write UTF-8 text to path via a temp file and rename"""
+    atomic_write_bytes(path, text.encode('utf-8'))
+
+
+def atomic_write_json(path, data, indent=2):
+    """Serialize data as JSON and write it to path via a temp file and rename"""
+    atomic_write_text(path, json.dumps(data, indent=indent, ensure_ascii=False))
+
+
+class _PendingBatch:
+    def __init__(self, flush):
+        self.flush = flush
+        self.ops = []
+        self.futures = []
+
+
+class WriteCoalescer:
+    """Group commit for file updates.
+
+    The first caller for a path becomes the leader: it waits a short window,
+    takes the file's lock, and hands every operation queued for that path so
+    far to the flush function in one call. Later callers just wait for their
+    result. flush(ops) runs under quest_lock(path) and returns one result per
+    op, in order.
+    """
+
+    def __init__(self, window_ms=2):
+        self.window = max(0.0, window_ms / 1000.0)
+        self._pending = {}  # path -> _PendingBatch
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.ops = 0
+
+    def submit(self, path, flush, op):
+        """Queue op for path and block until it has been written; returns its result"""
+        path = os.path.abspath(path)
+        future = Future()
+        with self._lock:
+            batch = self._pending.get(path)
+            leader = batch is None
+            if leader:
+                batch = self._pending[path] = _PendingBatch(flush)
+            batch.ops.append(op)
+            batch.futures.append(future)
+
+        if leader:
+            if self.window:
+                time.sleep(self.window)
+            with quest_lock(path):
+                # Close the batch only once we hold the lock, so anything that
+                # arrived while a previous batch was writing rides along
+                with self._lock:
+                    self._pending.pop(path, None)
+                    self.batches += 1
+                    self.ops += len(batch.ops)
+                try:
+                    results = batch.flush(batch.ops)
+                except BaseException as e:
+                    for waiting in batch.futures:
+                        waiting.set_exception(e)
+                else:
+                    for waiting, result in zip(batch.futures, results):
+                        waiting.set_result(result)
+
+        return future.result()
+
+    def stats(self):
+        """Return how many writes were coalesced into how many flushes"""
+        with self._lock:
+            return {
+                'flushes': self.batches,
+                'operations': self.ops,
+                'mean_operations_per_flush': self.ops / self.batches if self.batches else 0,
+            }
+
+
+coalescer = WriteCoalescer(window_ms=float(os.environ.get('WRITE_COALESCE_MS', 2)))
+
+
+def update_json(path, mutate):
+    """Apply mutate(data) to a JSON file as a locked, atomic, coalesced read-modify-write.
+
+    Returns whatever mutate returns for this caller; if mutate raises, the
+    exception is re-raised here without affecting the other coalesced writes.
+    """
+    def flush(mutations):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        results = []
+        for mutation in mutations:
+            try:
+                results.append((True, mutation(data)))
+            except Exception as e:
+                results.append((False, e))
+        atomic_write_json(path, data)
+        return results
+
+    ok, result = coalescer.submit(path, flush, mutate)
+    if not ok:
+        raise result
+    return result
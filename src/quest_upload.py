@@ -0,0 +1,80 @@
+"""
+Streaming parser for multipart quest submissions.
+
+The JSON submission format carries every photo as a base64 string inside
+the request body, so the whole quest is held in memory (and the decoded
+bytes next to it) while it is processed. A multipart submission instead
+sends questData as a form field and each photo as its own file part named
+photos.<waypoint>.<photo>, e.g. photos.0.1 for the second photo of the
+first waypoint.
+
+parse_quest_upload() streams those parts straight into files under a
+per-upload staging directory as they arrive, in chunks, so peak memory no
+longer depends on the size or number of the photos. It returns the photos
+in the same {waypoint: {photo: {...}}} shape as zipData.photos, with a
+'path' in place of base64 'data'.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+
+from werkzeug.formparser import FormDataParser
+
+# photos.<waypoint index>.<photo index>
+PHOTO_FIELD = re.compile(r'^photos\.(\d+)\.(\d+)$')
+
+# Non-file fields (questData) are kept in memory, so they are capped
+MAX_FORM_MEMORY = int(os.environ.get('UPLOAD_MAX_FORM_MEMORY', 1024 * 1024))
+MAX_FORM_PARTS = 1000
+
+
+class QuestUpload:
+    """A parsed multipart submission whose photos are staged on disk"""
+
+    def __init__(self, form, photos, staging_dir):
+        self.form = form
+        self.photos = photos          # {waypoint: {photo: {'path': staged file}}}
+        self.staging_dir = staging_dir
+
+    def cleanup(self):
+        """Remove whatever is left of the staged photos"""
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+
+def parse_quest_upload(stream, mimetype, content_length, options, upload_dir):
+    """Stream a multipart quest submission to disk; returns a QuestUpload.
+
+    Every file part goes to its own file in a fresh directory under
+    upload_dir. Parts that aren't photos.<waypoint>.<photo> are discarded.
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix='upload-', dir=upload_dir)
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        # Each part is written here chunk by chunk as the parser reads it
+        return tempfile.NamedTemporaryFile(dir=staging_dir, suffix='.part', delete=False)
+
+    try:
+        parser = FormDataParser(stream_factory, max_form_memory_size=MAX_FORM_MEMORY,
+                                max_form_parts=MAX_FORM_PARTS, silent=False)
+        _, form, files = parser.parse(stream, mimetype, content_length, options)
+
+        photos = {}
+        for field, upload in files.items(multi=True):
+            staged = upload.stream
+            staged.flush()
+            os.fsync(staged.fileno())
+            staged.close()
+            match = PHOTO_FIELD.match(field)
+            waypoint_photos = photos.setdefault(match.group(1), {}) if match else None
+            if match is None or match.group(2) in waypoint_photos or os.path.getsize(staged.name) == 0:
+                os.remove(staged.name)
+                continue
+            waypoint_photos[match.group(2)] = {'path': staged.name}
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    return QuestUpload(form, photos, staging_dir)
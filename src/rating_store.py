@@ -0,0 +1,192 @@
+"""
+Running rating aggregates, one per quest folder.
+
+Votes are folded into rating_stats.json next to the quest file, which holds
+a count, a sum and a 1-5 histogram. Rating a quest is O(1), and the quest
+JSON that /api/quests parses no longer grows with every vote. Raw votes go
+to a cold append-only log (ratings.jsonl) that nothing reads on the hot
+path; set RATING_LOG=0 to stop keeping it.
+
+Quests rated before this existed keep their votes in the quest JSON's
+leaderboard.ratings array. The first new vote seeds the aggregates and the
+cold log from that array and drops it from the quest file. Malformed votes
+in it (not an object, or no 1-5 rating) are counted, logged and left out.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+from quest_storage import atomic_write_text, coalescer, update_json
+
+STATS_FILENAME = "rating_stats.json"
+LOG_FILENAME = "ratings.jsonl"
+RATING_VALUES = (1, 2, 3, 4, 5)
+
+KEEP_RATING_LOG = os.environ.get('RATING_LOG', '1') != '0'
+
+
+def empty_rating_stats():
+    """Aggregates for a quest nobody has rated yet"""
+    return {'count': 0, 'sum': 0, 'histogram': {str(value): 0 for value in RATING_VALUES}}
+
+
+def valid_rating(rating):
+    """Whether rating is a 1-5 star vote; bools are ints in Python but not votes"""
+    return isinstance(rating, int) and not isinstance(rating, bool) and rating in RATING_VALUES
+
+
+def valid_vote(vote):
+    """Whether vote is a stored vote object with a 1-5 rating"""
+    return isinstance(vote, dict) and valid_rating(vote.get('rating'))
+
+
+def legacy_votes(quest_data):
+    """The votes in a legacy quest JSON's leaderboard.ratings, as (valid votes, number of malformed ones)"""
+    leaderboard = quest_data.get('leaderboard') if isinstance(quest_data, dict) else None
+    ratings = leaderboard.get('ratings') if isinstance(leaderboard, dict) else None
+    if not isinstance(ratings, list):
+        return [], 0
+    votes = [vote for vote in ratings if valid_vote(vote)]
+    return votes, len(ratings) - len(votes)
+
+
+def apply_rating(stats, rating):
+    """Fold one vote into the aggregates"""
+    if not valid_rating(rating):
+        raise ValueError(f"Rating must be one of {RATING_VALUES}, got {rating!r}")
+    stats['count'] += 1
+    stats['sum'] += rating
+    stats['histogram'][str(rating)] = stats['histogram'].get(str(rating), 0) + 1
+    return stats
+
+
+def average_rating(stats):
+    """Average rating rounded to one decimal, as stored in the quest's rating field"""
+    return round(stats['sum'] / stats['count'], 1) if stats['count'] else 0
+
+
+def public_rating_stats(stats):
+    """The rating fields exposed by the API"""
+    return {'average': average_rating(stats), 'count': stats['count'], 'histogram': dict(stats['histogram'])}
+
+
+def read_rating_stats(folder_path):
+    """Return a folder's rating aggregates, or None if it has none yet"""
+    try:
+        with open(os.path.join(folder_path, STATS_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def current_rating(quest_file_path, fallback=0):
+    """Average rating of a quest: from its aggregates if it has any, else the quest file's own value"""
+    stats = read_rating_stats(os.path.dirname(os.path.abspath(quest_file_path)))
+    return average_rating(stats) if stats is not None else fallback
+
+
+class RatingStore:
+    """Rating aggregates plus optional cold vote log for one quest"""
+
+    def __init__(self, quest_file_path):
+        self.quest_file_path = quest_file_path
+        self.folder_path = os.path.dirname(os.path.abspath(quest_file_path))
+        self.stats_path = os.path.join(self.folder_path, STATS_FILENAME)
+        self.log_path = os.path.join(self.folder_path, LOG_FILENAME)
+
+    def _append_log(self, votes):
+        if not KEEP_RATING_LOG or not votes:
+            return
+        data = ''.join(json.dumps(vote) + '\n' for vote in votes).encode('utf-8')
+        with open(self.log_path, 'ab+') as f:
+            # A crash mid-append can leave a torn last line; start on a fresh one
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    data = b'\n' + data
+            f.write(data)
+
+    def _seed(self):
+        """Build the aggregates from votes stored in a legacy quest JSON (caller holds the lock)"""
+        with open(self.quest_file_path, 'r', encoding='utf-8') as f:
+            votes, malformed = legacy_votes(json.load(f))
+        stats = empty_rating_stats()
+        for vote in votes:
+            apply_rating(stats, vote['rating'])
+        self._append_log(votes)
+        atomic_write_text(self.stats_path, json.dumps(stats))
+
+        if votes or malformed:
+            def drop_votes(quest_data):
+                leaderboard = quest_data.get('leaderboard')
+                if isinstance(leaderboard, dict):
+                    leaderboard.pop('ratings', None)
+                quest_data['rating'] = average_rating(stats)
+            update_json(self.quest_file_path, drop_votes)
+            print(f"✅ Moved {len(votes)} ratings for {os.path.basename(self.folder_path)} out of the quest file")
+        if malformed:
+            print(f"⚠️ Skipped {malformed} malformed legacy rating(s) for {os.path.basename(self.folder_path)}")
+        return stats
+
+    def _apply(self, votes):
+        """Record a batch of votes with one write (caller holds the lock).
+
+        Returns the public stats as they stood right after each vote.
+        """
+        stats = read_rating_stats(self.folder_path)
+        if stats is None:
+            stats = self._seed()
+        self._append_log(votes)
+        results = []
+        for vote in votes:
+            apply_rating(stats, vote['rating'])
+            results.append(public_rating_stats(stats))
+        atomic_write_text(self.stats_path, json.dumps(stats))
+        return results
+
+    def add(self, rating):
+        """Record one 1-5 vote; returns the new public stats"""
+        if not valid_rating(rating):
+            raise ValueError(f"Rating must be one of {RATING_VALUES}, got {rating!r}")
+        vote = {'rating': rating, 'timestamp': datetime.now().isoformat()}
+        return coalescer.submit(self.stats_path, self._apply, vote)
+
+    def stats(self):
+        """Return the public stats (from the quest JSON's votes if it was never rated since)"""
+        stats = read_rating_stats(self.folder_path)
+        if stats is None:
+            stats = empty_rating_stats()
+            with open(self.quest_file_path, 'r', encoding='utf-8') as f:
+                for vote in legacy_votes(json.load(f))[0]:
+                    apply_rating(stats, vote['rating'])
+        return public_rating_stats(stats)
+
+    def votes(self):
+        """Return every raw vote in the cold log"""
+        votes = []
+        if not os.path.exists(self.log_path):
+            return votes
+        with open(self.log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    votes.append(json.loads(line))
+                except json.JSONDecodeError:
+                    if line.strip():
+                        print(f"⚠️ Skipping corrupt rating line in {self.log_path}")
+        return votes
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_rating_store(quest_file_path):
+    """Return the shared rating store for a quest file"""
+    quest_file_path = os.path.abspath(quest_file_path)
+    with _stores_lock:
+        store = _stores.get(quest_file_path)
+        if store is None:
+            store = _stores[quest_file_path] = RatingStore(quest_file_path)
+        return store
@@ -0,0 +1,175 @@
+"""
+Derived renditions of answer photos.
+
+Answer photos are multi-megabyte phone JPEGs, often stored sideways with an
+EXIF orientation tag. Each one gets a few rotation-corrected JPEG copies:
+
+- clip: shortest side CLIP_INPUT_SIZE, the input size of the model
+- thumb: longest side 320, for lists and previews
+- display: longest side 1280, for full-screen viewing
+
+They live in a .renditions folder inside the quest folder, so the answer
+index never mistakes them for answer images. A manifest.json there records
+the original's (mtime_ns, size) signature, its upright size and each
+rendition's size. Renditions of an edited or replaced photo are rebuilt the
+next time they are asked for. best_path() returns the smallest rendition
+that fits a purpose, or the original when none does (or it can't be
+decoded).
+"""
+
+import io
+import json
+import os
+import threading
+
+from PIL import Image, ImageOps
+
+from image_decode import CLIP_INPUT_SIZE
+from quest_storage import atomic_write_bytes, atomic_write_json, quest_lock
+
+RENDITIONS_DIRNAME = '.renditions'
+MANIFEST_FILENAME = 'manifest.json'
+RENDITION_QUALITY = 90
+ORIENTATION_TAG = 0x0112
+
+# name -> target size: ('min', n) scales the shortest side to n, ('max', n) the longest
+RENDITIONS = {
+    'clip': ('min', CLIP_INPUT_SIZE),
+    'thumb': ('max', 320),
+    'display': ('max', 1280),
+}
+
+
+def rendition_filename(filename, name):
+    """File name of one rendition of an answer photo"""
+    return f"{os.path.splitext(filename)[0]}.{name}.jpg"
+
+
+def _signature(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _target_size(size, target):
+    """Size of a rendition; never larger than the original"""
+    width, height = size
+    kind, limit = target
+    side = min(width, height) if kind == 'min' else max(width, height)
+    scale = min(1.0, limit / side)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def render(image_path, out_dir):
+    """Write every rendition of one photo into out_dir; returns its manifest entry"""
+    filename = os.path.basename(image_path)
+    signature = _signature(image_path)
+    with Image.open(image_path) as image:
+        # Orientations 5-8 swap width and height
+        width, height = image.size
+        if image.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+            width, height = height, width
+        sizes = {name: _target_size((width, height), target) for name, target in RENDITIONS.items()}
+        if image.format == 'JPEG':
+            # Decode at the smallest DCT scale that still covers the largest rendition
+            needed = max(min(size) for size in sizes.values())
+            image.draft('RGB', (needed, needed))
+        upright = ImageOps.exif_transpose(image.convert('RGB'))
+
+    entry = {'signature': signature, 'width': width, 'height': height, 'renditions': {}}
+    for name, size in sizes.items():
+        resized = upright if upright.size == size else upright.resize(size, Image.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, 'JPEG', quality=RENDITION_QUALITY)
+        out_name = rendition_filename(filename, name)
+        atomic_write_bytes(os.path.join(out_dir, out_name), buffer.getvalue())
+        entry['renditions'][name] = {'file': out_name, 'width': size[0], 'height': size[1]}
+    return entry
+
+
+class RenditionStore:
+    """Creates renditions on demand and keeps each folder's manifest in memory"""
+
+    def __init__(self):
+        self._manifests = {}  # folder -> {filename: entry}
+        self._lock = threading.Lock()
+
+    def _dir(self, folder):
+        return os.path.join(folder, RENDITIONS_DIRNAME)
+
+    def _load_manifest(self, folder):
+        """Return a folder's manifest, reading it from disk once (caller holds the lock)"""
+        manifest = self._manifests.get(folder)
+        if manifest is None:
+            try:
+                with open(os.path.join(self._dir(folder), MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                manifest = {}
+            self._manifests[folder] = manifest
+        return manifest
+
+    def _fresh_entry(self, image_path):
+        """The manifest entry for a photo if its renditions are current, else None"""
+        folder, filename = os.path.split(os.path.abspath(image_path))
+        with self._lock:
+            entry = self._load_manifest(folder).get(filename)
+        if entry is None or entry['signature'] != _signature(image_path):
+            return None
+        return entry
+
+    def ensure_many(self, image_paths, map_fn=map):
+        """Create missing or stale renditions; returns {path: entry or None if undecodable}.
+
+        Renditions are rendered with map_fn(fn, paths), so a parallel map
+        spreads them over threads. Each folder's manifest is written once.
+        """
+        entries = {path: self._fresh_entry(path) for path in image_paths}
+        missing = [path for path, entry in entries.items() if entry is None]
+
+        def render_one(path):
+            out_dir = self._dir(os.path.dirname(os.path.abspath(path)))
+            os.makedirs(out_dir, exist_ok=True)
+            try:
+                return render(path, out_dir)
+            except Exception as e:
+                print(f"⚠️ Could not render {os.path.basename(path)}: {e}")
+                return None
+
+        rendered = {}  # folder -> {filename: entry}
+        for path, entry in zip(missing, map_fn(render_one, missing)):
+            entries[path] = entry
+            if entry is not None:
+                folder, filename = os.path.split(os.path.abspath(path))
+                rendered.setdefault(folder, {})[filename] = entry
+
+        for folder, new_entries in rendered.items():
+            manifest_path = os.path.join(self._dir(folder), MANIFEST_FILENAME)
+            with self._lock, quest_lock(manifest_path):
+                # Another process may have added entries since we loaded it
+                self._manifests.pop(folder, None)
+                manifest = self._load_manifest(folder)
+                manifest.update(new_entries)
+                atomic_write_json(manifest_path, manifest)
+        return entries
+
+    def best_path(self, image_path, min_side=None, max_side=None):
+        """Path of the smallest rendition at least min_side on its short side
+        (or max_side on its long side), falling back to the original"""
+        entry = self.ensure_many([image_path])[image_path]
+        if entry is not None:
+            folder = os.path.dirname(os.path.abspath(image_path))
+            fits = [
+                r for r in entry['renditions'].values()
+                if (min_side is None or min(r['width'], r['height']) >= min(min_side, entry['width'], entry['height']))
+                and (max_side is None or max(r['width'], r['height']) >= min(max_side, max(entry['width'], entry['height'])))
+            ]
+            if fits:
+                smallest = min(fits, key=lambda r: r['width'] * r['height'])
+                path = os.path.join(self._dir(folder), smallest['file'])
+                if os.path.exists(path):
+                    return path
+        return image_path
+
+    def model_path(self, image_path):
+        """The file to embed for an answer photo"""
+        return self.best_path(image_path, min_side=CLIP_INPUT_SIZE)
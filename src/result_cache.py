@@ -0,0 +1,101 @@
+"""
+LRU + TTL cache of /compare results.
+
+Players on flaky connections retry /compare with the very same photo. The
+result only depends on the photo, the answer images it is compared against
+and the model, so it is cached under a key made of a SHA-256 of the photo
+bytes, the sorted answer filenames and the embedding version. Uploads are
+hashed in chunks and rewound, so the photo is never held in memory whole. A hit is
+answered without decoding the photo or running the model. Entries expire
+after ttl_seconds, so edited answer photos are picked up eventually, and
+the least recently used entry is evicted once max_entries is reached.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+HASH_CHUNK_BYTES = 64 * 1024
+
+
+def image_digest(image):
+    """SHA-256 of image bytes, or of a seekable binary file object read in chunks and rewound"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(image).hexdigest()
+    start = image.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: image.read(HASH_CHUNK_BYTES), b''):
+        digest.update(chunk)
+    image.seek(start)
+    return digest.hexdigest()
+
+
+def compare_key(image, answer_images, model_version):
+    """Cache key for comparing a photo (bytes or a seekable file object) against a set of answer images"""
+    return (image_digest(image), tuple(sorted(answer_images)), model_version)
+
+
+class ResultCache:
+    """Thread-safe LRU cache whose entries also expire after a TTL"""
+
+    def __init__(self, max_entries=1024, ttl_seconds=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries if full"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
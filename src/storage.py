@@ -0,0 +1,691 @@
+"""
+Storage layer for quests, leaderboards and ratings.
+
+Endpoints talk to one storage object with the same interface whichever
+backend is configured:
+
+- FileStorage (default): the per-quest folders under quests/. Quest JSON
+  and legacy .js files are found through the QuestRegistry, leaderboards
+  live in each folder's append-only log, and ratings are running
+  aggregates next to the quest file (see rating_store).
+- SQLiteStorage: one SQLite database in WAL mode, so readers never block
+  the writer. Leaderboard stats and rating aggregates are kept in the same
+  transaction as each insert, and leaderboard reads walk an index that is
+  already in rank order.
+
+Answer images stay in the quest folders with either backend.
+migrate_folders_to_sqlite() copies the folders into a database once.
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import leaderboard_store
+import quest_storage
+import rating_store
+from legacy_quest import load_legacy_quest
+from quest_registry import QuestRegistry
+
+BACKENDS = ('file', 'sqlite')
+
+# How often the file backend stats every quest folder to notice changes made
+# outside this process (other workers, hand edits); its own writes show up at once
+CATALOG_CHECK_SECONDS = float(os.environ.get('CATALOG_CHECK_SECONDS', 1.0))
+
+
+def id_candidates(quest_id):
+    """Ids a request may refer to: numeric ids also match the legacy 'quest_<n>' form"""
+    quest_id = str(quest_id)
+    return [quest_id, f"quest_{quest_id}"] if quest_id.isdigit() else [quest_id]
+
+
+def encode_cursor(key):
+    """Opaque leaderboard cursor for a rank key (waypoints, completion time, sequence)"""
+    neg_waypoints, completion_time, seq = key
+    if completion_time is None or completion_time == float('inf'):
+        completion_time = ''  # no time: ranks after every timed entry (see leaderboard_store.rank_key)
+    return f"{-neg_waypoints}:{completion_time}:{seq}"
+
+
+def decode_cursor(cursor):
+    """Turn a cursor back into a rank key; raises ValueError if it is malformed"""
+    waypoints, completion_time, seq = cursor.split(':')
+    if completion_time == '':
+        completion_time = float('inf')
+    else:
+        completion_time = float(completion_time)
+        if not math.isfinite(completion_time):
+            raise ValueError(f"Invalid completion time in cursor: {cursor}")
+        if completion_time.is_integer():
+            completion_time = int(completion_time)
+    return (-int(waypoints), completion_time, int(seq))
+
+
+def leaderboard_page(entries, stats, total, cursor_key):
+    """The dict both backends return from get_leaderboard()"""
+    return {
+        'entries': entries,
+        'stats': stats,
+        'total': total,
+        'next_cursor': encode_cursor(cursor_key) if cursor_key is not None else None,
+    }
+
+
+def quest_checkpoints(quest_id, folder, quest_data):
+    """The located checkpoints of one quest, as list_checkpoints() returns them"""
+    checkpoints = []
+    for index, checkpoint in enumerate(quest_data.get('checkpoints') or []):
+        lat, lng = checkpoint.get('lat'), checkpoint.get('lng')
+        if not isinstance(lat, (int, float)) or not isinstance(lng, (int, float)) or (not lat and not lng):
+            continue
+        answer_images = checkpoint.get('answerImage') or []
+        checkpoints.append({
+            'quest_id': quest_id,
+            'folder': folder,
+            'checkpoint_id': checkpoint.get('id', index + 1),
+            'name': checkpoint.get('name', f"Waypoint {index + 1}"),
+            'lat': float(lat),
+            'lng': float(lng),
+            'answer_images': answer_images if isinstance(answer_images, list) else [answer_images],
+        })
+    return checkpoints
+
+
+class FileStorage:
+    """Quests, leaderboards and ratings stored in the quest folders"""
+
+    name = 'file'
+
+    def __init__(self, quests_dir):
+        self.quests_dir = quests_dir
+        self.registry = QuestRegistry(quests_dir)
+        self._last_full_check = 0.0
+
+    def prepare(self):
+        """Index the quest folders up front"""
+        self.registry.build()
+        self._last_full_check = time.monotonic()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._last_full_check >= CATALOG_CHECK_SECONDS:
+            self._last_full_check = now
+            self.registry.refresh(full=True)
+        else:
+            # Only stats the quests root: picks up added and removed folders
+            self.registry.refresh()
+
+    def catalog_version(self):
+        """Token that changes whenever list_quests() or list_checkpoints() would return something different"""
+        self._refresh()
+        return self.registry.generation
+
+    def checkpoints_version(self):
+        """Token that changes whenever list_checkpoints() would return something different (not on ratings)"""
+        self._refresh()
+        return self.registry.checkpoint_generation
+
+    def list_quests(self):
+        """Return quest summaries in folder order.
+
+        Each summary has raw_id, name, description, difficulty, ageGroup,
+        distance, waypoints, rating, enabled, folder, filename and is_json.
+        """
+        quests = []
+        for record in self.registry.records():
+            if record.summary is None:
+                # Legacy JS file without a quest name
+                continue
+            quests.append(dict(record.summary, folder=record.folder, filename=record.filename, is_json=record.is_json))
+        return quests
+
+    def get_quest(self, quest_id):
+        """Return {content, folder, filename, is_json} for a quest, or None"""
+        record = self.registry.find(quest_id)
+        if record is None:
+            return None
+        if record.is_json:
+            with open(record.path, 'r', encoding='utf-8') as f:
+                quest_data = json.load(f)
+            quest_data['rating'] = record.summary['rating'] if record.summary else quest_data.get('rating', 0)
+            # Leaderboards and votes are served by their own endpoints (and may be stale here)
+            quest_data.pop('leaderboard', None)
+        else:
+            # Legacy .js quests are served in the JSON quest shape
+            quest_data = load_legacy_quest(record.path)
+        content = json.dumps(quest_data, indent=2)
+        return {'content': content, 'folder': record.folder, 'filename': record.filename, 'is_json': record.is_json}
+
+    def list_checkpoints(self):
+        """Return every checkpoint that has coordinates, across all quests"""
+        checkpoints = []
+        for record in self.registry.records():
+            if record.quest_id is None:
+                continue
+            try:
+                if record.is_json:
+                    with open(record.path, 'r', encoding='utf-8') as f:
+                        quest_data = json.load(f)
+                else:
+                    quest_data = load_legacy_quest(record.path)
+            except (OSError, ValueError) as e:
+                print(f"Error reading checkpoints of {record.filename}: {e}")
+                continue
+            checkpoints.extend(quest_checkpoints(record.quest_id, record.folder, quest_data))
+        return checkpoints
+
+    def load_quest(self, quest_id):
+        """Return the parsed definition of a JSON quest, or None"""
+        path = self.registry.find_path(quest_id)
+        if path is None:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            quest_data = json.load(f)
+        quest_data['rating'] = rating_store.current_rating(path, quest_data.get('rating', 0))
+        quest_data.pop('leaderboard', None)
+        return quest_data
+
+    def save_quest(self, quest_data, folder_path, filename):
+        """Write a new quest definition into its folder"""
+        quest_storage.atomic_write_text(os.path.join(folder_path, filename), json.dumps(quest_data, indent=2))
+        # The folder may have been scanned (still empty) while its photos were written
+        self.registry.rescan_folder(os.path.basename(folder_path))
+
+    def add_leaderboard_entry(self, quest_id, entry):
+        """Append a leaderboard entry; returns False if the quest doesn't exist"""
+        path = self.registry.find_path(quest_id)
+        if path is None:
+            return False
+        leaderboard_store.add_entry(path, entry)
+        return True
+
+    def get_leaderboard(self, quest_id, limit=None, offset=0, cursor=None):
+        """Return a page of the leaderboard in rank order, or None if the quest doesn't exist.
+
+        The result has entries, stats, total and next_cursor; pass next_cursor
+        back as cursor to continue after the last entry (it takes precedence
+        over offset).
+        """
+        path = self.registry.find_path(quest_id)
+        if path is None:
+            return None
+        after = decode_cursor(cursor) if cursor else None
+        ranked, stats = leaderboard_store.ranked_leaderboard(path)
+        entries, total, cursor_key = ranked.page(offset, limit, after)
+        return leaderboard_page(entries, stats, total, cursor_key)
+
+    def get_leaderboard_rank(self, quest_id, team_name):
+        """Return (rank, entry) for a team's best entry ((None, None) if it has none), or None if the quest doesn't exist"""
+        path = self.registry.find_path(quest_id)
+        if path is None:
+            return None
+        ranked, _ = leaderboard_store.ranked_leaderboard(path)
+        return ranked.rank(team_name)
+
+    def add_rating(self, quest_id, rating):
+        """Record a 1-5 rating; returns the new {average, count, histogram} or None if the quest doesn't exist"""
+        path = self.registry.find_path(quest_id)
+        if path is None:
+            return None
+        result = rating_store.get_rating_store(path).add(rating)
+        self.registry.invalidate(path)
+        return result
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quests (
+    id TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    is_json INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    difficulty TEXT NOT NULL DEFAULT 'Medium',
+    age_group TEXT NOT NULL DEFAULT 'All Ages',
+    distance TEXT NOT NULL DEFAULT 'Unknown',
+    waypoints INTEGER NOT NULL DEFAULT 0,
+    enabled INTEGER NOT NULL DEFAULT 1,
+    rating REAL NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_1 INTEGER NOT NULL DEFAULT 0,
+    rating_2 INTEGER NOT NULL DEFAULT 0,
+    rating_3 INTEGER NOT NULL DEFAULT 0,
+    rating_4 INTEGER NOT NULL DEFAULT 0,
+    rating_5 INTEGER NOT NULL DEFAULT 0,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_quests_rating ON quests (rating);
+CREATE INDEX IF NOT EXISTS idx_quests_folder ON quests (folder, filename);
+
+-- Bumped by triggers on every quest change so catalog caches know when to rebuild
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS quests_inserted AFTER INSERT ON quests
+    BEGIN UPDATE catalog_version SET version = version + 1; END;
+CREATE TRIGGER IF NOT EXISTS quests_updated AFTER UPDATE ON quests
+    BEGIN UPDATE catalog_version SET version = version + 1; END;
+CREATE TRIGGER IF NOT EXISTS quests_deleted AFTER DELETE ON quests
+    BEGIN UPDATE catalog_version SET version = version + 1; END;
+
+-- Like catalog_version, but ratings (which only update the rating columns) leave it alone
+CREATE TABLE IF NOT EXISTS checkpoints_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO checkpoints_version (id, version) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS quest_checkpoints_inserted AFTER INSERT ON quests
+    BEGIN UPDATE checkpoints_version SET version = version + 1; END;
+CREATE TRIGGER IF NOT EXISTS quest_checkpoints_updated AFTER UPDATE OF id, folder, content ON quests
+    BEGIN UPDATE checkpoints_version SET version = version + 1; END;
+CREATE TRIGGER IF NOT EXISTS quest_checkpoints_deleted AFTER DELETE ON quests
+    BEGIN UPDATE checkpoints_version SET version = version + 1; END;
+
+CREATE TABLE IF NOT EXISTS leaderboard_entries (
+    entry_id INTEGER PRIMARY KEY,
+    quest_id TEXT NOT NULL REFERENCES quests (id),
+    team_name TEXT,
+    waypoints_completed INTEGER NOT NULL DEFAULT 0,
+    completion_time INTEGER,
+    quest_date TEXT,
+    timestamp TEXT
+);
+-- Rank order puts entries without a time last, as FileStorage does
+DROP INDEX IF EXISTS idx_leaderboard_rank;
+DROP INDEX IF EXISTS idx_leaderboard_team;
+CREATE INDEX IF NOT EXISTS idx_leaderboard_order
+    ON leaderboard_entries (quest_id, waypoints_completed DESC, completion_time IS NULL, completion_time ASC);
+CREATE INDEX IF NOT EXISTS idx_leaderboard_team_order
+    ON leaderboard_entries (quest_id, team_name, waypoints_completed DESC, completion_time IS NULL, completion_time ASC);
+
+CREATE TABLE IF NOT EXISTS leaderboard_stats (
+    quest_id TEXT PRIMARY KEY REFERENCES quests (id),
+    total_completions INTEGER NOT NULL DEFAULT 0,
+    time_sum INTEGER NOT NULL DEFAULT 0,
+    best_time INTEGER,
+    last_updated TEXT
+);
+
+-- Cold log of raw votes, only written when RATING_LOG is on
+CREATE TABLE IF NOT EXISTS ratings (
+    rating_id INTEGER PRIMARY KEY,
+    quest_id TEXT NOT NULL REFERENCES quests (id),
+    rating INTEGER NOT NULL,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ratings_quest ON ratings (quest_id, rating);
+"""
+
+ENTRY_FIELDS = ('team_name', 'waypoints_completed', 'completion_time', 'quest_date', 'timestamp')
+# Leaderboard order, matching leaderboard_store.rank_key: entries without a time go last
+RANK_ORDER = "waypoints_completed DESC, completion_time IS NULL, completion_time ASC, entry_id ASC"
+
+
+class SQLiteStorage:
+    """Quests, leaderboards and ratings stored in one SQLite database (WAL mode)"""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self):
+        """Return this thread's connection (sqlite3 connections are per thread)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            # The schema script writes, so run it once rather than making every new thread wait for the writer
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def prepare(self):
+        """Create the database and schema if needed"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._connect()
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _find_row(self, conn, quest_id, json_only=False, columns='*'):
+        """Look up a quest by id, preferring an exact match over the 'quest_<n>' alias"""
+        for candidate in id_candidates(quest_id):
+            row = conn.execute(f"SELECT {columns} FROM quests WHERE id = ?", (candidate,)).fetchone()
+            if row is not None and (not json_only or row['is_json']):
+                return row
+        return None
+
+    def catalog_version(self):
+        """Token that changes whenever list_quests() or list_checkpoints() would return something different"""
+        return self._connect().execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()[0]
+
+    def checkpoints_version(self):
+        """Token that changes whenever list_checkpoints() would return something different (not on ratings)"""
+        return self._connect().execute("SELECT version FROM checkpoints_version WHERE id = 1").fetchone()[0]
+
+    def list_quests(self):
+        """Return quest summaries in folder order (same shape as FileStorage)"""
+        rows = self._connect().execute(
+            "SELECT id, folder, filename, is_json, name, description, difficulty, age_group, distance, "
+            "waypoints, enabled, rating FROM quests ORDER BY folder, filename"
+        ).fetchall()
+        quests = []
+        for row in rows:
+            raw_id = row['id']
+            if row['is_json'] and raw_id.isdigit():
+                raw_id = int(raw_id)
+            quests.append({
+                'raw_id': raw_id,
+                'name': row['name'],
+                'description': row['description'],
+                'difficulty': row['difficulty'],
+                'ageGroup': row['age_group'],
+                'distance': row['distance'],
+                'waypoints': row['waypoints'],
+                'rating': row['rating'],
+                'enabled': bool(row['enabled']),
+                'folder': row['folder'],
+                'filename': row['filename'],
+                'is_json': bool(row['is_json']),
+            })
+        return quests
+
+    def get_quest(self, quest_id):
+        """Return {content, folder, filename, is_json} for a quest, or None"""
+        row = self._find_row(self._connect(), quest_id, columns='id, folder, filename, is_json, rating, content')
+        if row is None:
+            return None
+        quest_data = json.loads(row['content'])
+        if row['is_json']:
+            quest_data['rating'] = row['rating']
+        content = json.dumps(quest_data, indent=2)
+        return {'content': content, 'folder': row['folder'], 'filename': row['filename'], 'is_json': bool(row['is_json'])}
+
+    def list_checkpoints(self):
+        """Return every checkpoint that has coordinates, across all quests"""
+        checkpoints = []
+        for row in self._connect().execute("SELECT id, folder, content FROM quests ORDER BY folder, filename"):
+            checkpoints.extend(quest_checkpoints(row['id'], row['folder'], json.loads(row['content'])))
+        return checkpoints
+
+    def load_quest(self, quest_id):
+        """Return the parsed definition of a JSON quest, or None"""
+        row = self._find_row(self._connect(), quest_id, json_only=True, columns='is_json, rating, content')
+        if row is None:
+            return None
+        quest_data = json.loads(row['content'])
+        quest_data['rating'] = row['rating']
+        return quest_data
+
+    def insert_quest(self, conn, quest_id, folder, filename, is_json, summary, content, rating_stats=None):
+        """Insert or replace one quest row (caller manages the transaction)"""
+        rating_stats = rating_stats or rating_store.empty_rating_stats()
+        histogram = [rating_stats['histogram'].get(str(value), 0) for value in rating_store.RATING_VALUES]
+        conn.execute(
+            "INSERT OR REPLACE INTO quests (id, folder, filename, is_json, name, description, difficulty, "
+            "age_group, distance, waypoints, enabled, rating, rating_count, rating_sum, "
+            "rating_1, rating_2, rating_3, rating_4, rating_5, content) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                quest_id, folder, filename, int(is_json), summary['name'], summary['description'],
+                summary['difficulty'], summary['ageGroup'], summary['distance'], summary['waypoints'],
+                int(bool(summary['enabled'])), summary['rating'] or 0, rating_stats['count'], rating_stats['sum'],
+                *histogram, content,
+            ),
+        )
+
+    def save_quest(self, quest_data, folder_path, filename):
+        """Store a new quest definition (its photos stay in folder_path)"""
+        quest_data = dict(quest_data)
+        quest_data.pop('leaderboard', None)
+        summary = {
+            'name': quest_data.get('name', ''),
+            'description': quest_data.get('description', ''),
+            'difficulty': quest_data.get('difficulty', 'Medium'),
+            'ageGroup': quest_data.get('ageGroup', 'All Ages'),
+            'distance': quest_data.get('distance', 'Unknown'),
+            'waypoints': len(quest_data.get('checkpoints', [])),
+            'rating': quest_data.get('rating', 0),
+            'enabled': quest_data.get('enabled', True),
+        }
+        with self._connect() as conn:
+            self.insert_quest(conn, str(quest_data['id']), os.path.basename(folder_path), filename, True, summary,
+                              json.dumps(quest_data, ensure_ascii=False))
+
+    def insert_entries(self, conn, quest_id, entries):
+        """Bulk insert leaderboard entries and fold them into the stats row (caller manages the transaction)"""
+        if not entries:
+            return
+        conn.executemany(
+            "INSERT INTO leaderboard_entries (quest_id, team_name, waypoints_completed, completion_time, quest_date, timestamp) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(quest_id,) + tuple(entry.get(field) for field in ENTRY_FIELDS) for entry in entries],
+        )
+        positive_times = [e.get('completion_time') or 0 for e in entries if (e.get('completion_time') or 0) > 0]
+        conn.execute(
+            "INSERT INTO leaderboard_stats (quest_id, total_completions, time_sum, best_time, last_updated) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (quest_id) DO UPDATE SET "
+            "total_completions = total_completions + excluded.total_completions, "
+            "time_sum = time_sum + excluded.time_sum, "
+            "best_time = CASE WHEN best_time IS NULL THEN excluded.best_time "
+            "                 WHEN excluded.best_time IS NULL THEN best_time "
+            "                 ELSE MIN(best_time, excluded.best_time) END, "
+            "last_updated = COALESCE(excluded.last_updated, last_updated)",
+            (
+                quest_id, len(entries), sum(e.get('completion_time') or 0 for e in entries),
+                min(positive_times) if positive_times else None,
+                entries[-1].get('timestamp') or datetime.now().isoformat(),
+            ),
+        )
+
+    def add_leaderboard_entry(self, quest_id, entry):
+        """Append a leaderboard entry; returns False if the quest doesn't exist"""
+        conn = self._connect()
+        with conn:
+            row = self._find_row(conn, quest_id, json_only=True, columns='id, is_json')
+            if row is None:
+                return False
+            self.insert_entries(conn, row['id'], [entry])
+        return True
+
+    def _stats(self, conn, quest_id):
+        row = conn.execute(
+            "SELECT total_completions, time_sum, best_time, last_updated FROM leaderboard_stats WHERE quest_id = ?",
+            (quest_id,),
+        ).fetchone()
+        if row is None:
+            return {'total_completions': 0, 'average_time': 0, 'best_time': None, 'last_updated': None}
+        total = row['total_completions']
+        return {
+            'total_completions': total,
+            'average_time': row['time_sum'] / total if total else 0,
+            'best_time': row['best_time'],
+            'last_updated': row['last_updated'],
+        }
+
+    def _entry(self, row):
+        return {field: row[field] for field in ENTRY_FIELDS if row[field] is not None}
+
+    def get_leaderboard(self, quest_id, limit=None, offset=0, cursor=None):
+        """Return a page of the leaderboard in rank order, or None if the quest doesn't exist (see FileStorage)"""
+        conn = self._connect()
+        row = self._find_row(conn, quest_id, json_only=True, columns='id, is_json')
+        if row is None:
+            return None
+        sql = ("SELECT entry_id, team_name, waypoints_completed, completion_time, quest_date, timestamp "
+               "FROM leaderboard_entries WHERE quest_id = ?")
+        params = [row['id']]
+        if cursor:
+            waypoints, completion_time, entry_id = decode_cursor(cursor)
+            waypoints = -waypoints
+            if completion_time == float('inf'):
+                # After an entry without a time only later untimed entries follow
+                sql += (" AND (waypoints_completed < ? OR (waypoints_completed = ? AND "
+                        "completion_time IS NULL AND entry_id > ?))")
+                params += [waypoints, waypoints, entry_id]
+            else:
+                sql += (" AND (waypoints_completed < ? OR (waypoints_completed = ? AND "
+                        "(completion_time IS NULL OR completion_time > ? OR (completion_time = ? AND entry_id > ?))))")
+                params += [waypoints, waypoints, completion_time, completion_time, entry_id]
+            offset = 0
+        # Walks idx_leaderboard_order in order (rowid breaks ties), so no sort step
+        sql += f" ORDER BY {RANK_ORDER} LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit + 1, max(0, offset)]
+        rows = conn.execute(sql, params).fetchall()
+
+        cursor_key = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            if rows:
+                last = rows[-1]
+                cursor_key = (-last['waypoints_completed'], last['completion_time'], last['entry_id'])
+        stats = self._stats(conn, row['id'])
+        return leaderboard_page([self._entry(r) for r in rows], stats, stats['total_completions'], cursor_key)
+
+    def get_leaderboard_rank(self, quest_id, team_name):
+        """Return (rank, entry) for a team's best entry ((None, None) if it has none), or None if the quest doesn't exist"""
+        conn = self._connect()
+        row = self._find_row(conn, quest_id, json_only=True, columns='id, is_json')
+        if row is None:
+            return None
+        best = conn.execute(
+            "SELECT entry_id, team_name, waypoints_completed, completion_time, quest_date, timestamp "
+            f"FROM leaderboard_entries WHERE quest_id = ? AND team_name = ? ORDER BY {RANK_ORDER} LIMIT 1",
+            (row['id'], team_name),
+        ).fetchone()
+        if best is None:
+            return None, None
+        waypoints, completion_time = best['waypoints_completed'], best['completion_time']
+        if completion_time is None:
+            # Every timed entry with as many waypoints ranks ahead of an untimed one
+            ahead = conn.execute(
+                "SELECT COUNT(*) FROM leaderboard_entries WHERE quest_id = ? AND (waypoints_completed > ? OR "
+                "(waypoints_completed = ? AND (completion_time IS NOT NULL OR entry_id < ?)))",
+                (row['id'], waypoints, waypoints, best['entry_id']),
+            ).fetchone()[0]
+        else:
+            ahead = conn.execute(
+                "SELECT COUNT(*) FROM leaderboard_entries WHERE quest_id = ? AND (waypoints_completed > ? OR "
+                "(waypoints_completed = ? AND (completion_time < ? OR (completion_time = ? AND entry_id < ?))))",
+                (row['id'], waypoints, waypoints, completion_time, completion_time, best['entry_id']),
+            ).fetchone()[0]
+        return ahead + 1, self._entry(best)
+
+    def add_rating(self, quest_id, rating):
+        """Record a 1-5 rating; returns the new {average, count, histogram} or None if the quest doesn't exist"""
+        if not rating_store.valid_rating(rating):
+            raise ValueError(f"Rating must be one of {rating_store.RATING_VALUES}")
+        conn = self._connect()
+        with conn:
+            row = self._find_row(conn, quest_id, json_only=True, columns='id, is_json')
+            if row is None:
+                return None
+            if rating_store.KEEP_RATING_LOG:
+                conn.execute("INSERT INTO ratings (quest_id, rating, timestamp) VALUES (?, ?, ?)",
+                             (row['id'], rating, datetime.now().isoformat()))
+            # Increment first so the transaction holds the write lock before reading the totals;
+            # the rating value (checked above) picks a fixed histogram column
+            conn.execute(
+                f"UPDATE quests SET rating_count = rating_count + 1, rating_sum = rating_sum + ?, "
+                f"rating_{rating} = rating_{rating} + 1 WHERE id = ?",
+                (rating, row['id']),
+            )
+            updated = conn.execute(
+                "SELECT rating_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5 FROM quests WHERE id = ?",
+                (row['id'],),
+            ).fetchone()
+            stats = {
+                'count': updated['rating_count'],
+                'sum': updated['rating_sum'],
+                'histogram': {str(value): updated[f'rating_{value}'] for value in rating_store.RATING_VALUES},
+            }
+            conn.execute("UPDATE quests SET rating = ? WHERE id = ?", (rating_store.average_rating(stats), row['id']))
+        return rating_store.public_rating_stats(stats)
+
+
+def migrate_folders_to_sqlite(quests_dir, db_path):
+    """Copy every quest, leaderboard entry and rating from the quest folders into a SQLite database.
+
+    Existing rows for the same quest ids are replaced, so it is safe to re-run.
+    Returns (quests, entries, ratings) counts.
+    """
+    registry = QuestRegistry(quests_dir)
+    sqlite_storage = SQLiteStorage(db_path)
+    sqlite_storage.prepare()
+    conn = sqlite_storage._connect()
+
+    counts = [0, 0, 0]
+    with conn:
+        for record in registry.records():
+            if record.summary is None or record.quest_id is None:
+                print(f"⚠️ Skipping {record.folder}/{record.filename}: no quest id or name")
+                continue
+
+            entries, votes, rating_stats = [], [], None
+            if record.is_json:
+                with open(record.path, 'r', encoding='utf-8') as f:
+                    quest_data = json.load(f)
+                # Raw votes from the cold log, or from the quest JSON if it was never rated since
+                store = rating_store.get_rating_store(record.path)
+                votes = ([vote for vote in store.votes() if rating_store.valid_vote(vote)]
+                         or rating_store.legacy_votes(quest_data)[0])
+                public = store.stats()
+                rating_stats = {
+                    'count': public['count'],
+                    'sum': sum(int(value) * count for value, count in public['histogram'].items()),
+                    'histogram': public['histogram'],
+                }
+                entries, _ = leaderboard_store.read_leaderboard(record.path)
+                quest_data.pop('leaderboard', None)
+                content = json.dumps(quest_data, ensure_ascii=False)
+            else:
+                # Stored in the JSON quest shape, like FileStorage serves it
+                content = json.dumps(load_legacy_quest(record.path), ensure_ascii=False)
+
+            quest_id = record.quest_id
+            conn.execute("DELETE FROM leaderboard_entries WHERE quest_id = ?", (quest_id,))
+            conn.execute("DELETE FROM leaderboard_stats WHERE quest_id = ?", (quest_id,))
+            conn.execute("DELETE FROM ratings WHERE quest_id = ?", (quest_id,))
+            sqlite_storage.insert_quest(conn, quest_id, record.folder, record.filename, record.is_json,
+                                        record.summary, content, rating_stats)
+            sqlite_storage.insert_entries(conn, quest_id, entries)
+            conn.executemany("INSERT INTO ratings (quest_id, rating, timestamp) VALUES (?, ?, ?)",
+                             [(quest_id, vote['rating'], vote.get('timestamp')) for vote in votes])
+
+            counts[0] += 1
+            counts[1] += len(entries)
+            counts[2] += rating_stats['count'] if rating_stats else 0
+
+    sqlite_storage.close()
+    return tuple(counts)
+
+
+def create_storage(kind, quests_dir, db_path=None):
+    """Create the storage backend selected by name (see BACKENDS)"""
+    if kind == 'file':
+        return FileStorage(quests_dir)
+    if kind == 'sqlite':
+        return SQLiteStorage(db_path or 'cityquest.db')
+    raise ValueError(f"Unknown storage backend '{kind}', expected one of {', '.join(BACKENDS)}")
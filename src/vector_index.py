@@ -0,0 +1,309 @@
+"""
+In-memory nearest-neighbour index over normalized embeddings.
+
+Every vector lives in one contiguous float32 matrix (rows [0, len)) that
+grows by doubling like a list, so an exact top-k search is a single
+matrix-vector product and an argpartition. Keys map to rows; removing a
+key moves the last row into its place, so the live rows stay contiguous
+and adding or removing a vector is O(1).
+
+Large catalogs can also use an inverted-file (IVF) index. Spherical
+k-means splits the vectors into about sqrt(n) lists, and a query only
+scans the nprobe lists whose centroids are closest to it. Vectors added
+after training go to their nearest list. The lists are retrained once the
+index has doubled since the last training. IVF is approximate: a match in
+a list that wasn't probed is missed. It is therefore only used once the
+index holds ivf_min_vectors vectors (0 turns it off), and a query can
+bypass it with exact=True.
+
+CatalogVectorIndex keeps such an index in step with the quest catalog. It
+works like GeoIndex, but only the keys that were added or removed since
+the last catalog version are embedded or dropped.
+"""
+
+import itertools
+import math
+import threading
+
+import numpy as np
+
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLES_PER_LIST = 32
+ASSIGN_CHUNK_ROWS = 16384
+
+
+def normalize_rows(vectors):
+    """Return vectors as a 2-D float32 array of unit rows"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores, highest first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    candidates = np.argpartition(scores, -k)[-k:] if k < len(scores) else np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def nearest_lists(vectors, centroids):
+    """The index of the closest centroid for each row, computed in chunks"""
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+        chunk = vectors[start:start + ASSIGN_CHUNK_ROWS]
+        lists[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return lists
+
+
+def spherical_kmeans(vectors, clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """Unit-length centroids of `clusters` groups of unit vectors (cosine k-means)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        lists = nearest_lists(vectors, centroids)
+        order = np.argsort(lists, kind='stable')
+        counts = np.bincount(lists, minlength=clusters)
+        occupied = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[occupied]
+        centroids[occupied] = normalize_rows(np.add.reduceat(vectors[order], starts))
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            # Reseed empty lists with random vectors
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+class VectorIndex:
+    """Keyed, normalized vectors in one contiguous matrix with exact or IVF top-k search"""
+
+    def __init__(self, dim=None, ivf_min_vectors=0, nprobe=16):
+        self.dim = dim
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nprobe = nprobe
+        self._matrix = np.zeros((0, dim or 0), dtype=np.float32)
+        self._keys = []      # row -> key
+        self._payloads = []  # row -> payload
+        self._rows = {}      # key -> row
+        self._centroids = None
+        self._row_lists = np.zeros(0, dtype=np.int32)  # row -> IVF list, sized like the matrix
+        self._lists = []     # IVF list -> set of rows
+        self._trained_size = 0
+        self._lock = threading.RLock()
+        self.searches = 0
+        self.ivf_searches = 0
+        self.trainings = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def keys(self):
+        with self._lock:
+            return list(self._keys)
+
+    def payload(self, key):
+        with self._lock:
+            return self._payloads[self._rows[key]]
+
+    def set_payload(self, key, payload):
+        with self._lock:
+            self._payloads[self._rows[key]] = payload
+
+    def reserve(self, capacity):
+        """Make room for capacity vectors up front (dim must be known)"""
+        with self._lock:
+            if capacity > len(self._matrix):
+                grown = np.empty((capacity, self.dim), dtype=np.float32)
+                grown[:len(self._matrix)] = self._matrix
+                self._matrix = grown
+                row_lists = np.zeros(capacity, dtype=np.int32)
+                row_lists[:len(self._row_lists)] = self._row_lists
+                self._row_lists = row_lists
+
+    def add(self, keys, vectors, payloads=None):
+        """Insert or replace vectors (one row per key); rows are normalized on the way in"""
+        vectors = normalize_rows(vectors)
+        keys = list(keys)
+        payloads = list(payloads) if payloads is not None else [None] * len(keys)
+        if len(keys) != len(vectors) or len(keys) != len(payloads):
+            raise ValueError("keys, vectors and payloads must have the same length")
+        if not keys:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            rows = np.empty(len(keys), dtype=np.int64)
+            next_row = len(self)
+            for i, key in enumerate(keys):
+                row = self._rows.get(key)
+                if row is None:
+                    row = self._rows[key] = next_row
+                    next_row += 1
+                    self._keys.append(key)
+                    self._payloads.append(payloads[i])
+                else:
+                    self._payloads[row] = payloads[i]
+                    if self._centroids is not None and row < len(self._row_lists):
+                        self._lists[self._row_lists[row]].discard(row)
+                rows[i] = row
+
+            if next_row > len(self._matrix):
+                self.reserve(max(next_row, 2 * len(self._matrix), 16))
+            self._matrix[rows] = vectors
+
+            if self._centroids is not None:
+                lists = nearest_lists(vectors, self._centroids)
+                self._row_lists[rows] = lists
+                for row, list_id in zip(rows.tolist(), lists.tolist()):
+                    self._lists[list_id].add(row)
+
+    def remove(self, keys):
+        """Drop the vectors of the given keys; unknown keys are ignored"""
+        with self._lock:
+            for key in keys:
+                row = self._rows.pop(key, None)
+                if row is None:
+                    continue
+                last = len(self._keys) - 1
+                if self._centroids is not None:
+                    self._lists[self._row_lists[row]].discard(row)
+                if row != last:
+                    # Keep the rows contiguous: the last row takes the hole
+                    self._matrix[row] = self._matrix[last]
+                    moved = self._keys[row] = self._keys[last]
+                    self._payloads[row] = self._payloads[last]
+                    self._rows[moved] = row
+                    if self._centroids is not None:
+                        list_id = self._row_lists[row] = self._row_lists[last]
+                        self._lists[list_id].discard(last)
+                        self._lists[list_id].add(row)
+                self._keys.pop()
+                self._payloads.pop()
+
+    @property
+    def ivf_active(self):
+        """Whether non-exact searches currently go through the IVF lists"""
+        return bool(self.ivf_min_vectors) and len(self) >= self.ivf_min_vectors
+
+    def train(self):
+        """(Re)build the IVF lists from the current vectors"""
+        with self._lock:
+            n = len(self)
+            if n == 0:
+                return
+            list_count = max(1, int(math.sqrt(n)))
+            rng = np.random.default_rng(n)
+            sample_rows = np.sort(rng.choice(n, min(n, list_count * KMEANS_SAMPLES_PER_LIST), replace=False))
+            centroids = spherical_kmeans(self._matrix[sample_rows], list_count)
+            lists = nearest_lists(self._matrix[:n], centroids)
+            order = np.argsort(lists, kind='stable')
+            bounds = np.cumsum(np.bincount(lists, minlength=list_count))[:-1]
+            self._lists = [set(rows.tolist()) for rows in np.split(order, bounds)]
+            self._row_lists[:n] = lists
+            self._centroids = centroids
+            self._trained_size = n
+            self.trainings += 1
+
+    def search(self, query, k=10, exact=False):
+        """The k vectors most similar to query as (cosine, key, payload), best first"""
+        query = normalize_rows(query)[0]
+        with self._lock:
+            n = len(self)
+            if n == 0 or k <= 0:
+                return []
+            if query.shape[0] != self.dim:
+                raise ValueError(f"Expected a {self.dim}-dimensional query, got {query.shape[0]}")
+            self.searches += 1
+
+            if not exact and self.ivf_active:
+                if self._centroids is None or n >= 2 * self._trained_size:
+                    self.train()
+                self.ivf_searches += 1
+                # Probe the closest lists, and more if they hold fewer than k vectors
+                probed, rows = [], 0
+                for list_id in np.argsort(-(self._centroids @ query)).tolist():
+                    if len(probed) >= self.nprobe and rows >= k:
+                        break
+                    probed.append(self._lists[list_id])
+                    rows += len(self._lists[list_id])
+                candidates = np.fromiter(itertools.chain.from_iterable(probed), dtype=np.int64, count=rows)
+                scores = self._matrix[candidates] @ query
+                best = top_k(scores, k)
+                rows, scores = candidates[best], scores[best]
+            else:
+                scores = self._matrix[:n] @ query
+                rows = top_k(scores, k)
+                scores = scores[rows]
+
+            return [(float(score), self._keys[row], self._payloads[row])
+                    for score, row in zip(scores.tolist(), rows.tolist())]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'vectors': len(self),
+                'dim': self.dim,
+                'capacity': len(self._matrix),
+                'ivf_active': self.ivf_active,
+                'ivf_lists': len(self._lists) if self._centroids is not None else 0,
+                'nprobe': self.nprobe,
+                'searches': self.searches,
+                'ivf_searches': self.ivf_searches,
+                'trainings': self.trainings,
+            }
+
+
+class CatalogVectorIndex:
+    """A VectorIndex kept in sync with load_fn() whenever version_fn() changes"""
+
+    def __init__(self, version_fn, load_fn, embed_fn, index):
+        self.version_fn = version_fn  # () -> hashable token
+        self.load_fn = load_fn        # () -> {key: payload}
+        self.embed_fn = embed_fn      # keys -> (embedded keys, matrix)
+        self.index = index
+        self._version = None
+        self._lock = threading.Lock()
+        self.syncs = 0
+
+    @property
+    def synced(self):
+        """Whether the index has been loaded at least once"""
+        return self._version is not None
+
+    def sync(self):
+        """Bring the index up to date with the catalog; only changed keys are embedded"""
+        version = self.version_fn()
+        with self._lock:
+            if self._version is not None and self._version == version:
+                return
+            wanted = self.load_fn()
+            current = set(self.index.keys())
+            self.index.remove(current - wanted.keys())
+            for key in current & wanted.keys():
+                self.index.set_payload(key, wanted[key])
+            new_keys = [key for key in wanted if key not in current]
+            if new_keys:
+                embedded, matrix = self.embed_fn(new_keys)
+                self.index.add(embedded, matrix, [wanted[key] for key in embedded])
+                print(f"✅ Vector index: {len(embedded)} added, {len(current - wanted.keys())} removed, "
+                      f"{len(self.index)} total")
+            self._version = version
+            self.syncs += 1
+
+    def search(self, query, k=10, exact=False):
+        self.sync()
+        return self.index.search(query, k, exact)
+
+    def stats(self):
+        return {**self.index.stats(), 'syncs': self.syncs}
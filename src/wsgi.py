@@ -0,0 +1,19 @@
+"""
+WSGI entry point for running the server under an external WSGI server, e.g.
+
+    gunicorn --preload --workers 4 --threads 8 --pythonpath src wsgi:app
+
+Importing this module loads the model. With --preload that happens once in
+the master and the workers share the weights copy-on-write, as with
+WORKERS=n python src/clip_server.py. Set INFERENCE_THREADS to the cores
+divided by the workers so they don't oversubscribe the CPU.
+
+With INFERENCE_PROCESSES set, the inference processes are forked here too,
+but only `WORKERS=n python src/clip_server.py` restarts them if they die.
+"""
+
+import clip_server
+
+clip_server.prepare_server()
+clip_server.initialize_model(threads=clip_server.INFERENCE_THREADS or None)
+app = clip_server.app
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for the cached /api/quests catalog
+
+Checks that CatalogCache only rebuilds when its version moves, and that
+/api/quests answers a matching If-None-Match with an empty 304 until a
+quest is added or rated.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from catalog_cache import CatalogCache  # noqa: E402
+
+
+def test_rebuilds_only_when_version_moves():
+    """Same version: cached body and ETag; new version: rebuilt, new ETag only if the body changed"""
+    version = [1]
+    bodies = [b'["a"]']
+    cache = CatalogCache(lambda: version[0], lambda: bodies[-1])
+
+    body, etag = cache.get()
+    assert body == b'["a"]' and cache.get() == (body, etag)
+    assert cache.stats() == {'hits': 1, 'rebuilds': 1}
+
+    bodies.append(b'["a", "b"]')
+    assert cache.get() == (body, etag), "The body changed but the version didn't"
+    version[0] = 2
+    new_body, new_etag = cache.get()
+    assert new_body == b'["a", "b"]' and new_etag != etag
+
+    version[0] = 3  # e.g. a rating that left the body unchanged
+    assert cache.get()[1] == new_etag
+    cache.invalidate()
+    assert cache.get()[1] == new_etag
+    assert cache.stats()['rebuilds'] == 4
+
+
+def test_quests_endpoint_answers_304():
+    """A matching If-None-Match gets an empty 304; adding or rating a quest changes the ETag"""
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        # QUESTS_DIR is relative to the working directory
+        os.chdir(workdir)
+        os.makedirs(os.path.join('quests', 'Park_Walk'))
+        with open(os.path.join('quests', 'Park_Walk', 'Park_Walk.json'), 'w', encoding='utf-8') as f:
+            json.dump({'id': 7, 'name': 'Park Walk', 'checkpoints': [], 'rating': 0}, f)
+        import clip_server
+        client = clip_server.app.test_client()
+
+        response = client.get('/api/quests')
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert [quest['name'] for quest in response.get_json()] == ['Park Walk']
+
+        cached = client.get('/api/quests', headers={'If-None-Match': etag})
+        assert cached.status_code == 304 and cached.get_data() == b''
+        assert cached.headers['ETag'] == etag
+
+        assert client.post('/quest/7/rate', json={'rating': 5}).status_code == 200
+        rated = client.get('/api/quests', headers={'If-None-Match': etag})
+        assert rated.status_code == 200 and rated.headers['ETag'] != etag
+        assert rated.get_json()[0]['rating'] == 5
+
+        os.makedirs(os.path.join('quests', 'Hill_Climb'))
+        with open(os.path.join('quests', 'Hill_Climb', 'Hill_Climb.json'), 'w', encoding='utf-8') as f:
+            json.dump({'id': 8, 'name': 'Hill Climb', 'checkpoints': []}, f)
+        added = client.get('/api/quests', headers={'If-None-Match': rated.headers['ETag']})
+        assert added.status_code == 200
+        assert sorted(quest['name'] for quest in added.get_json()) == ['Hill Climb', 'Park Walk']
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    try:
+        test_rebuilds_only_when_version_moves()
+        print("✅ The catalog is rebuilt only when its version moves")
+        test_quests_endpoint_answers_304()
+        print("✅ /api/quests answers If-None-Match with 304")
+        print("\n🎉 Catalog cache tests completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Catalog cache test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests for /compare/batch
+
+Runs the endpoint with a tiny stand-in model that embeds a photo as its
+mean color, and checks that each item is scored against its own answer
+images, that the player photos that miss the cache share one forward pass,
+that a broken item only fails itself, and that repeated items are answered
+from the compare cache (JSON and multipart alike).
+"""
+
+import base64
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+COLORS = {'red': (220, 20, 20), 'green': (20, 200, 20), 'blue': (20, 20, 220)}
+
+
+class MeanColorBackend:
+    """Embeds an image as its normalized mean color and records the size of every forward pass"""
+
+    name = 'mean-color'
+
+    def __init__(self):
+        self.batches = []
+
+    def preprocess(self, image):
+        return np.asarray(image.convert('RGB').resize((8, 8)), dtype=np.float32).transpose(2, 0, 1)[None] / 255
+
+    def embed_batch(self, pixel_values):
+        self.batches.append(len(pixel_values))
+        features = pixel_values.mean(axis=(2, 3))
+        return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+
+def jpeg(color, size=64):
+    buffer = io.BytesIO()
+    Image.new('RGB', (size, size), COLORS[color]).save(buffer, 'JPEG', quality=95)
+    return buffer.getvalue()
+
+
+def multipart(boundary, items):
+    """A /compare/batch multipart body: playerImage.<n> file parts with their answerImage.<n> fields"""
+    parts = []
+    for n, (color, answers) in enumerate(items):
+        parts.append((f'--{boundary}\r\nContent-Disposition: form-data; name="playerImage.{n}"; '
+                      f'filename="{color}.jpg"\r\nContent-Type: image/jpeg\r\n\r\n').encode() + jpeg(color) + b'\r\n')
+        for answer in answers:
+            parts.append((f'--{boundary}\r\nContent-Disposition: form-data; name="answerImage.{n}"\r\n\r\n'
+                          f'{answer}\r\n').encode())
+    return b''.join(parts) + f'--{boundary}--\r\n'.encode()
+
+
+def test_batch_compare():
+    """Items are scored against their own answers in one forward pass; failures stay per item"""
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    import clip_server
+    try:
+        os.chdir(workdir)
+        folder = os.path.join(workdir, 'quests', 'Colors')
+        os.makedirs(folder)
+        for color in COLORS:
+            path = os.path.join(folder, f'{color}_answer.jpg')
+            with open(path, 'wb') as f:
+                f.write(jpeg(color))
+            # As ingestion does for new answer photos
+            clip_server.answer_index.add(path)
+        clip_server.compare_cache.clear()
+        clip_server.backend = model = MeanColorBackend()
+        client = clip_server.app.test_client()
+
+        items = [
+            {'playerImage': base64.b64encode(jpeg('red')).decode(), 'answerImage': ['blue_answer.jpg', 'red_answer.jpg']},
+            {'playerImage': base64.b64encode(jpeg('green')).decode(), 'answerImage': 'green_answer.jpg'},
+            {'playerImage': 'not base64 at all', 'answerImage': 'red_answer.jpg'},
+            {'playerImage': base64.b64encode(jpeg('blue')).decode(), 'answerImage': ['missing.jpg']},
+            {'playerImage': base64.b64encode(jpeg('blue')).decode(), 'answerImage': []},
+        ]
+        response = client.post('/compare/batch', json={'items': items})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        body = response.get_json()
+        results = body['results']
+        assert [result['index'] for result in results] == [0, 1, 2, 3, 4]
+        assert results[0]['best_match'] == 'red_answer.jpg' and results[0]['similarity'] > 0.99
+        assert results[1]['best_match'] == 'green_answer.jpg' and not results[1]['cached']
+        assert 'error' in results[2] and 'error' in results[3] and 'error' in results[4]
+        assert (body['succeeded'], body['failed']) == (2, 3)
+        # The three decodable player photos went through the model together, before any answer photo
+        assert model.batches[0] == 3, model.batches
+
+        # The same photos again: answered from the cache without running the model
+        forward_passes = len(model.batches)
+        boundary = 'cityquest-batch-boundary'
+        payload = multipart(boundary, [('red', ['blue_answer.jpg', 'red_answer.jpg']), ('green', ['green_answer.jpg'])])
+        response = client.post('/compare/batch', data=payload,
+                               content_type=f'multipart/form-data; boundary={boundary}')
+        results = response.get_json()['results']
+        assert [(r['best_match'], r['cached']) for r in results] == [('red_answer.jpg', True), ('green_answer.jpg', True)]
+        assert len(model.batches) == forward_passes
+
+        assert client.post('/compare/batch', json={'items': []}).status_code == 400
+        assert client.post('/compare/batch', json={'nothing': True}).status_code == 400
+    finally:
+        clip_server.backend = None
+        clip_server.compare_cache.clear()
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    try:
+        test_batch_compare()
+        print("✅ Batch compare scores each item and keeps failures per item")
+        print("\n🎉 Batch compare tests completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Batch compare test failed: {e}")
+        sys.exit(1)
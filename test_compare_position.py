@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for /compare with the player's position
+
+Checks that a player far from every checkpoint of a located quest is
+rejected without running the model, while quests the geo index can't
+place (no checkpoint coordinates, or a legacy .js quest without an id)
+are still scored against the answer images the client sent.
+"""
+
+import base64
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from geo_index import GeoIndex  # noqa: E402
+from test_compare_batch import MeanColorBackend, jpeg  # noqa: E402
+
+LEGACY_QUEST = """export const legacyQuest = {
+    name: 'Legacy Walk',
+    checkpoints: [
+      { id: 1, name: 'Blue door', clue: 'Knock twice', answerImage: 'door_blue.jpg' }
+    ]
+};
+"""
+
+
+def write_quest(folder, quest_data):
+    os.makedirs(os.path.join('quests', folder))
+    with open(os.path.join('quests', folder, f'{folder}.json'), 'w', encoding='utf-8') as f:
+        json.dump(quest_data, f)
+
+
+def test_position_gates_only_located_quests():
+    """Far from a located quest: rejected; quests without coordinates: scored as sent"""
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    import clip_server
+    saved_geo_index = clip_server.geo_index
+    try:
+        # QUESTS_DIR is relative to the working directory
+        os.chdir(workdir)
+        write_quest('Park', {'id': 21, 'name': 'Park', 'checkpoints': [
+            {'id': 1, 'name': 'Red gate', 'lat': 45.5, 'lng': -122.8, 'answerImage': ['gate_red.jpg']}]})
+        write_quest('Plain', {'id': 22, 'name': 'Plain', 'checkpoints': [
+            {'id': 1, 'name': 'Green bench', 'answerImage': ['bench_green.jpg']}]})
+        os.makedirs(os.path.join('quests', 'Legacy'))
+        with open(os.path.join('quests', 'Legacy', 'legacy.js'), 'w', encoding='utf-8') as f:
+            f.write(LEGACY_QUEST)
+        for folder, color, filename in (('Park', 'red', 'gate_red.jpg'), ('Plain', 'green', 'bench_green.jpg'),
+                                        ('Legacy', 'blue', 'door_blue.jpg')):
+            path = os.path.join(workdir, 'quests', folder, filename)
+            with open(path, 'wb') as f:
+                f.write(jpeg(color))
+            clip_server.answer_index.add(path)
+        clip_server.compare_cache.clear()
+        # A fresh index: the module's one may hold another test's checkpoints under the same version
+        clip_server.geo_index = GeoIndex(clip_server.storage.checkpoints_version, clip_server.storage.list_checkpoints)
+        clip_server.backend = model = MeanColorBackend()
+        client = clip_server.app.test_client()
+        legacy_id = next(q['id_string'] for q in client.get('/api/quests').get_json() if q['name'] == 'Legacy Walk')
+        assert legacy_id.startswith('quest_')
+
+        def compare(color, quest_id, answer, lat=45.5, lng=-122.8):
+            response = client.post('/compare', json={
+                'playerImage': base64.b64encode(jpeg(color)).decode(),
+                'answerImage': answer, 'questId': quest_id, 'lat': lat, 'lng': lng, 'accuracy': 20})
+            assert response.status_code == 200, response.get_data(as_text=True)
+            return response.get_json()
+
+        far = compare('red', '21', 'gate_red.jpg', lat=46.5)
+        assert far['similarity'] == 0.0 and 'rejected' in far
+        assert model.batches == [], "A rejected photo shouldn't reach the model"
+        near = compare('red', '21', 'gate_red.jpg')
+        assert near['best_match'] == 'gate_red.jpg' and near['checkpoint']['name'] == 'Red gate'
+
+        # Wherever the player is, these are scored against what the client sent
+        plain = compare('green', '22', 'bench_green.jpg', lat=-30.0)
+        assert 'rejected' not in plain and plain['similarity'] > 0.99, plain
+        legacy = compare('blue', legacy_id, ['door_blue.jpg'], lat=10.0, lng=10.0)
+        assert 'rejected' not in legacy and legacy['best_match'] == 'door_blue.jpg', legacy
+    finally:
+        clip_server.geo_index = saved_geo_index
+        clip_server.backend = None
+        clip_server.compare_cache.clear()
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    try:
+        test_position_gates_only_located_quests()
+        print("✅ Only quests with located checkpoints are gated on position")
+        print("\n🎉 Compare position tests completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Compare position test failed: {e}")
+        sys.exit(1)
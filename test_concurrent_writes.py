@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Stress test for concurrent quest file writes
+
+Fires hundreds of leaderboard adds and ratings at the same quest from many
+threads in several processes at once, then checks that no update was lost
+and that the quest file is still valid JSON.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import leaderboard_store
+import quest_storage
+import rating_store
+
+PROCESSES = 4
+THREADS_PER_PROCESS = 25
+ADDS_PER_THREAD = 4
+
+
+def make_quest(folder):
+    """Create a minimal quest folder with a legacy leaderboard entry and vote"""
+    os.makedirs(folder, exist_ok=True)
+    quest_file = os.path.join(folder, 'stress.json')
+    quest_storage.atomic_write_json(quest_file, {
+        'id': 42,
+        'name': 'Stress Quest',
+        'checkpoints': [],
+        'rating': 0,
+        'leaderboard': {
+            'entries': [{'team_name': 'Legacy Team', 'waypoints_completed': 1, 'completion_time': 5000}],
+            'stats': {},
+            'ratings': [{'rating': 3, 'timestamp': '2025-01-01T00:00:00'}]
+        }
+    })
+    return quest_file
+
+
+def hammer(quest_file, worker_id):
+    """Run one process worth of concurrent adds and ratings"""
+    errors = []
+
+    def worker(thread_id):
+        for i in range(ADDS_PER_THREAD):
+            try:
+                leaderboard_store.add_entry(quest_file, {
+                    'team_name': f'team-{worker_id}-{thread_id}-{i}',
+                    'waypoints_completed': 3,
+                    'completion_time': 1000 + i
+                })
+                rating_store.get_rating_store(quest_file).add(5)
+            except Exception as e:
+                errors.append(repr(e))
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(THREADS_PER_PROCESS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_concurrent_writes():
+    """Concurrent adds from threads and processes must all be persisted"""
+    workdir = tempfile.mkdtemp()
+    try:
+        quest_file = make_quest(os.path.join(workdir, 'quests', 'Stress'))
+        expected = PROCESSES * THREADS_PER_PROCESS * ADDS_PER_THREAD
+
+        with ProcessPoolExecutor(max_workers=PROCESSES) as pool:
+            results = list(pool.map(hammer, [quest_file] * PROCESSES, range(PROCESSES)))
+        errors = [e for result in results for e in result]
+        assert not errors, f"Writers raised errors: {errors[:5]}"
+
+        # A fresh store so nothing is served from this process's cache
+        store = leaderboard_store.LeaderboardStore(os.path.dirname(quest_file))
+        entries = store.entries()
+        team_names = {entry['team_name'] for entry in entries}
+        assert len(entries) == expected + 1, f"Expected {expected + 1} leaderboard entries, found {len(entries)}"
+        assert len(team_names) == expected + 1, "Duplicate leaderboard entries were written"
+        assert store.stats()['total_completions'] == expected + 1
+
+        with open(quest_file, 'r', encoding='utf-8') as f:
+            quest_data = json.load(f)
+        assert 'ratings' not in quest_data['leaderboard'], "Legacy votes were left in the quest file"
+
+        rating_stats = rating_store.RatingStore(quest_file).stats()
+        assert rating_stats['count'] == expected + 1, f"Expected {expected + 1} ratings, found {rating_stats['count']}"
+        assert rating_stats['histogram'] == {'1': 0, '2': 0, '3': 1, '4': 0, '5': expected}
+        votes = rating_store.RatingStore(quest_file).votes()
+        assert len(votes) == expected + 1, f"Expected {expected + 1} votes in the cold log, found {len(votes)}"
+
+        leftovers = [f for f in os.listdir(os.path.dirname(quest_file)) if f.endswith('.tmp')]
+        assert not leftovers, f"Temp files left behind: {leftovers}"
+
+        print(f"✅ {expected} concurrent leaderboard adds and {expected} ratings persisted, none lost")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    try:
+        test_concurrent_writes()
+        print("\n🎉 Concurrent write test completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Concurrent write test failed: {e}")
+        sys.exit(1)
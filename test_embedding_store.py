@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for the answer embedding store
+
+Checks that stored rows are reused by a fresh store (as after a restart)
+and recomputed when the photo changes, and that stores with their own
+in-memory copies of a folder (like pre-forked workers) merge their rows
+into the file instead of overwriting each other's.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from embedding_store import EmbeddingStore  # noqa: E402
+
+
+class CountingEmbedder:
+    """Embeds the bytes of a file as their normalized byte histogram and counts the calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, data):
+        self.calls += 1
+        vector = np.bincount(np.frombuffer(data, np.uint8), minlength=256).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+
+def write_photo(folder, filename, content):
+    path = os.path.join(folder, filename)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_rows_are_reused_and_refreshed():
+    """A fresh store reads the rows from disk; an edited photo is embedded again"""
+    folder = tempfile.mkdtemp()
+    try:
+        path = write_photo(folder, 'a.jpg', b'first photo')
+        embedder = CountingEmbedder()
+        vector = EmbeddingStore('model-x', embedder).get(path)
+        assert embedder.calls == 1
+
+        restarted = EmbeddingStore('model-x', embedder)
+        assert np.allclose(restarted.get(path), vector) and embedder.calls == 1
+        write_photo(folder, 'a.jpg', b'a replaced, longer photo')
+        assert not np.allclose(restarted.get(path), vector) and embedder.calls == 2
+        # Another model keeps its own file
+        EmbeddingStore('model-y', embedder).get(path)
+        assert embedder.calls == 3
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_stores_merge_their_rows():
+    """Two stores with stale copies of a folder both keep their rows in the file"""
+    folder = tempfile.mkdtemp()
+    try:
+        a, b, c = (write_photo(folder, f'{name}.jpg', name.encode() * 10) for name in 'abc')
+        embedder = CountingEmbedder()
+        first, second = EmbeddingStore('model-x', embedder), EmbeddingStore('model-x', embedder)
+        second.get(c)  # second now holds the folder in memory with only c
+        first.get(a)
+        second.get(b)  # must not drop first's row for a
+        assert embedder.calls == 3
+
+        fresh = EmbeddingStore('model-x', embedder)
+        fresh.get_many([a, b, c])
+        assert embedder.calls == 3, "Every row should have been on disk"
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    try:
+        test_rows_are_reused_and_refreshed()
+        print("✅ Stored rows are reused and refreshed")
+        test_stores_merge_their_rows()
+        print("✅ Stores merge their rows into the file")
+        print("\n🎉 Embedding store tests completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Embedding store test failed: {e}")
+        sys.exit(1)
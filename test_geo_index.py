@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests for the checkpoint geo index
+
+Checks that radius queries over the grid return exactly what a haversine
+scan of every checkpoint returns, including near the poles and across the
+antimeridian, and that the grid is only rebuilt when its version moves.
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from geo_index import GeoIndex, haversine_meters  # noqa: E402
+
+
+def checkpoints_around(rng, centers, per_center=200, spread=0.02):
+    """Checkpoints scattered around each (lat, lng) center"""
+    checkpoints = []
+    for lat, lng in centers:
+        for _ in range(per_center):
+            point_lng = lng + rng.uniform(-spread, spread) * 20
+            checkpoints.append({
+                'quest_id': str(len(checkpoints) % 7),
+                'lat': max(-90.0, min(90.0, lat + rng.uniform(-spread, spread))),
+                'lng': (point_lng + 180) % 360 - 180,
+            })
+    return checkpoints
+
+
+def brute_force(checkpoints, lat, lng, radius, quest_ids=None):
+    found = []
+    for checkpoint in checkpoints:
+        if quest_ids is not None and checkpoint['quest_id'] not in quest_ids:
+            continue
+        distance = haversine_meters(lat, lng, checkpoint['lat'], checkpoint['lng'])
+        if distance <= radius:
+            found.append((distance, checkpoint))
+    found.sort(key=lambda pair: pair[0])
+    return found
+
+
+def test_grid_matches_haversine_scan():
+    """Grid queries find the same checkpoints as a full scan, poles and antimeridian included"""
+    rng = random.Random(0)
+    centers = [(45.52, -122.68), (89.99, 10.0), (-89.995, -170.0), (0.0, 179.999), (64.0, -180.0)]
+    checkpoints = checkpoints_around(rng, centers)
+    checkpoints.append({'quest_id': '1', 'lat': 0.0, 'lng': 179.9995})  # 111 m from the query below
+    index = GeoIndex(lambda: 1, lambda: checkpoints)
+
+    queries = [(45.52, -122.68, 150, None), (45.53, -122.67, 2000, {'1', '2'}), (89.999, -100.0, 3000, None),
+               (90.0, 0.0, 3000, None), (-89.999, 45.0, 1500, None), (0.0, -179.9995, 200, None),
+               (64.0, 179.99, 1000, None), (10.0, 10.0, 150, None)]
+    for lat, lng, radius, quest_ids in queries:
+        expected = brute_force(checkpoints, lat, lng, radius, quest_ids)
+        found = index.nearby(lat, lng, radius, quest_ids)
+        # Ties at equal distances may come back in either order
+        assert sorted(id(c) for _, c in found) == sorted(id(c) for _, c in expected), (lat, lng, radius)
+        assert [d for d, _ in found] == [d for d, _ in expected], (lat, lng, radius)
+    assert index.nearby(90.0, 0.0, 3000)  # points near the pole are found from any longitude
+    assert index.nearby(0.0, -179.9995, 200)  # and across the antimeridian
+    assert index.stats()['rebuilds'] == 1
+
+
+def test_rebuilds_only_when_version_moves():
+    """The grid is reused until version_fn() changes"""
+    version = [1]
+    checkpoints = [{'quest_id': '1', 'lat': 45.5, 'lng': -122.8}]
+    index = GeoIndex(lambda: version[0], lambda: list(checkpoints))
+    assert len(index.nearby(45.5, -122.8, 10)) == 1
+    checkpoints.append({'quest_id': '2', 'lat': 45.5, 'lng': -122.8})
+    assert len(index.nearby(45.5, -122.8, 10)) == 1
+    version[0] = 2
+    assert len(index.nearby(45.5, -122.8, 10)) == 2
+    assert index.stats()['rebuilds'] == 2 and index.stats()['queries'] == 3
+
+
+if __name__ == "__main__":
+    try:
+        test_grid_matches_haversine_scan()
+        print("✅ Grid queries match a haversine scan")
+        test_rebuilds_only_when_version_moves()
+        print("✅ The grid is rebuilt only when its version moves")
+        print("\n🎉 Geo index tests completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Geo index test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Tests for the inference process service
+
+Runs a small numpy stand-in for the model in replica processes and checks
+that concurrent requests from several threads get their own embeddings
+back through shared memory, that errors raised in a replica reach the
+caller, and that a replica which dies is restarted without leaving its
+requests hanging, also by the monitor thread of a single-process server.
+Replicas load and warm up in the background and report their progress;
+one that cannot load the model is not restarted. A request that times out
+gives its slot back without its late answer reaching the slot's next
+user, and so do the slots of a worker killed in the middle of a request.
+"""
+
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from inference_service import HOLDER, READY, WARMING_UP, InferenceBusy, InferenceService  # noqa: E402
+
+INPUT_SHAPE = (3, 8, 8)
+
+
+class ChannelMeanBackend:
+    """Embeds pixel values as their normalized per-channel means"""
+
+    name = 'channel-mean'
+
+    def __init__(self, threads=None, delay=0.0):
+        self.delay = delay
+
+    def embed_batch(self, pixel_values):
+        if np.isnan(pixel_values).any():
+            raise ValueError("NaN pixel values")
+        time.sleep(self.delay)
+        features = pixel_values.mean(axis=(2, 3))
+        return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+
+class SlowOnBrightBackend(ChannelMeanBackend):
+    """Takes 3 seconds for batches with pixel values above 1"""
+
+    def embed_batch(self, pixel_values):
+        if pixel_values.max() > 1:
+            time.sleep(3)
+        return super().embed_batch(pixel_values)
+
+
+def expected(pixel_values):
+    features = pixel_values.mean(axis=(2, 3))
+    return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+
+def test_concurrent_requests_and_errors():
+    """Each caller gets its own rows back; a failing batch fails only its callers"""
+    service = InferenceService(ChannelMeanBackend, INPUT_SHAPE, processes=2, slots=4, max_items=4, timeout=10)
+    try:
+        service.start()
+        service.wait(timeout=10)
+        assert service.backend_name == 'channel-mean'
+        rng = np.random.default_rng(0)
+        batches = [rng.random((n, *INPUT_SHAPE), dtype=np.float32) for n in (1, 3, 4, 9, 2) * 8]
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(service.embed, batches))
+        for batch, result in zip(batches, results):
+            assert result.shape == (len(batch), 3)
+            assert np.allclose(result, expected(batch), atol=1e-6)
+
+        broken = np.full((2, *INPUT_SHAPE), np.nan, dtype=np.float32)
+        try:
+            service.embed(broken)
+            assert False, "A failing batch should raise"
+        except RuntimeError as e:
+            assert 'NaN' in str(e)
+        # The slots are all back in circulation
+        assert np.allclose(service.embed(batches[0]), expected(batches[0]), atol=1e-6)
+        assert service.stats()['failures'] == 1
+    finally:
+        service.close()
+
+
+def test_dead_replica_is_restarted():
+    """Requests held by a replica that dies fail; the replica comes back"""
+    service = InferenceService(lambda threads: ChannelMeanBackend(delay=2.0), INPUT_SHAPE,
+                               processes=1, slots=2, max_items=2, timeout=10)
+    try:
+        service.start()
+        service.wait(timeout=10)
+        pixel_values = np.ones((1, *INPUT_SHAPE), dtype=np.float32)
+        errors = []
+        caller = threading.Thread(target=lambda: errors.append(_error_of(service.embed, pixel_values)))
+        caller.start()
+        time.sleep(0.5)  # the replica is now busy with the request
+
+        (pid,) = list(service._pids)
+        os.kill(pid, signal.SIGKILL)
+        _, status = os.waitpid(pid, 0)
+        assert service.reap(pid, status)
+        caller.join(timeout=10)
+        assert errors and 'died' in errors[0]
+
+        assert np.allclose(service.embed(pixel_values), expected(pixel_values), atol=1e-6)
+        assert service.stats()['restarts'] == 1
+        assert not service.reap(os.getpid(), 0)
+    finally:
+        service.close()
+
+
+def test_background_startup_and_load_failure():
+    """start() returns at once; wait() follows loading and warm-up, and reports load errors"""
+    def slow_backend(threads):
+        time.sleep(0.5)
+        return ChannelMeanBackend()
+
+    service = InferenceService(slow_backend, INPUT_SHAPE, processes=2, slots=2, timeout=10,
+                               warmup=lambda backend: time.sleep(0.3))
+    try:
+        started = time.perf_counter()
+        service.start()
+        assert time.perf_counter() - started < 0.5
+        assert service.backend_name is None
+        assert [replica['state'] for replica in service.replicas()] == ['loading', 'loading']
+        service.wait(WARMING_UP, timeout=10)
+        assert service.backend_name == 'channel-mean'
+        service.wait(READY, timeout=10)
+        for replica in service.replicas():
+            assert replica['state'] == 'ready'
+            assert replica['load_seconds'] >= 0.5 and replica['warmup_seconds'] >= 0.3
+    finally:
+        service.close()
+
+    def broken_backend(threads):
+        raise OSError("model weights not found")
+
+    service = InferenceService(broken_backend, INPUT_SHAPE, processes=1, slots=2)
+    try:
+        service.start()
+        assert 'not found' in _error_of(service.wait, READY, 10)
+        (pid,) = list(service._pids)
+        _, status = os.waitpid(pid, 0)
+        assert service.reap(pid, status)
+        assert not service._pids and service.stats()['restarts'] == 0
+        assert service.replicas()[0]['state'] == 'failed'
+    finally:
+        service.close()
+
+
+def test_timed_out_slot_is_reused():
+    """A timed-out request frees its slot, and its late answer is dropped"""
+    service = InferenceService(SlowOnBrightBackend, INPUT_SHAPE, processes=1, slots=1, max_items=1, timeout=2)
+    try:
+        service.start()
+        service.wait(timeout=10)
+        bright = np.full((1, *INPUT_SHAPE), 2.0, dtype=np.float32)
+        assert 'No answer' in _error_of(service.embed, bright)
+
+        # Same (only) slot; the slow answer for the bright request arrives while this one waits
+        dark = np.random.default_rng(0).random((1, *INPUT_SHAPE), dtype=np.float32)
+        assert np.allclose(service.embed(dark), expected(dark), atol=1e-6)
+        time.sleep(1.5)  # long after the late answer would have landed
+        other = np.random.default_rng(1).random((1, *INPUT_SHAPE), dtype=np.float32)
+        assert np.allclose(service.embed(other), expected(other), atol=1e-6)
+        assert service.stats()['timeouts'] == 1
+
+        # With every slot taken, callers get InferenceBusy instead of waiting forever
+        service._free.get()
+        service.timeout = 0.2
+        try:
+            service.embed(dark)
+            assert False, "Embedding without a free slot should raise"
+        except InferenceBusy:
+            pass
+        assert service.stats()['busy'] == 1
+    finally:
+        service.close()
+
+
+def test_monitor_restarts_replicas():
+    """Without a pre-fork master, monitor() restarts a replica that dies"""
+    service = InferenceService(ChannelMeanBackend, INPUT_SHAPE, processes=1, slots=2, timeout=10)
+    try:
+        service.start()
+        service.wait(timeout=10)
+        service.monitor()
+        (pid,) = list(service._pids)
+        os.kill(pid, signal.SIGKILL)
+        deadline = time.monotonic() + 10
+        while service.stats()['restarts'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert service.stats()['restarts'] == 1 and pid not in service._pids
+        service.wait(timeout=10)
+        pixel_values = np.ones((1, *INPUT_SHAPE), dtype=np.float32)
+        assert np.allclose(service.embed(pixel_values), expected(pixel_values), atol=1e-6)
+    finally:
+        service.close()
+
+
+def test_dead_worker_slot_is_reclaimed():
+    """A worker killed while holding a slot gets it reaped; its late answer is dropped"""
+    service = InferenceService(SlowOnBrightBackend, INPUT_SHAPE, processes=1, slots=1, max_items=1, timeout=10)
+    try:
+        service.start()
+        service.wait(timeout=10)
+        worker = os.fork()
+        if worker == 0:
+            try:
+                service.embed(np.full((1, *INPUT_SHAPE), 2.0, dtype=np.float32))
+            finally:
+                os._exit(0)
+        deadline = time.monotonic() + 10
+        while service._headers[0][HOLDER] != worker and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert service._headers[0][HOLDER] == worker
+        os.kill(worker, signal.SIGKILL)
+        _, status = os.waitpid(worker, 0)
+        assert not service.reap(worker, status)  # not a replica, but its slot is back
+        assert service._headers[0][HOLDER] == 0
+
+        # The only slot: without the reclaim this would raise InferenceBusy
+        dark = np.random.default_rng(0).random((1, *INPUT_SHAPE), dtype=np.float32)
+        assert np.allclose(service.embed(dark), expected(dark), atol=1e-6)
+        assert service.stats()['busy'] == 0
+    finally:
+        service.close()
+
+
+def _error_of(fn, *args):
+    try:
+        fn(*args)
+    except Exception as e:
+        return str(e)
+    return None
+
+
+if __name__ == "__main__":
+    try:
+        test_concurrent_requests_and_errors()
+        print("✅ Concurrent requests and errors")
+        test_dead_replica_is_restarted()
+        print("✅ Dead replica is restarted")
+        test_background_startup_and_load_failure()
+        print("✅ Background startup and load failure")
+        test_timed_out_slot_is_reused()
+        print("✅ Timed-out slot is reused")
+        test_monitor_restarts_replicas()
+        print("✅ The monitor restarts dead replicas")
+        test_dead_worker_slot_is_reclaimed()
+        print("✅ A dead worker's slot is reclaimed")
+        print("\n🎉 Inference service tests completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Inference service test failed: {e}")
+        sys.exit(1)
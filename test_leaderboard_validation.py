@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for leaderboard request validation
+
+Checks that /leaderboard/<id>/add answers 400 for entries that could not
+be ranked (non-numeric waypoints or times, bools, NaN, a non-string team
+name) without storing them, and that /leaderboard/<id> answers 400 for a
+cursor or team that isn't a string, while valid entries keep ranking.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+
+def entry(**fields):
+    return {'team_name': 'Owls', 'waypoints_completed': 3, 'completion_time': 90000,
+            'quest_date': '2026-10-17', **fields}
+
+
+def test_bad_entries_and_parameters_are_rejected():
+    """Bad entries get 400 and aren't stored; bad cursor or team types get 400 instead of 500"""
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        # QUESTS_DIR is relative to the working directory
+        os.chdir(workdir)
+        os.makedirs(os.path.join('quests', 'River_Run'))
+        with open(os.path.join('quests', 'River_Run', 'River_Run.json'), 'w', encoding='utf-8') as f:
+            json.dump({'id': 41, 'name': 'River Run', 'checkpoints': []}, f)
+        import clip_server
+        client = clip_server.app.test_client()
+
+        for bad in (entry(waypoints_completed='3'), entry(waypoints_completed=True), entry(waypoints_completed=-1),
+                    entry(waypoints_completed=2.5), entry(completion_time='1:30'), entry(completion_time={}),
+                    entry(completion_time=False), entry(completion_time=float('nan')), entry(team_name=['Owls'])):
+            response = client.post('/leaderboard/41/add', data=json.dumps(bad), content_type='application/json')
+            assert response.status_code == 400, bad
+        assert client.get('/leaderboard/41/get').get_json()['total'] == 0
+
+        assert client.post('/leaderboard/41/add', json=entry()).status_code == 200
+        assert client.post('/leaderboard/41/add', json=entry(team_name='Larks', completion_time=None)).status_code == 200
+        assert client.post('/leaderboard/41/add', json=entry(team_name='Bats', completion_time=60000.5)).status_code == 200
+        page = client.get('/leaderboard/41/get?limit=2').get_json()
+        assert [e['team_name'] for e in page['leaderboard']] == ['Bats', 'Owls'] and page['next_cursor']
+
+        for params in ({'cursor': 12}, {'cursor': {'a': 1}}, {'team': ['Owls']}, {'team': {'name': 'Owls'}}):
+            response = client.post('/leaderboard/41/get', json={'limit': 2, **params})
+            assert response.status_code == 400, params
+        response = client.post('/leaderboard/41/get', json={'limit': 2, 'cursor': page['next_cursor'], 'team': 'Larks'})
+        body = response.get_json()
+        assert [e['team_name'] for e in body['leaderboard']] == ['Larks'] and body['team_rank']['rank'] == 3
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    try:
+        test_bad_entries_and_parameters_are_rejected()
+        print("✅ Unrankable entries and mistyped parameters are rejected")
+        print("\n🎉 Leaderboard validation tests completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Leaderboard validation test failed: {e}")
+        sys.exit(1)
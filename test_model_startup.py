@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Tests for background model startup
+
+Checks that startup phases run in order in the background while their
+progress is reported, that the server only becomes ready after the last
+phase, that a failing phase stops startup with its error on record, and
+that phases already run in the foreground (as in a pre-fork master) are
+skipped by start(), so forked workers only warm up.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from model_startup import ModelStartup  # noqa: E402
+
+
+def test_phases_run_in_background():
+    """Each phase is reported while it runs; ready only after the last one"""
+    release = {name: threading.Event() for name in ('load', 'warmup')}
+    started = {name: threading.Event() for name in ('load', 'warmup')}
+
+    def phase(name, details):
+        def run():
+            started[name].set()
+            release[name].wait(5)
+            return details
+        return run
+
+    startup = ModelStartup(('load', 'warmup'))
+    assert startup.status()['state'] == 'starting' and not startup.ready
+    startup.start({'load': phase('load', {'backend': 'fake'}), 'warmup': phase('warmup', None)})
+
+    assert started['load'].wait(5)
+    status = startup.status()
+    assert status['phase'] == 'load' and status['phases']['load']['state'] == 'running'
+    assert status['phases']['warmup']['state'] == 'pending'
+    release['load'].set()
+
+    assert started['warmup'].wait(5)
+    assert startup.status()['phases']['load']['backend'] == 'fake'
+    assert not startup.ready
+    release['warmup'].set()
+
+    assert startup.wait(5)
+    status = startup.status()
+    assert status['state'] == 'ready' and status['phase'] is None and status['error'] is None
+    assert all(record['state'] == 'done' and record['seconds'] >= 0 for record in status['phases'].values())
+
+
+def test_failed_phase_stops_startup():
+    """A failing phase is reported and the phases after it never run"""
+    ran = []
+
+    def broken():
+        raise OSError("model weights not found")
+
+    startup = ModelStartup(('load', 'warmup'))
+    startup.start({'load': broken, 'warmup': lambda: ran.append('warmup')})
+    assert not startup.wait(5)
+    status = startup.status()
+    assert status['state'] == 'failed' and 'weights not found' in status['error']
+    assert status['phases']['load']['state'] == 'failed'
+    assert status['phases']['warmup']['state'] == 'pending' and not ran
+
+
+def test_foreground_phases_are_skipped():
+    """Phases run with run() (e.g. in a pre-fork master) don't run again"""
+    ran = []
+    startup = ModelStartup(('load', 'warmup'))
+    startup.run('load', lambda: ran.append('load'))
+    startup.start({'warmup': lambda: ran.append('warmup')})
+    assert startup.wait(5)
+    assert ran == ['load', 'warmup']
+    try:
+        startup.run('load', lambda: None)
+        assert False, "A phase should only run once"
+    except RuntimeError:
+        pass
+
+
+def test_workers_only_warm_up():
+    """The pre-fork master loads the model and embeds the catalog once; a worker only warms up"""
+    from test_compare_batch import MeanColorBackend, jpeg
+    from vector_index import CatalogVectorIndex, VectorIndex
+
+    class ThreadedBackend(MeanColorBackend):
+        def set_threads(self, threads):
+            self.threads = threads
+
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    import clip_server
+    saved = (clip_server.model_startup, clip_server.create_backend, clip_server.backend, clip_server.WORKERS,
+             clip_server.identify_index)
+    try:
+        # QUESTS_DIR is relative to the working directory
+        os.chdir(workdir)
+        folder = os.path.join(workdir, 'quests', 'Park')
+        os.makedirs(folder)
+        with open(os.path.join(folder, 'Park.json'), 'w', encoding='utf-8') as f:
+            json.dump({'id': 31, 'name': 'Park', 'checkpoints': [
+                {'id': 1, 'name': 'Red gate', 'lat': 45.5, 'lng': -122.8, 'answerImage': ['park_gate.jpg']}]}, f)
+        with open(os.path.join(folder, 'park_gate.jpg'), 'wb') as f:
+            f.write(jpeg('red'))
+        clip_server.answer_index.add(os.path.join(folder, 'park_gate.jpg'))
+        model = ThreadedBackend()
+        clip_server.create_backend = lambda *args, **kwargs: model
+        clip_server.model_startup = ModelStartup(('load', 'warmup', 'index'))
+        clip_server.WORKERS = 2
+        # A fresh index: the module's one may hold another test's catalog under the same version
+        clip_server.identify_index = CatalogVectorIndex(clip_server.storage.checkpoints_version,
+                                                        clip_server.identify_entries,
+                                                        clip_server.embed_answer_paths, VectorIndex())
+
+        clip_server.prepare_workers()
+        assert clip_server.identify_index.synced and len(clip_server.identify_index.index) == 1
+        phases = clip_server.model_startup.status()['phases']
+        assert phases['index']['answer_photos'] == 1 and phases['warmup']['state'] == 'pending'
+        embedded = len(model.batches)
+        assert embedded == 1
+
+        clip_server.start_worker(1)
+        assert clip_server.model_startup.wait(5)
+        # Only the warm-up batches ran in the worker
+        assert model.batches[embedded:] == clip_server.WARMUP_BATCH_SIZES
+        assert model.threads == clip_server.prefork.default_threads(2)
+    finally:
+        (clip_server.model_startup, clip_server.create_backend, clip_server.backend, clip_server.WORKERS,
+         clip_server.identify_index) = saved
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    try:
+        test_phases_run_in_background()
+        print("✅ Phases run in the background")
+        test_failed_phase_stops_startup()
+        print("✅ A failed phase stops startup")
+        test_foreground_phases_are_skipped()
+        print("✅ Foreground phases are skipped")
+        test_workers_only_warm_up()
+        print("✅ Workers only warm up after the master built the identify index")
+        print("\n🎉 Model startup tests completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Model startup test failed: {e}")
+        sys.exit(1)
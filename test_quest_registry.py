@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the quest registry
+
+Checks that quest ids are found without rescanning, that files edited,
+added or removed behind the registry's back are picked up through their
+mtimes, and that generation only moves for real catalog changes (not for
+leaderboard writes), while checkpoint_generation ignores summary-only
+changes such as ratings.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from quest_registry import QuestRegistry  # noqa: E402
+
+
+def write_quest(quests_dir, folder, quest_data, mtime=None):
+    """Write folder/folder.json, optionally with an explicit mtime (seconds)"""
+    os.makedirs(os.path.join(quests_dir, folder), exist_ok=True)
+    path = os.path.join(quests_dir, folder, f'{folder}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(quest_data, f)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def quest(quest_id, name, lat=45.5, rating=0):
+    return {'id': quest_id, 'name': name, 'rating': rating,
+            'checkpoints': [{'id': 1, 'name': 'Start', 'lat': lat, 'lng': -122.8, 'answerImage': ['a.jpg']}]}
+
+
+def test_lookup_and_mtime_invalidation():
+    """Edits are noticed by mtime, added folders by the root's mtime, and ids follow their files"""
+    quests_dir = tempfile.mkdtemp()
+    try:
+        path = write_quest(quests_dir, 'Alpha', quest(1, 'Alpha'), mtime=1_000_000)
+        write_quest(quests_dir, 'Beta', quest('quest_2', 'Beta'))
+        registry = QuestRegistry(quests_dir)
+        registry.build()
+
+        assert registry.find('1').summary['name'] == 'Alpha'
+        assert registry.find('2').folder == 'Beta'  # numeric ids also match 'quest_<n>'
+        assert registry.find_path('1') == path
+        assert registry.find('missing') is None
+
+        # Edit a quest file by hand: the next lookup re-parses it
+        write_quest(quests_dir, 'Alpha', quest(11, 'Alpha renamed'), mtime=1_000_100)
+        assert registry.find('1') is None
+        assert registry.find('11').summary['name'] == 'Alpha renamed'
+
+        # A new folder is picked up without a rebuild
+        write_quest(quests_dir, 'Gamma', quest(3, 'Gamma'))
+        assert registry.find('3').summary['name'] == 'Gamma'
+        assert [r.folder for r in registry.records()] == ['Alpha', 'Beta', 'Gamma']
+
+        shutil.rmtree(os.path.join(quests_dir, 'Beta'))
+        assert registry.find('2') is None
+        assert [r.folder for r in registry.records()] == ['Alpha', 'Gamma']
+    finally:
+        shutil.rmtree(quests_dir)
+
+
+def test_generations():
+    """Leaderboard writes leave both generations alone; ratings only move generation"""
+    quests_dir = tempfile.mkdtemp()
+    try:
+        path = write_quest(quests_dir, 'Alpha', quest(1, 'Alpha'), mtime=1_000_000)
+        registry = QuestRegistry(quests_dir)
+        registry.build()
+        generation, checkpoint_generation = registry.generation, registry.checkpoint_generation
+
+        # Another file in the folder (like leaderboard.jsonl) changes the folder's mtime only
+        with open(os.path.join(quests_dir, 'Alpha', 'leaderboard.jsonl'), 'a', encoding='utf-8') as f:
+            f.write('{}\n')
+        registry.refresh(full=True)
+        assert (registry.generation, registry.checkpoint_generation) == (generation, checkpoint_generation)
+
+        # A summary change (e.g. a new average rating) moves only generation
+        write_quest(quests_dir, 'Alpha', quest(1, 'Alpha', rating=4), mtime=1_000_100)
+        registry.invalidate(path)
+        assert registry.generation > generation
+        assert registry.checkpoint_generation == checkpoint_generation
+        assert registry.find('1').summary['rating'] == 4
+
+        # Moving a checkpoint moves both
+        generation = registry.generation
+        write_quest(quests_dir, 'Alpha', quest(1, 'Alpha', lat=45.6, rating=4), mtime=1_000_200)
+        registry.refresh(full=True)
+        assert registry.generation > generation
+        assert registry.checkpoint_generation > checkpoint_generation
+    finally:
+        shutil.rmtree(quests_dir)
+
+
+if __name__ == "__main__":
+    try:
+        test_lookup_and_mtime_invalidation()
+        print("✅ Lookups follow edited, added and removed quest files")
+        test_generations()
+        print("✅ Generations only move for catalog and checkpoint changes")
+        print("\n🎉 Quest registry tests completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Quest registry test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tests for the /compare result cache
+
+Checks that the least recently used entry is evicted first, that entries
+expire after the TTL, that a zero size or TTL turns the cache off, and
+that the key ignores the order of the answer images but not the photo
+bytes or the model version. Uploads are hashed in chunks and rewound, and
+raw and multipart /compare bodies of the same photo share a cache entry.
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from result_cache import HASH_CHUNK_BYTES, ResultCache, compare_key  # noqa: E402
+
+
+def test_least_recently_used_is_evicted():
+    """A read refreshes an entry, so the entry read least recently goes first"""
+    cache = ResultCache(max_entries=2, ttl_seconds=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    cache.put('a', 10)  # replacing doesn't evict
+    assert cache.get('a') == 10 and cache.get('c') == 3
+    stats = cache.stats()
+    assert stats['size'] == 2 and stats['evictions'] == 1
+    assert stats['hits'] == 5 and stats['misses'] == 1
+
+
+def test_entries_expire():
+    """An entry past its TTL is a miss and is dropped"""
+    cache = ResultCache(max_entries=10, ttl_seconds=0.05)
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1 and cache.stats()['size'] == 0
+
+    for disabled in (ResultCache(max_entries=0), ResultCache(ttl_seconds=0)):
+        disabled.put('a', 1)
+        assert not disabled.enabled and disabled.get('a') is None
+        assert disabled.stats()['size'] == 0
+
+
+def test_compare_key():
+    """Same photo and answer set in any order share a key; other photos or models don't"""
+    photo = b'\xff\xd8 photo bytes'
+    key = compare_key(photo, ['b.jpg', 'a.jpg'], 'torch-v1')
+    assert key == compare_key(photo, ['a.jpg', 'b.jpg'], 'torch-v1')
+    assert key != compare_key(photo + b'\x00', ['a.jpg', 'b.jpg'], 'torch-v1')
+    assert key != compare_key(photo, ['a.jpg'], 'torch-v1')
+    assert key != compare_key(photo, ['a.jpg', 'b.jpg'], 'int8-v1')
+
+
+class RecordingStream(io.BytesIO):
+    """Remembers the size of every read"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+def test_streams_are_hashed_in_chunks():
+    """A file object gets the same key as its bytes, is read in chunks and is rewound"""
+    photo = os.urandom(3 * HASH_CHUNK_BYTES + 7)
+    stream = RecordingStream(b'header' + photo)
+    stream.seek(6)
+    assert compare_key(stream, ['a.jpg'], 'torch-v1') == compare_key(photo, ['a.jpg'], 'torch-v1')
+    assert stream.tell() == 6 and stream.read() == photo
+    assert all(0 < size <= HASH_CHUNK_BYTES for size in stream.reads[:-1])
+
+
+def test_uploads_share_cache_entries():
+    """Raw and multipart bodies of the same photo are hashed, decoded and then answered from the cache"""
+    from test_compare_batch import MeanColorBackend, jpeg
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    import clip_server
+    try:
+        os.chdir(workdir)
+        folder = os.path.join(workdir, 'quests', 'Upload')
+        os.makedirs(folder)
+        path = os.path.join(folder, 'upload_red.jpg')
+        with open(path, 'wb') as f:
+            f.write(jpeg('red'))
+        clip_server.answer_index.add(path)
+        clip_server.compare_cache.clear()
+        clip_server.backend = model = MeanColorBackend()
+        client = clip_server.app.test_client()
+        photo = jpeg('red', size=512)
+
+        raw = client.post('/compare?answerImage=upload_red.jpg', data=photo, content_type='image/jpeg')
+        assert raw.status_code == 200, raw.get_data(as_text=True)
+        assert raw.get_json()['similarity'] > 0.99 and not raw.get_json()['cached']
+        forward_passes = len(model.batches)
+        multipart = client.post('/compare', data={'playerImage': (io.BytesIO(photo), 'red.jpg'),
+                                                  'answerImage': 'upload_red.jpg'},
+                                content_type='multipart/form-data')
+        assert multipart.get_json()['cached'] and len(model.batches) == forward_passes
+
+        clip_server.compare_cache.clear()
+        multipart = client.post('/compare', data={'playerImage': (io.BytesIO(photo), 'red.jpg'),
+                                                  'answerImage': 'upload_red.jpg'},
+                                content_type='multipart/form-data')
+        assert multipart.get_json()['similarity'] > 0.99 and not multipart.get_json()['cached']
+    finally:
+        clip_server.backend = None
+        clip_server.compare_cache.clear()
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    try:
+        test_least_recently_used_is_evicted()
+        print("✅ The least recently used entry is evicted")
+        test_entries_expire()
+        print("✅ Entries expire after the TTL")
+        test_compare_key()
+        print("✅ Cache keys follow the photo, answer set and model")
+        test_streams_are_hashed_in_chunks()
+        print("✅ Streams are hashed in chunks and rewound")
+        test_uploads_share_cache_entries()
+        print("✅ Raw and multipart uploads share cache entries")
+        print("\n🎉 Result cache tests completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Result cache test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Tests for the storage backends
+
+Runs FileStorage and SQLiteStorage (migrated from the same quest folders)
+side by side on the same data and checks that they give the same answers.
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import quest_storage  # noqa: E402
+from storage import FileStorage, SQLiteStorage, migrate_folders_to_sqlite  # noqa: E402
+
+
+def make_quests(root, legacy_entries=()):
+    """One JSON quest folder with a legacy vote (and optionally legacy leaderboard entries), under root/quests"""
+    quests_dir = os.path.join(root, 'quests')
+    folder = os.path.join(quests_dir, 'Park_Walk')
+    os.makedirs(folder)
+    quest_storage.atomic_write_json(os.path.join(folder, 'Park_Walk.json'), {
+        'id': 7,
+        'name': 'Park Walk',
+        'checkpoints': [{'id': 1, 'name': 'Fountain', 'lat': 45.5, 'lng': -122.8, 'answerImage': ['fountain.jpg']}],
+        'rating': 3,
+        'leaderboard': {'entries': list(legacy_entries), 'stats': {},
+                        'ratings': [{'rating': 3, 'timestamp': '2025-01-01T00:00:00'}]},
+    })
+    return quests_dir
+
+
+def make_backends(root, legacy_entries=()):
+    """(FileStorage, SQLiteStorage) holding the same quests"""
+    quests_dir = make_quests(root, legacy_entries)
+    db_path = os.path.join(root, 'cityquest.db')
+    migrate_folders_to_sqlite(quests_dir, db_path)
+    file_storage = FileStorage(quests_dir)
+    file_storage.prepare()
+    sqlite_storage = SQLiteStorage(db_path)
+    sqlite_storage.prepare()
+    return file_storage, sqlite_storage
+
+
+def test_ratings_match_and_reject_non_votes():
+    """Both backends count votes alike and refuse bools, strings and out-of-range values"""
+    root = tempfile.mkdtemp()
+    try:
+        backends = make_backends(root)
+        for storage in backends:
+            for rating in (True, False, '5', 0, 6, 4.0):
+                try:
+                    storage.add_rating('7', rating)
+                    assert False, f"{storage.name} accepted rating {rating!r}"
+                except ValueError:
+                    pass
+        results = [storage.add_rating('7', 5) for storage in backends]
+        assert results[0] == results[1], results
+        assert results[0]['count'] == 2 and results[0]['average'] == 4.0
+        assert set(results[0]['histogram']) == {'1', '2', '3', '4', '5'}
+        assert backends[0].add_rating('missing', 5) is None and backends[1].add_rating('missing', 5) is None
+        backends[1].close()
+    finally:
+        shutil.rmtree(root)
+
+
+def test_malformed_legacy_votes_are_skipped():
+    """Non-object or out-of-range legacy votes and a null leaderboard are skipped, not copied or fatal"""
+    root = tempfile.mkdtemp()
+    try:
+        quests_dir = os.path.join(root, 'quests')
+        votes = [{'rating': 4, 'timestamp': '2025-01-01T00:00:00'}, 'five', None, [3], {'rating': True},
+                 {'rating': 9}, {'stars': 5}, {'rating': 2, 'timestamp': '2025-01-02T00:00:00'}]
+        for quest_id, folder, leaderboard in ((1, 'Mixed', {'entries': [], 'ratings': votes}), (2, 'Null', None)):
+            os.makedirs(os.path.join(quests_dir, folder))
+            quest_storage.atomic_write_json(os.path.join(quests_dir, folder, f'{folder}.json'), {
+                'id': quest_id, 'name': folder, 'checkpoints': [], 'rating': 0, 'leaderboard': leaderboard})
+        db_path = os.path.join(root, 'cityquest.db')
+        migrate_folders_to_sqlite(quests_dir, db_path)
+        backends = FileStorage(quests_dir), SQLiteStorage(db_path)
+        for storage in backends:
+            storage.prepare()
+
+        results = [storage.add_rating('1', 5) for storage in backends]
+        assert results[0] == results[1], results
+        assert results[0]['count'] == 3 and results[0]['histogram'] == {'1': 0, '2': 1, '3': 0, '4': 1, '5': 1}
+        with open(os.path.join(quests_dir, 'Mixed', 'ratings.jsonl'), encoding='utf-8') as f:
+            assert [json.loads(line)['rating'] for line in f] == [4, 2, 5]
+        with open(os.path.join(quests_dir, 'Mixed', 'Mixed.json'), encoding='utf-8') as f:
+            assert 'ratings' not in json.load(f)['leaderboard']
+
+        results = [storage.add_rating('2', 4) for storage in backends]
+        assert results[0] == results[1] and results[0]['count'] == 1, results
+        backends[1].close()
+    finally:
+        shutil.rmtree(root)
+
+
+LEADERBOARD = [
+    # (team, waypoints, time); teams without a time finished but never stopped the clock
+    ('Owls', 3, 300), ('Foxes', 3, None), ('Bears', 3, 200), ('Hares', 2, 100),
+    ('Crows', 3, 300), ('Moles', 3, None), ('Bears', 3, 250), ('Newts', 1, None),
+]
+
+
+def test_leaderboards_match_with_untimed_entries():
+    """Same order, ranks and cursor pages on both backends; entries without a time rank last"""
+    root = tempfile.mkdtemp()
+    try:
+        backends = make_backends(root)
+        for storage in backends:
+            for team, waypoints, completion_time in LEADERBOARD:
+                entry = {'team_name': team, 'waypoints_completed': waypoints, 'completion_time': completion_time,
+                         'timestamp': '2025-01-01T00:00:00'}
+                assert storage.add_leaderboard_entry('7', entry)
+
+        expected = ['Bears', 'Bears', 'Owls', 'Crows', 'Foxes', 'Moles', 'Hares', 'Newts']
+        for storage in backends:
+            page = storage.get_leaderboard('7')
+            assert [e['team_name'] for e in page['entries']] == expected, (storage.name, page['entries'])
+            assert page['total'] == len(LEADERBOARD) and page['next_cursor'] is None
+
+            # Page through in twos; the last cursor is on an untimed entry
+            teams, cursor, cursors = [], None, []
+            while True:
+                page = storage.get_leaderboard('7', limit=2, cursor=cursor)
+                teams += [e['team_name'] for e in page['entries']]
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+                cursors.append(cursor)
+            assert teams == expected, (storage.name, teams)
+            assert len(cursors) == 3 and cursors[2].startswith('3::'), cursors
+
+            assert storage.get_leaderboard_rank('7', 'Bears')[0] == 1
+            assert storage.get_leaderboard_rank('7', 'Crows')[0] == 4
+            assert storage.get_leaderboard_rank('7', 'Moles')[0] == 6
+            assert storage.get_leaderboard_rank('7', 'Newts')[0] == 8
+            assert storage.get_leaderboard_rank('7', 'Nobody') == (None, None)
+
+        stats = [storage.get_leaderboard('7')['stats'] for storage in backends]
+        assert stats[0] == stats[1], stats
+        assert stats[0]['best_time'] == 100 and stats[0]['total_completions'] == len(LEADERBOARD)
+        backends[1].close()
+    finally:
+        shutil.rmtree(root)
+
+
+def test_large_leaderboard_pages_and_ranks():
+    """A seeded leaderboard of 150 entries pages by cursor and ranks every team alike on both backends"""
+    root = tempfile.mkdtemp()
+    try:
+        rng = random.Random(1)
+        legacy = [{'team_name': f'Team {n}', 'waypoints_completed': rng.randint(0, 4),
+                   'completion_time': rng.choice([None, rng.randint(60, 90)])} for n in range(150)]
+        backends = make_backends(root, legacy)
+        backends[0].add_leaderboard_entry('7', {'team_name': 'Team 0', 'waypoints_completed': 5, 'completion_time': 1})
+        backends[1].add_leaderboard_entry('7', {'team_name': 'Team 0', 'waypoints_completed': 5, 'completion_time': 1})
+
+        pages = []
+        for storage in backends:
+            teams, cursor = [], None
+            while True:
+                page = storage.get_leaderboard('7', limit=7, cursor=cursor)
+                teams += [(e['team_name'], e['waypoints_completed'], e.get('completion_time')) for e in page['entries']]
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+            pages.append(teams)
+            assert storage.get_leaderboard('7', limit=7, offset=14)['entries'] == \
+                storage.get_leaderboard('7', limit=7, cursor=storage.get_leaderboard('7', limit=14)['next_cursor'])['entries']
+        assert pages[0] == pages[1]
+        assert len(pages[0]) == 151 and pages[0][0] == ('Team 0', 5, 1)
+        # Most waypoints first, then fastest, with missing times after every timed entry
+        keys = [(-waypoints, float('inf') if time is None else time) for _, waypoints, time in pages[0]]
+        assert keys == sorted(keys)
+
+        for position, (team, _, _) in enumerate(pages[0]):
+            if team == 'Team 0':
+                continue  # its best entry is first; the legacy one ranks lower
+            ranks = [storage.get_leaderboard_rank('7', team)[0] for storage in backends]
+            assert ranks == [position + 1] * 2, (team, ranks, position + 1)
+        assert [storage.get_leaderboard_rank('7', 'Team 0')[0] for storage in backends] == [1, 1]
+        backends[1].close()
+    finally:
+        shutil.rmtree(root)
+
+
+def test_checkpoints_version_ignores_ratings():
+    """Ratings move the catalog version but not the checkpoints version; a new quest moves both"""
+    root = tempfile.mkdtemp()
+    try:
+        backends = make_backends(root)
+        for storage in backends:
+            catalog, checkpoints = storage.catalog_version(), storage.checkpoints_version()
+            assert storage.add_rating('7', 5)
+            assert storage.catalog_version() != catalog
+            assert storage.checkpoints_version() == checkpoints, storage.name
+
+            folder = os.path.join(root, 'quests', f'Hill_Climb_{storage.name}')
+            os.makedirs(folder, exist_ok=True)
+            storage.save_quest({'id': 8, 'name': 'Hill Climb',
+                                'checkpoints': [{'id': 1, 'lat': 45.6, 'lng': -122.7, 'answerImage': ['top.jpg']}]},
+                               folder, f'Hill_Climb_{storage.name}.json')
+            assert storage.checkpoints_version() != checkpoints, storage.name
+            assert [c['quest_id'] for c in storage.list_checkpoints()] == ['8', '7'], storage.name
+        backends[1].close()
+    finally:
+        shutil.rmtree(root)
+
+
+def test_legacy_entries_leave_the_quest_file():
+    """Legacy leaderboard entries are ranked with new ones and no longer served as quest content"""
+    root = tempfile.mkdtemp()
+    try:
+        legacy = [{'team_name': 'Elders', 'waypoints_completed': 1, 'completion_time': 500}]
+        backends = make_backends(root, legacy)
+        quest_path = os.path.join(root, 'quests', 'Park_Walk', 'Park_Walk.json')
+        for storage in backends:
+            assert 'leaderboard' not in json.loads(storage.get_quest('7')['content']), storage.name
+            assert storage.add_leaderboard_entry('7', {'team_name': 'Newcomers', 'waypoints_completed': 1,
+                                                       'completion_time': 400})
+            page = storage.get_leaderboard('7')
+            assert [e['team_name'] for e in page['entries']] == ['Newcomers', 'Elders'], storage.name
+            assert 'leaderboard' not in storage.load_quest('7')
+
+        with open(quest_path, 'r', encoding='utf-8') as f:
+            leaderboard = json.load(f)['leaderboard']
+        assert 'entries' not in leaderboard and 'stats' not in leaderboard, leaderboard
+        # The file backend now only reads the log, which still holds the seeded entries
+        assert backends[0].get_leaderboard('7')['total'] == 2
+        backends[1].close()
+    finally:
+        shutil.rmtree(root)
+
+
+def test_migration_is_repeatable_and_uses_wal():
+    """Migrating twice doesn't duplicate rows, both backends list the same quests, and readers don't wait on writers"""
+    root = tempfile.mkdtemp()
+    try:
+        legacy = [{'team_name': 'Elders', 'waypoints_completed': 1, 'completion_time': 500}]
+        file_storage, sqlite_storage = make_backends(root, legacy)
+        db_path = sqlite_storage.db_path
+        assert migrate_folders_to_sqlite(os.path.join(root, 'quests'), db_path) == (1, 1, 1)
+        assert sqlite_storage.get_leaderboard('7')['total'] == 1
+        assert sqlite_storage.add_rating('7', 5) == file_storage.add_rating('7', 5)
+
+        assert file_storage.list_quests() == sqlite_storage.list_quests()
+        assert file_storage.list_checkpoints() == sqlite_storage.list_checkpoints()
+        file_quest, sqlite_quest = file_storage.get_quest('7'), sqlite_storage.get_quest('7')
+        assert json.loads(file_quest['content']) == json.loads(sqlite_quest['content'])
+
+        conn = sqlite_storage._connect()
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        # Hold a write transaction open; another thread still reads the last committed state
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute("UPDATE quests SET name = 'Renamed' WHERE id = '7'")
+        names = []
+        reader = threading.Thread(target=lambda: names.append(sqlite_storage.list_quests()[0]['name']))
+        reader.start()
+        reader.join(5)
+        conn.rollback()
+        assert names == ['Park Walk'], names
+        sqlite_storage.close()
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    try:
+        test_ratings_match_and_reject_non_votes()
+        print("✅ Ratings match across backends and non-votes are rejected")
+        test_malformed_legacy_votes_are_skipped()
+        print("✅ Malformed legacy votes are skipped")
+        test_leaderboards_match_with_untimed_entries()
+        print("✅ Leaderboards match across backends with untimed entries last")
+        test_large_leaderboard_pages_and_ranks()
+        print("✅ Large leaderboards page and rank alike on both backends")
+        test_checkpoints_version_ignores_ratings()
+        print("✅ Ratings leave the checkpoints version alone")
+        test_legacy_entries_leave_the_quest_file()
+        print("✅ Legacy leaderboard entries leave the quest file")
+        test_migration_is_repeatable_and_uses_wal()
+        print("✅ Migration is repeatable and SQLite readers don't wait on writers")
+        print("\n🎉 Storage backend tests completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Storage backend test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Memory test for streaming multipart quest submissions
+
+Posts a quest with 20 multi-megabyte photos as multipart/form-data (the
+request body is read from a file, like a real upload socket) and checks
+with tracemalloc that the server's peak memory while parsing, verifying and
+publishing the quest stays far below the size of the payload. Also checks
+that two submissions with the same name in the same second get their own
+folders, so a failing one can't delete the other's photos.
+"""
+
+import base64
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+PHOTOS = 20
+PEAK_LIMIT = 8 * 1024 * 1024
+
+
+def noisy_jpeg(size=1400, seed=0):
+    """A JPEG of random noise, which barely compresses (about 2-3 MB)"""
+    rng = random.Random(seed)
+    image = Image.frombytes('RGB', (size, size), rng.randbytes(size * size * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=95)
+    return buffer.getvalue()
+
+
+def write_multipart(path, boundary, quest_data, photo):
+    """Write a multipart submission body to path; every photo part reuses the same bytes"""
+    with open(path, 'wb') as f:
+        f.write(f'--{boundary}\r\nContent-Disposition: form-data; name="questData"\r\n\r\n'.encode())
+        f.write(json.dumps(quest_data).encode())
+        f.write(b'\r\n')
+        for n in range(PHOTOS):
+            waypoint, index = divmod(n, 4)
+            f.write((f'--{boundary}\r\nContent-Disposition: form-data; name="photos.{waypoint}.{index}"; '
+                     f'filename="photo{n}.jpg"\r\nContent-Type: image/jpeg\r\n\r\n').encode())
+            f.write(photo)
+            f.write(b'\r\n')
+        f.write(f'--{boundary}--\r\n'.encode())
+
+
+def test_streaming_upload_memory():
+    """A multipart quest upload must not hold its photos in memory"""
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        # QUESTS_DIR and UPLOAD_DIR are relative to the working directory
+        os.chdir(workdir)
+        os.makedirs('quests')
+        import clip_server
+        client = clip_server.app.test_client()
+
+        quest_data = {
+            'name': 'Streaming Quest',
+            'checkpoints': [{'name': f'Stop {i + 1}', 'lat': 45.5 + i / 100, 'lng': -122.8} for i in range(PHOTOS // 4)],
+        }
+        boundary = 'cityquest-test-boundary'
+        body_path = os.path.join(workdir, 'upload.body')
+        write_multipart(body_path, boundary, quest_data, noisy_jpeg())
+        payload_size = os.path.getsize(body_path)
+
+        tracemalloc.start()
+        with open(body_path, 'rb') as body:
+            response = client.post('/api/submit-quest', input_stream=body, content_length=payload_size,
+                                   content_type=f'multipart/form-data; boundary={boundary}')
+        assert response.status_code == 202, f"Submission failed: {response.status_code} {response.get_data(as_text=True)}"
+
+        status_url = response.get_json()['statusUrl']
+        deadline = time.time() + 60
+        while True:
+            status = client.get(status_url).get_json()
+            if status['status'] in ('ready', 'failed') or time.time() > deadline:
+                break
+            time.sleep(0.05)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert status['status'] == 'ready', f"Ingestion did not finish: {status}"
+        assert len(status['result']['savedImages']) == PHOTOS
+        assert peak < PEAK_LIMIT, (f"Peak memory {peak / 1e6:.1f} MB for a {payload_size / 1e6:.1f} MB upload "
+                                   f"(limit {PEAK_LIMIT / 1e6:.1f} MB)")
+
+        quests = client.get('/api/quests').get_json()
+        assert [q['name'] for q in quests] == ['Streaming Quest']
+        folder = os.path.join('quests', quests[0]['folder'])
+        saved = sorted(f for f in os.listdir(folder) if f.endswith('.jpg'))
+        assert len(saved) == PHOTOS
+        assert os.listdir(clip_server.UPLOAD_DIR) == [], "Staged upload files were left behind"
+
+        print(f"✅ {payload_size / 1e6:.1f} MB multipart upload ingested with a {peak / 1e6:.2f} MB memory peak")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+def test_same_name_submissions_get_own_folders():
+    """A failed job removes its own folder and leaves a same-named quest alone"""
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        import clip_server
+        from ingestion import IngestionJob
+
+        first = clip_server.claim_quest_folder('Same_Name', '2025-01-01_12-00-00')
+        second = clip_server.claim_quest_folder('Same_Name', '2025-01-01_12-00-00')
+        assert first != second
+        with open(os.path.join('quests', first, 'photo.jpg'), 'wb') as f:
+            f.write(noisy_jpeg(size=64))
+
+        # Every photo of the second submission is unreadable, so its job fails
+        job = IngestionJob(clip_server.INGEST_STAGES)
+        broken = {'photos': {'0': {'0': {'data': base64.b64encode(b'not a jpeg').decode()}}}}
+        try:
+            clip_server.ingest_quest(job, {'name': 'Same Name', 'checkpoints': [{'lat': 45.5, 'lng': -122.8}]},
+                                     broken, second)
+            assert False, "A submission without readable photos should fail"
+        except ValueError:
+            pass
+        assert not os.path.exists(os.path.join('quests', second))
+        assert os.listdir(os.path.join('quests', first)) == ['photo.jpg']
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    try:
+        test_streaming_upload_memory()
+        test_same_name_submissions_get_own_folders()
+        print("✅ Same-name submissions get their own folders")
+        print("\n🎉 Streaming upload test completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Streaming upload test failed: {e}")
+        sys.exit(1)
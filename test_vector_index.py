@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for the /identify vector index
+
+Checks that exact top-k search matches a brute-force ranking after
+incremental adds, replacements and removals, and that the IVF lists keep
+track of every row and find the same best matches on clustered data, and
+that the catalog index only embeds the keys that changed, and only when
+its version moves.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from vector_index import CatalogVectorIndex, VectorIndex, normalize_rows  # noqa: E402
+
+
+def clustered(rng, count, clusters=50, dim=64):
+    """Unit vectors around random cluster centers, plus their cluster ids"""
+    centers = normalize_rows(rng.standard_normal((clusters, dim)))
+    ids = rng.integers(0, clusters, count)
+    return normalize_rows(centers[ids] + rng.standard_normal((count, dim)) * 0.05), centers
+
+
+def test_exact_search_after_updates():
+    """Exact search ranks the live vectors like a brute-force scan"""
+    rng = np.random.default_rng(0)
+    vectors, _ = clustered(rng, 3000)
+    index = VectorIndex()
+    for start in range(0, len(vectors), 700):
+        index.add(range(start, min(start + 700, len(vectors))), vectors[start:start + 700],
+                  [{'n': n} for n in range(start, min(start + 700, len(vectors)))])
+
+    # Replace some vectors and remove others; the rows must stay consistent
+    replaced = rng.standard_normal((10, vectors.shape[1]))
+    index.add(range(10), replaced, [{'n': n} for n in range(10)])
+    vectors[:10] = normalize_rows(replaced)
+    removed = set(range(5, 3000, 7))
+    index.remove(removed)
+    live = np.array(sorted(set(range(len(vectors))) - removed))
+    assert len(index) == len(live)
+    assert sorted(index.keys()) == live.tolist()
+
+    for query in vectors[rng.integers(0, len(vectors), 20)]:
+        expected = live[np.argsort(-(vectors[live] @ query), kind='stable')[:10]]
+        results = index.search(query, 10, exact=True)
+        assert [key for _, key, _ in results] == expected.tolist()
+        assert all(payload == {'n': key} for _, key, payload in results)
+        assert abs(results[0][0] - float(vectors[expected[0]] @ query)) < 1e-5
+
+
+def test_ivf_lists_follow_updates():
+    """Every row stays in exactly one IVF list, and IVF finds the exact best matches"""
+    rng = np.random.default_rng(1)
+    vectors, centers = clustered(rng, 5000)
+    index = VectorIndex(ivf_min_vectors=1000, nprobe=8)
+    index.add(range(4000), vectors[:4000])
+    index.train()
+    index.add(range(4000, 5000), vectors[4000:])  # assigned to their nearest lists
+    index.remove(range(0, 5000, 3))
+    assert sorted(row for rows in index._lists for row in rows) == list(range(len(index)))
+
+    queries = normalize_rows(centers + rng.standard_normal(centers.shape) * 0.05)
+    for query in queries:
+        approximate = index.search(query, 5)
+        exact = index.search(query, 5, exact=True)
+        assert approximate[0][1] == exact[0][1]
+    assert index.stats()['ivf_searches'] == len(queries)
+
+
+def test_catalog_index_embeds_only_changes():
+    """A sync embeds added keys, drops removed ones and refreshes payloads, and only when the version moves"""
+    rng = np.random.default_rng(2)
+    vectors = {f'photo{n}.jpg': rng.standard_normal(16) for n in range(6)}
+    catalog = {key: {'checkpoint': n} for n, key in enumerate(list(vectors)[:4])}
+    version = [1]
+    embedded = []
+
+    def embed(keys):
+        embedded.append(sorted(keys))
+        return list(keys), np.stack([vectors[key] for key in keys])
+
+    index = CatalogVectorIndex(lambda: version[0], lambda: dict(catalog), embed, VectorIndex())
+    assert not index.synced
+    index.sync()
+    assert index.synced and embedded == [sorted(catalog)]
+
+    catalog.pop('photo0.jpg')
+    catalog['photo4.jpg'] = {'checkpoint': 4}
+    catalog['photo1.jpg'] = {'checkpoint': 'renamed'}
+    index.search(vectors['photo4.jpg'])
+    assert len(embedded) == 1, "Synced although the version didn't move"
+
+    version[0] = 2
+    best = index.search(vectors['photo4.jpg'], k=1)[0]
+    assert best[1] == 'photo4.jpg' and best[2] == {'checkpoint': 4}
+    assert embedded[1:] == [['photo4.jpg']]
+    assert sorted(index.index.keys()) == sorted(catalog)
+    assert index.search(vectors['photo1.jpg'], k=1)[0][2] == {'checkpoint': 'renamed'}
+    assert index.stats()['syncs'] == 2
+
+
+if __name__ == "__main__":
+    try:
+        test_exact_search_after_updates()
+        print("✅ Exact search matches brute force after updates")
+        test_ivf_lists_follow_updates()
+        print("✅ IVF lists follow updates")
+        test_catalog_index_embeds_only_changes()
+        print("✅ The catalog index embeds only what changed")
+        print("\n🎉 Vector index tests completed successfully!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n💥 Vector index test failed: {e}")
+        sys.exit(1)